@@ -1,6 +1,8 @@
 import matplotlib.pyplot as plt
 import numpy as np
 
+from evolution.run_log import is_run_log, read_run_log
+
 
 def log_to_data(file_path):
     """
@@ -22,29 +24,57 @@ def log_to_data(file_path):
     return scores
 
 
+def generation_stats(gen_scores):
+    """
+    Calculates the statistics of a generation which are shown in the graph
+    :param gen_scores: The games of each individual in the generation, either as a list of lists (from log_to_data())
+    or as an array padded with NaN (from evolution.run_log.read_run_log())
+    :return: The mean of all the games, the best individual's fitness and the best game
+    """
+    if isinstance(gen_scores, np.ndarray):
+        return np.nanmean(gen_scores), np.nanmax(np.nanmean(gen_scores, axis=1)), np.nanmax(gen_scores)
+    # Individuals may have played a different number of games (see EvolutionEnv.race()), so all the games of the
+    # generation are averaged together
+    return (np.mean([game for indv in gen_scores for game in indv]), max([np.mean(indv) for indv in gen_scores]),
+            max([max(indv) for indv in gen_scores]))
+
+
+def run_log_scores(file_path):
+    """
+    Reads the scores of a binary run log one generation at a time
+    :param file_path: The path to the binary run log
+    :return: An iterable of the generations' score arrays
+    """
+    for _, _, scores in read_run_log(file_path):
+        yield scores
+
+
 def generate_graph_from_scores(scores, yticks_distance=4000, increase_ylim=False):
     """
     A function which takes the list created from log_to_data() and generates a graph of the mean fitness, the best
     individual's fitness, and the best game as a function of the generations
-    :param scores: The list of lists of lists from log_to_data()
+    :param scores: The list of lists of lists from log_to_data(), or any iterable of generations (like
+    run_log_scores()), which is only iterated once, so the whole run is never held in memory
     :param yticks_distance: The distance between each y-axis tick (starts at 0)
     :param increase_ylim: Sometimes plt cuts the ticks too short with the current implementation. If it is set to True,
     it will add another tick above the last one plt placed
     """
-    mean_score_per_gen = [np.mean(gen_scores) for gen_scores in scores]
+    mean_score_per_gen = []
     max_score_per_gen = []
     best_game_per_gen = []
 
     for gen in scores:
-        max_score_per_gen.append(max([np.mean(indv) for indv in gen]))
-        best_game_per_gen.append(max([max(indv) for indv in gen]))
-    xs = list(range(len(scores)))
+        mean_score, max_score, best_game = generation_stats(gen)
+        mean_score_per_gen.append(mean_score)
+        max_score_per_gen.append(max_score)
+        best_game_per_gen.append(best_game)
+    xs = list(range(len(mean_score_per_gen)))
     plt.plot(xs, mean_score_per_gen)
     plt.plot(xs, max_score_per_gen)
     plt.plot(xs, best_game_per_gen)
     plt.yticks(
         list(range(0, int(max(list(plt.yticks()[0]))) + (yticks_distance if increase_ylim else 0), yticks_distance)))
-    plt.xticks(list(plt.xticks()[0]) + [len(scores) - 1])
+    plt.xticks(list(plt.xticks()[0]) + [len(xs) - 1])
     plt.axis([0, len(xs) - 1, 0, int(max(list(plt.yticks()[0])))])
     plt.grid()
     plt.xlabel('Generations')
@@ -56,9 +86,10 @@ def generate_graph_from_scores(scores, yticks_distance=4000, increase_ylim=False
 def generate_graph(file_path, yticks_distance, increase_ylim=False):
     """
     An interface for easy access to the other functions
-    :param file_path: The path to the log file
+    :param file_path: The path to the log file (a text log or a binary run log)
     :param yticks_distance: The distance between each y-axis tick (starts at 0)
     :param increase_ylim: Sometimes plt cuts the ticks too short with the current implementation. If it is set to True,
     it will add another tick above the last one plt placed.
     """
-    generate_graph_from_scores(log_to_data(file_path), yticks_distance, increase_ylim)
+    scores = run_log_scores(file_path) if is_run_log(file_path) else log_to_data(file_path)
+    generate_graph_from_scores(scores, yticks_distance, increase_ylim)
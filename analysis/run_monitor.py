@@ -0,0 +1,276 @@
+import io
+import math
+import struct
+import time
+
+import matplotlib.pyplot as plt
+
+from evolution.run_log import (GENERATION, GENERATION_RECORD, GENOME_RECORD, HEADER, MAGIC, NUM_GAMES, TELEMETRY_LENGTH,
+                               TELEMETRY_RECORD, read_header)
+
+
+class QuantileSketch:
+    """
+    Estimates quantiles of a stream of non-negative values in bounded memory. Values are counted in buckets whose
+    bounds grow geometrically, so every estimate is within relative_accuracy of a value at the right rank
+    """
+    def __init__(self, relative_accuracy=0.01):
+        """
+        :param relative_accuracy: The maximum relative error of an estimate
+        """
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if value <= 0:
+            self.zeros += 1
+            return
+        index = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def quantile(self, q):
+        """
+        :param q: The quantile, in range [0,1]
+        :return: The estimated value, or None if no values were added
+        """
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                # The middle of the bucket, in relative terms
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class GenerationStats:
+    """
+    Running statistics of a single generation, updated one game at a time
+    """
+    def __init__(self, generation, relative_accuracy=0.01):
+        """
+        :param generation: The generation number
+        :param relative_accuracy: The relative accuracy of the percentiles
+        """
+        self.generation = generation
+        self.individuals = 0
+        self.num_games = 0
+        self.total = 0
+        self.max_game = - math.inf
+        self.best_fitness = - math.inf
+        self.sketch = QuantileSketch(relative_accuracy)
+        # The games of the last individual, whose games may still be coming
+        self.individual_total = 0
+        self.individual_games = 0
+
+    def start_individual(self):
+        self.end_individual()
+        self.individuals += 1
+
+    def end_individual(self):
+        if self.individual_games > 0:
+            self.best_fitness = max(self.best_fitness, self.individual_total / self.individual_games)
+        self.individual_total = 0
+        self.individual_games = 0
+
+    def add_game(self, score):
+        self.num_games += 1
+        self.total += score
+        self.max_game = max(self.max_game, score)
+        self.sketch.add(score)
+        self.individual_total += score
+        self.individual_games += 1
+
+    @property
+    def mean(self):
+        return self.total / self.num_games if self.num_games else math.nan
+
+    @property
+    def max_fitness(self):
+        """
+        :return: The best individual's fitness, including the individual whose games may still be coming
+        """
+        if self.individual_games > 0:
+            return max(self.best_fitness, self.individual_total / self.individual_games)
+        return self.best_fitness
+
+    def percentile(self, p):
+        """
+        :param p: The percentile, in range [0,100]
+        :return: The estimated percentile of the generation's games
+        """
+        return self.sketch.quantile(p / 100)
+
+
+class RunMonitor:
+    """
+    Follows a run's log (text or binary) while it is being written. Every update only reads what was added to the log
+    since the previous one, and adds it to the running statistics of its generations
+    """
+    def __init__(self, file_path, relative_accuracy=0.01):
+        """
+        :param file_path: The path to the log file
+        :param relative_accuracy: The relative accuracy of the percentiles
+        """
+        self.file_path = file_path
+        self.relative_accuracy = relative_accuracy
+        self.offset = 0
+        self.binary = None
+        self.genome_size = 0
+        # Data at the end of the log which is not a complete line or record yet
+        self.remainder = b''
+        self.generations = []
+        # The best individual's fitness up to each generation
+        self.best_so_far = []
+
+    def update(self):
+        """
+        Reads what was added to the log since the last update
+        :return: The statistics of the generations which changed
+        """
+        with open(self.file_path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        if not data:
+            return []
+        self.offset += len(data)
+        data = self.remainder + data
+        if self.binary is None:
+            if len(data) < HEADER.size:
+                self.remainder = data
+                return []
+            self.binary = data.startswith(MAGIC)
+            if self.binary:
+                self.genome_size = 8 * read_header(io.BytesIO(data[:HEADER.size]))[1]
+                data = data[HEADER.size:]
+        changed_from = len(self.generations)
+        if self.generations:
+            changed_from -= 1
+        if self.binary:
+            self.remainder = self.read_records(data)
+        else:
+            self.remainder = self.read_lines(data)
+        del self.best_so_far[changed_from:]
+        for stats in self.generations[changed_from:]:
+            previous = self.best_so_far[-1] if self.best_so_far else - math.inf
+            self.best_so_far.append(max(previous, stats.max_fitness))
+        return self.generations[changed_from:]
+
+    def read_lines(self, data):
+        """
+        Adds the complete lines of a text log to the statistics
+        :param data: The new data
+        :return: The data after the last complete line
+        """
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].decode().splitlines():
+            if line.startswith('T') and self.generations:
+                self.generations[-1].add_game(int(line.split(':')[1].strip()))
+            elif line.startswith('G:') and self.generations:
+                self.generations[-1].start_individual()
+            elif line.startswith('Generation'):
+                self.start_generation(int(line.split()[1]))
+        return data[end:]
+
+    def read_records(self, data):
+        """
+        Adds the complete records of a binary log to the statistics
+        :param data: The new data
+        :return: The data after the last complete record
+        """
+        position = 0
+        while position < len(data):
+            record_type = data[position:position + 1]
+            if record_type == GENERATION_RECORD:
+                end = position + 1 + GENERATION.size
+                if end > len(data):
+                    break
+                self.start_generation(GENERATION.unpack_from(data, position + 1)[0])
+            elif record_type == GENOME_RECORD:
+                if position + 1 + NUM_GAMES.size > len(data):
+                    break
+                num_games = NUM_GAMES.unpack_from(data, position + 1)[0]
+                scores_start = position + 1 + NUM_GAMES.size + self.genome_size
+                end = scores_start + 4 * num_games
+                if end > len(data):
+                    break
+                if self.generations:
+                    stats = self.generations[-1]
+                    stats.start_individual()
+                    for game_score in struct.unpack_from(f'<{num_games}i', data, scores_start):
+                        stats.add_game(game_score)
+            elif record_type == TELEMETRY_RECORD:
+                if position + 1 + TELEMETRY_LENGTH.size > len(data):
+                    break
+                end = position + 1 + TELEMETRY_LENGTH.size + TELEMETRY_LENGTH.unpack_from(data, position + 1)[0]
+                if end > len(data):
+                    break
+            else:
+                raise ValueError(f'Unknown record in {self.file_path}')
+            position = end
+        return data[position:]
+
+    def start_generation(self, generation):
+        if self.generations:
+            self.generations[-1].end_individual()
+        self.generations.append(GenerationStats(generation, self.relative_accuracy))
+
+    def summary(self, index, percentiles=(50, 90, 99)):
+        """
+        :param index: The position of the generation in generations
+        :param percentiles: The percentiles of the games to show
+        :return: A line which summarizes the generation
+        """
+        stats = self.generations[index]
+        best_so_far = self.best_so_far[index]
+        line = (f'Generation {stats.generation}: {stats.individuals} individuals, {stats.num_games} games, '
+                f'mean {stats.mean:.2f}, best individual {stats.max_fitness:.2f} (best so far {best_so_far:.2f}), '
+                f'best game {stats.max_game}')
+        if stats.num_games:
+            line += ', ' + ', '.join(f'p{p} {stats.percentile(p):.0f}' for p in percentiles)
+        return line
+
+    def watch(self, interval=10, with_plot=True, percentiles=(50, 90, 99)):
+        """
+        Prints the generations which changed, and updates the graph, every few seconds until interrupted
+        :param interval: Number of seconds between updates
+        :param with_plot: Should the graph of plot_generation.generate_graph() be shown and updated?
+        :param percentiles: The percentiles of the games to show
+        """
+        if with_plot:
+            plt.ion()
+            _, ax = plt.subplots()
+            lines = [ax.plot([], [])[0] for _ in range(3)]
+            ax.grid()
+            ax.set_xlabel('Generations')
+            ax.set_ylabel('Tetrominoes Dropped')
+            ax.legend(lines, ['Avg. of all games', 'Avg. of best individual', 'Best game played'])
+            series = [[], [], []]
+        try:
+            while True:
+                changed = self.update()
+                first = len(self.generations) - len(changed)
+                for index in range(first, len(self.generations)):
+                    print(self.summary(index, percentiles))
+                if with_plot and changed:
+                    # Only the generations which changed are recalculated
+                    for values, key in zip(series, ('mean', 'max_fitness', 'max_game')):
+                        del values[first:]
+                        values.extend(getattr(stats, key) for stats in changed)
+                    xs = list(range(len(self.generations)))
+                    for line, values in zip(lines, series):
+                        line.set_data(xs, values)
+                    ax.relim()
+                    ax.autoscale_view()
+                    plt.pause(0.01)
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
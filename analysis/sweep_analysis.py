@@ -0,0 +1,103 @@
+import json
+from collections import defaultdict
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from evolution.sweep import SweepDatabase
+
+METRICS = ('mean_fitness', 'max_fitness', 'min_fitness', 'std_fitness', 'seconds')
+
+
+def check_metric(metric):
+    if metric not in METRICS:
+        raise ValueError(f'Unknown metric: {metric}')
+
+
+def final_results(db, sweep=None):
+    """
+    :param db: A SweepDatabase
+    :param sweep: The name of the sweep, or None for the runs of all the sweeps
+    :return: A list with a dictionary for every finished run: its ID, its configuration, and the summary of its last
+    generation
+    """
+    rows = db.query('''
+        SELECT runs.run_id, runs.config, generations.*
+        FROM runs JOIN generations ON generations.run_id = runs.run_id
+        WHERE runs.status = 'finished' AND (? IS NULL OR runs.sweep = ?)
+          AND generations.generation = (SELECT MAX(generation) FROM generations WHERE run_id = runs.run_id)
+        ORDER BY generations.max_fitness DESC
+    ''', (sweep, sweep))
+    for row in rows:
+        row['config'] = json.loads(row['config'])
+        row['best_genome'] = json.loads(row['best_genome'])
+    return rows
+
+
+def param_effect(db, param, metric='max_fitness', sweep=None):
+    """
+    Compares the finished runs by the value of one of their keyword arguments
+    :param db: A SweepDatabase
+    :param param: The name of the keyword argument
+    :param metric: The column of the last generation's summary which is compared
+    :param sweep: The name of the sweep, or None for the runs of all the sweeps
+    :return: A dictionary from each value of the argument to the number of runs with it, and the mean and the standard
+    deviation of their metric
+    """
+    check_metric(metric)
+    rows = db.query(f'''
+        SELECT json_extract(runs.config, ?) AS value, generations.{metric} AS metric
+        FROM runs JOIN generations ON generations.run_id = runs.run_id
+        WHERE runs.status = 'finished' AND (? IS NULL OR runs.sweep = ?)
+          AND generations.generation = (SELECT MAX(generation) FROM generations WHERE run_id = runs.run_id)
+    ''', (f'$.{param}', sweep, sweep))
+    values = defaultdict(list)
+    for row in rows:
+        values[row['value']].append(row['metric'])
+    return {value: {'runs': len(metrics), 'mean': float(np.mean(metrics)), 'std': float(np.std(metrics))}
+            for value, metrics in sorted(values.items(), key=lambda item: str(item[0]))}
+
+
+def generation_curves(db, param, metric='max_fitness', sweep=None):
+    """
+    :param db: A SweepDatabase
+    :param param: The name of the keyword argument the runs are grouped by
+    :param metric: The column of the generations' summaries
+    :param sweep: The name of the sweep, or None for the runs of all the sweeps
+    :return: A dictionary from each value of the argument to a list of (generation, mean of the metric over the runs
+    with the value) tuples. Runs which did not finish are included, up to their last generation
+    """
+    check_metric(metric)
+    rows = db.query(f'''
+        SELECT json_extract(runs.config, ?) AS value, generations.generation, AVG(generations.{metric}) AS metric
+        FROM runs JOIN generations ON generations.run_id = runs.run_id
+        WHERE ? IS NULL OR runs.sweep = ?
+        GROUP BY value, generations.generation
+        ORDER BY generations.generation
+    ''', (f'$.{param}', sweep, sweep))
+    curves = defaultdict(list)
+    for row in rows:
+        curves[row['value']].append((row['generation'], row['metric']))
+    return dict(curves)
+
+
+def plot_sweep(db_path, param, metric='max_fitness', sweep=None):
+    """
+    Plots the metric of every generation, averaged over the runs with each value of a keyword argument
+    :param db_path: The sweep's database
+    :param param: The name of the keyword argument
+    :param metric: The column of the generations' summaries
+    :param sweep: The name of the sweep, or None for the runs of all the sweeps
+    """
+    db = SweepDatabase(db_path)
+    try:
+        curves = generation_curves(db, param, metric, sweep)
+    finally:
+        db.close()
+    for value, curve in sorted(curves.items(), key=lambda item: str(item[0])):
+        generations, metrics = zip(*curve)
+        plt.plot(generations, metrics, label=f'{param}={value}')
+    plt.xlabel('Generation')
+    plt.ylabel(metric)
+    plt.legend()
+    plt.show()
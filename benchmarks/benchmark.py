@@ -0,0 +1,310 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import time
+
+from bot.tetris_bot import ENGINES, TetrisBot
+from evolution.evolution import EvolutionEnv
+from evolution.parallel_evolution import ParallelEvolutionEnv
+from tetris_env.piece_sequence import PieceSequence
+
+# A genome which survives long enough to reach mid-game boards on every board size. It is used for every benchmark, so
+# the same boards and games are measured in every run
+BENCHMARK_GENOME = [-2, -1, -1, -15, -2, -1, -1]
+BENCHMARK_SEED = 1234
+# The results --baseline compares to when it is given without a file. They were measured on the machine recorded in the
+# file, so on other machines a new baseline should be written with --output first
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def measure(func, repeat=5):
+    """
+    Runs a function several times
+    :param func: A function without arguments
+    :param repeat: Number of runs
+    :return: The time (in seconds) of each run
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def rate(count, durations):
+    """
+    :param count: Number of operations of each run
+    :param durations: The time (in seconds) of each run
+    :return: The rate of the fastest run, which is the least affected by other processes, and the spread of the runs:
+    how much slower the median run is than the fastest one, relative to the median (None for fewer than 3 runs, whose
+    spread cannot be estimated)
+    """
+    best = min(durations)
+    if len(durations) < 3:
+        return count / best, None
+    median = statistics.median(durations)
+    return count / best, (median - best) / median
+
+
+def mid_game_boards(height, width, engine, first_piece=10, last_piece=40):
+    """
+    Plays a seeded game and keeps its boards along the way
+    :param height: The board's height
+    :param width: The board's width
+    :param engine: The game engine (one of ENGINES' keys)
+    :param first_piece: The first piece after which the board is kept
+    :param last_piece: The last piece after which the board is kept
+    :return: A list of (board, current piece ID, next piece ID) tuples, where the pieces are the ones played next
+    """
+    bot = TetrisBot(height, width, BENCHMARK_GENOME, engine=engine, incremental_features=False)
+    pieces = PieceSequence(BENCHMARK_SEED)
+    board = bot.engine.create_board(height, width)
+    curr_pid = pieces.next_piece()
+    next_pid = pieces.next_piece()
+    boards = []
+    for i in range(last_piece):
+        board, _ = bot.find_best_move_lookahead(board, curr_pid, next_pid)
+        if board is None:
+            break
+        curr_pid = next_pid
+        next_pid = pieces.next_piece()
+        if i + 1 >= first_piece:
+            boards.append((board, curr_pid, next_pid))
+    return boards
+
+
+def fill_line(board, line):
+    """
+    Fills the empty squares of a line, so the next call to update_lines() clears it
+    :param board: The game board (of any engine)
+    :param line: The line number
+    """
+    if hasattr(board, 'rows'):
+        board.rows[line] = board.full_row
+        return
+    level = len(board) - line
+    for col in range(len(board[line])):
+        if board[line][col] == 0:
+            board[line][col] = 1
+            board.heights[col] = max(board.heights[col], level)
+
+
+def micro_benchmarks(height, width, engine_name, repeat):
+    """
+    Measures the engine's basic operations on mid-game boards
+    :return: A dictionary of results, as (operations per second, spread) tuples (see rate())
+    """
+    engine, extract_features = ENGINES[engine_name]
+    boards = [board for board, _, _ in mid_game_boards(height, width, engine_name)]
+    bot = TetrisBot(height, width, BENCHMARK_GENOME, engine=engine_name)
+    # Every drop of every piece, on every board
+    drops = [(board, piece, col_offset) for board in boards for pid in range(bot.pf.num_pieces)
+             for piece, offset_limit in bot.pf.get_rotations_and_offset_limit(pid)
+             for col_offset in range(offset_limit + 1)]
+    results = {}
+
+    def time_drops():
+        copies = [engine.copy_board(board) for board, _, _ in drops]
+        start = time.perf_counter()
+        for copy, (_, piece, col_offset) in zip(copies, drops):
+            engine.drop_piece(piece, col_offset, copy)
+        return time.perf_counter() - start
+
+    results['drop_piece'] = rate(len(drops), [time_drops() for _ in range(repeat)])
+    results['copy_board'] = rate(len(boards) * 100, measure(
+        lambda: [engine.copy_board(board) for board in boards * 100], repeat))
+
+    bottom_lines = list(range(len(boards[0]) - 4, len(boards[0])))
+
+    def time_update_lines():
+        copies = [engine.copy_board(board) for board in boards]
+        for copy in copies:
+            fill_line(copy, bottom_lines[-1])
+        start = time.perf_counter()
+        for copy in copies:
+            engine.update_lines(bottom_lines, copy)
+        return time.perf_counter() - start
+
+    results['update_lines'] = rate(len(boards), [time_update_lines() for _ in range(repeat)])
+    results['extract_features'] = rate(len(boards) * 10, measure(
+        lambda: [extract_features(board) for board in boards * 10], repeat))
+    return results
+
+
+def macro_benchmarks(height, width, engine_name, repeat, max_pieces=500):
+    """
+    Measures the bot's moves and games
+    :return: A dictionary of results, as (pieces per second, spread) tuples (see rate())
+    """
+    boards = mid_game_boards(height, width, engine_name)
+    bot = TetrisBot(height, width, BENCHMARK_GENOME, engine=engine_name)
+    results = {
+        'find_best_move': rate(len(boards), measure(
+            lambda: [bot.find_best_move(board, cpid) for board, cpid, _ in boards], repeat)),
+        'find_best_move_lookahead': rate(len(boards), measure(
+            lambda: [bot.find_best_move_lookahead(board, cpid, npid) for board, cpid, npid in boards], repeat))
+    }
+    pieces_played = 0
+
+    def play_games():
+        nonlocal pieces_played
+        pieces_played = sum(bot.play_game(max_pieces=max_pieces, pieces=PieceSequence(BENCHMARK_SEED + i))
+                            for i in range(3))
+
+    durations = measure(play_games, max(1, repeat // 2))
+    results['play_game'] = rate(pieces_played, durations)
+    return results
+
+
+def end_to_end_benchmarks(height, width, cores, pop_size=20, games_per_fitness=2, max_pieces=300):
+    """
+    Measures the games of a single generation of a seeded run, serially and with several numbers of cores. The games
+    are played through EvolutionEnv.play_games(), same as calc_pop_fitness() plays them, but they are limited to
+    max_pieces so a good random genome cannot make the measurement take arbitrarily long
+    :param cores: The numbers of cores of the parallel runs
+    :return: A dictionary of results, as (pieces per second, spread) tuples (see rate()). Each generation is played
+    once, so the spread is unknown
+    """
+    settings = {'pop_size': pop_size, 'games_per_fitness': games_per_fitness, 'board_height': height,
+                'board_width': width, 'with_logging': False, 'with_printing': False, 'seed': BENCHMARK_SEED}
+    envs = {'serial': EvolutionEnv(**settings)}
+    for num_cores in cores:
+        envs[f'parallel_{num_cores}'] = ParallelEvolutionEnv(num_cores=num_cores, **settings)
+    results = {}
+    for name, env in envs.items():
+        games = [(i, j, env.population[i], max_pieces, env.game_seed(i, j)) for i in range(pop_size)
+                 for j in range(games_per_fitness)]
+        pieces_played = 0
+
+        def play_generation():
+            nonlocal pieces_played
+            pieces_played = sum(game_score for _, _, game_score in env.play_games(games))
+
+        is_parallel = isinstance(env, ParallelEvolutionEnv)
+        try:
+            # The pool is started before the measurement, since it is started once per run
+            if is_parallel:
+                env.get_pool()
+            durations = measure(play_generation, 1)
+            results[name] = rate(pieces_played, durations)
+        finally:
+            if is_parallel:
+                env.close_pool()
+    return results
+
+
+def run_benchmarks(board_sizes=((12, 6), (20, 10)), engines=('list', 'bitboard'), cores=None, repeat=5,
+                   with_end_to_end=True):
+    """
+    Runs the whole suite
+    :param board_sizes: The (height, width) of the boards to measure
+    :param engines: The game engines to measure
+    :param cores: The numbers of cores of the parallel end-to-end runs. If it is None, powers of 2 up to the number of
+    cores are used
+    :param repeat: Number of times each measurement is repeated (the best one is kept)
+    :param with_end_to_end: Should the end-to-end benchmarks run?
+    :return: A dictionary from the name of each result to its value, unit and spread (see rate())
+    """
+    if cores is None:
+        cpu_count = multiprocessing.cpu_count()
+        cores = [2 ** i for i in range(cpu_count.bit_length()) if 2 ** i <= cpu_count]
+    results = {}
+    for height, width in board_sizes:
+        size = f'{height}x{width}'
+        for engine in engines:
+            for name, (value, spread) in micro_benchmarks(height, width, engine, repeat).items():
+                results[f'micro/{name}/{engine}/{size}'] = {'value': value, 'unit': 'ops/s', 'spread': spread}
+            for name, (value, spread) in macro_benchmarks(height, width, engine, repeat).items():
+                results[f'macro/{name}/{engine}/{size}'] = {'value': value, 'unit': 'pieces/s', 'spread': spread}
+        if with_end_to_end:
+            for name, (value, spread) in end_to_end_benchmarks(height, width, cores).items():
+                results[f'e2e/{name}/{size}'] = {'value': value, 'unit': 'pieces/s', 'spread': spread}
+    return results
+
+
+def allowed_slowdown(result, baseline_result, spread_factor=3, min_tolerance=0.05):
+    """
+    :param result: A result of run_benchmarks()
+    :param baseline_result: The same result in a previous run
+    :param spread_factor: How many times the measurements' spreads the result may be slower than the baseline
+    :param min_tolerance: The smallest relative slowdown which is considered a regression
+    :return: The relative slowdown which is still within the measurements' noise, or None if the spread of either
+    measurement is unknown (so the noise cannot be told apart from a regression)
+    """
+    if result.get('spread') is None or baseline_result.get('spread') is None:
+        return None
+    return max(min_tolerance, spread_factor * (result['spread'] + baseline_result['spread']))
+
+
+def compare_to_baseline(results, baseline, spread_factor=3, min_tolerance=0.05):
+    """
+    Compares the results to a baseline. All the results are rates, so higher is better. A result is a regression when
+    it is slower than the baseline by more than the noise of the two measurements (see allowed_slowdown())
+    :param results: The results of run_benchmarks()
+    :param baseline: The results of a previous run
+    :param spread_factor: See allowed_slowdown()
+    :param min_tolerance: See allowed_slowdown()
+    :return: A list of (name, result, baseline result, allowed slowdown) tuples of the regressions
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        tolerance = allowed_slowdown(result, baseline[name], spread_factor, min_tolerance)
+        if tolerance is not None and result['value'] < baseline[name]['value'] * (1 - tolerance):
+            regressions.append((name, result['value'], baseline[name]['value'], tolerance))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the engines, the bot and the evolution')
+    parser.add_argument('--sizes', nargs='+', default=['12x6', '20x10'], help='Board sizes, as HEIGHTxWIDTH')
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=list(ENGINES))
+    parser.add_argument('--cores', nargs='+', type=int, help='Numbers of cores of the end-to-end parallel runs')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-e2e', action='store_true', help='Skip the end-to-end benchmarks')
+    parser.add_argument('--output', help='A JSON file to write the results to')
+    parser.add_argument('--baseline', nargs='?', const=DEFAULT_BASELINE,
+                        help='A JSON file of a previous run to compare to (the committed baseline if no file is given)')
+    parser.add_argument('--spread-factor', type=float, default=3,
+                        help="How many times the measurements' spreads a result may be slower than the baseline")
+    parser.add_argument('--min-tolerance', type=float, default=0.05,
+                        help='The smallest relative slowdown which is considered a regression')
+    args = parser.parse_args()
+
+    board_sizes = [tuple(int(n) for n in size.split('x')) for size in args.sizes]
+    results = run_benchmarks(board_sizes, args.engines, args.cores, args.repeat, not args.no_e2e)
+    baseline = None
+    same_machine = False
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline_run = json.load(f)
+        baseline = baseline_run['results']
+        same_machine = baseline_run.get('machine') == platform.platform()
+        if not same_machine:
+            print(f'Warning: the baseline was measured on {baseline_run.get("machine")}, not on this machine, so the '
+                  f'regressions are only reported')
+    for name, result in results.items():
+        line = f'{name:50} {result["value"]:14.1f} {result["unit"]}'
+        if baseline is not None and name in baseline:
+            line += f'  ({result["value"] / baseline[name]["value"]:.2f}x baseline)'
+        print(line)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version, 'machine': platform.platform(), 'cpu_count': multiprocessing.cpu_count(),
+                       'results': results}, f, indent=2)
+    if baseline is not None:
+        regressions = compare_to_baseline(results, baseline, args.spread_factor, args.min_tolerance)
+        for name, value, baseline_value, tolerance in regressions:
+            print(f'Regression: {name} {value:.1f} < {baseline_value:.1f} (more than {tolerance:.0%} slower)')
+        if regressions and same_machine:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
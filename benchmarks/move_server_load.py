@@ -0,0 +1,118 @@
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from benchmarks.benchmark import BENCHMARK_GENOME, mid_game_boards
+from bot.move_server import MoveClient, MoveServer
+
+
+def request_boards(height, width):
+    """
+    :param height: The board's height
+    :param width: The board's width
+    :return: A list of (visible rows, current piece ID, next piece ID) tuples of mid-game boards, for the requests
+    """
+    return [([list(row) for row in board[4:]], curr_pid, next_pid)
+            for board, curr_pid, next_pid in mid_game_boards(height, width, 'list')]
+
+
+async def client_load(host, port, genome_id, boards, num_requests, concurrency, with_lookahead, latencies):
+    """
+    Sends requests over a single connection, keeping a fixed number of them in flight
+    :param host: The server's host
+    :param port: The server's port
+    :param genome_id: The ID of the genome the moves are requested from
+    :param boards: The boards from request_boards(), which are requested in turns
+    :param num_requests: Number of requests to send
+    :param concurrency: Number of requests in flight at any moment
+    :param with_lookahead: Should the next piece be sent?
+    :param latencies: A list the round-trip time (in seconds) of every request is added to
+    """
+    client = MoveClient()
+    await client.connect(host, port)
+    sent = iter(range(num_requests))
+
+    async def send_requests():
+        for n in sent:
+            rows, curr_pid, next_pid = boards[n % len(boards)]
+            start = time.perf_counter()
+            await client.best_move(genome_id, rows, curr_pid, next_pid if with_lookahead else None)
+            latencies.append(time.perf_counter() - start)
+
+    try:
+        await asyncio.gather(*(send_requests() for _ in range(concurrency)))
+    finally:
+        await client.close()
+
+
+async def run_load(host, port, genome_id, boards, connections, requests_per_connection, concurrency,
+                   with_lookahead=True):
+    """
+    Runs many connections to a move server at once
+    :param host: The server's host
+    :param port: The server's port
+    :param genome_id: The ID of the genome the moves are requested from
+    :param boards: The boards from request_boards()
+    :param connections: Number of connections
+    :param requests_per_connection: Number of requests to send on each connection
+    :param concurrency: Number of requests in flight on each connection
+    :param with_lookahead: Should the next piece be sent?
+    :return: A dictionary with the throughput (requests per second) and the client-side latency percentiles (in
+    milliseconds), and the server's statistics
+    """
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client_load(host, port, genome_id, boards, requests_per_connection, concurrency,
+                                       with_lookahead, latencies) for _ in range(connections)))
+    seconds = time.perf_counter() - start
+    p50, p99, p999 = np.percentile(latencies, [50, 99, 99.9]) * 1000
+    client = MoveClient()
+    await client.connect(host, port)
+    server_stats = await client.stats()
+    await client.close()
+    return {'requests': len(latencies), 'requests_per_second': len(latencies) / seconds, 'p50_ms': p50,
+            'p99_ms': p99, 'p999_ms': p999, 'max_ms': max(latencies) * 1000, 'server': server_stats}
+
+
+async def main_async(args):
+    height, width = (int(n) for n in args.size.split('x'))
+    boards = request_boards(height, width)
+    server = None
+    genome_id = args.genome
+    if args.local:
+        # The server runs in the same process and event loop as the clients, with the benchmark genome
+        genome_id = 'benchmark'
+        server = MoveServer({genome_id: BENCHMARK_GENOME}, args.host, args.port, engine=args.engine,
+                            max_batch=args.max_batch, batch_window=args.batch_window)
+        await server.start()
+    try:
+        return await run_load(args.host, args.port, genome_id, boards, args.connections, args.requests,
+                              args.concurrency, not args.no_lookahead)
+    finally:
+        if server is not None:
+            await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load generator for the move server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=47600)
+    parser.add_argument('--genome', default='0', help='The ID of the genome to request moves from')
+    parser.add_argument('--local', action='store_true', help='Start a server with the benchmark genome in-process')
+    parser.add_argument('--engine', default='list', help='The engine of the local server')
+    parser.add_argument('--max-batch', type=int, default=64, help='The maximal batch of the local server')
+    parser.add_argument('--batch-window', type=float, default=0.001, help='The batch window of the local server')
+    parser.add_argument('--size', default='20x10', help='The board size, as HEIGHTxWIDTH')
+    parser.add_argument('--connections', type=int, default=16)
+    parser.add_argument('--concurrency', type=int, default=4, help='Requests in flight per connection')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per connection')
+    parser.add_argument('--no-lookahead', action='store_true', help='Do not send the next piece')
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import numpy as np
+
+
+def bitboard_rows_to_cells(rows, width):
+    """
+    Unpacks bitboard rows into squares
+    :param rows: An array of row bitmasks (any shape)
+    :param width: The board's width
+    :return: An array of booleans with an additional last axis of size width, True where the square is filled
+    """
+    return ((rows[..., None] >> np.arange(width)) & 1) > 0
+
+
+def batch_features(cells):
+    """
+    Calculates the features of many boards at once. The features are the same, and in the same order, as
+    bot.feature_extraction.extract_features()
+    :param cells: A 3D array of booleans with the shape (boards, rows, columns), True where the square is filled
+    :return: A 2D array with the shape (boards, features)
+    """
+    num_boards, board_height, board_width = cells.shape
+    # The height of a column is measured from its highest block, which is the first filled row from the top
+    has_blocks = cells.any(axis=1)
+    heights = np.where(has_blocks, board_height - cells.argmax(axis=1), 0)
+    # A hole is an empty square with a filled square somewhere above it, which means the column is covered
+    covered = np.logical_or.accumulate(cells, axis=1)
+    holes = (covered & ~cells).sum(axis=(1, 2))
+    roughness = np.abs(np.diff(heights, axis=1)).sum(axis=1)
+    height = heights.max(axis=1)
+
+    # A well is an empty square between two filled squares. The board's edges are considered filled
+    walled = np.pad(cells, ((0, 0), (0, 0), (1, 1)), constant_values=True)
+    wells = ~cells & walled[:, :, :-2] & walled[:, :, 2:]
+    cum_well = wells.sum(axis=(1, 2))
+    # The longest vertical run of wells, counted row by row
+    max_well = np.zeros(num_boards, dtype=np.int64)
+    curr_well = np.zeros((num_boards, board_width), dtype=np.int64)
+    for row in range(board_height):
+        curr_well = (curr_well + 1) * wells[:, row]
+        np.maximum(max_well, curr_well.max(axis=1), out=max_well)
+
+    return np.stack([height, heights.sum(axis=1), height - heights.min(axis=1), holes, roughness, max_well, cum_well],
+                    axis=1)
+
+
+def batch_scores(features, weights):
+    """
+    Scores many boards at once. The score of a board is the dot product of its features and the weights. The products
+    are accumulated one feature at a time, in the same order as TetrisBot.eval_board(), so the scores are exactly the
+    same as the ones it calculates
+    :param features: A 2D array with the shape (boards, features), from batch_features()
+    :param weights: The weights of the features (the genome)
+    :return: A 1D array with the score of each board
+    """
+    features = features.astype(np.float64)
+    scores = np.zeros(len(features))
+    for i in range(len(weights)):
+        scores += float(weights[i]) * features[:, i]
+    return scores
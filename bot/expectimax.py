@@ -0,0 +1,173 @@
+import math
+import time
+
+# The number of different pieces. Pieces which were not seen yet are equally likely to be any of them (see
+# PieceSequence)
+NUM_PIECES = 7
+
+
+class BudgetExceeded(Exception):
+    """
+    Raised inside the search when its time or node budget runs out, to abandon the current iteration
+    """
+
+
+class ExpectimaxSearch:
+    """
+    An iterative deepening search for the bot's moves. Depth 1 drops the current piece, depth 2 also drops the known
+    next piece, and every deeper level averages over the pieces that might come after them (expectimax). Each iteration
+    goes one level deeper, until the maximal depth is reached or the time or node budget runs out. The move of the
+    deepest iteration that finished is returned, so the first iteration always finishes regardless of the budget.
+    The boards' scores are memoized for the whole search of a move, so the deeper iterations reuse the evaluations of
+    the shallower ones, and boards which are reached in several ways are only expanded once per iteration
+    """
+    def __init__(self, bot, max_depth=3, time_budget=None, node_budget=None):
+        """
+        :param bot: The TetrisBot whose engine, pieces and weights are used. Its beam_width limits the drops which are
+        expanded at every level (by their own scores), same as in its lookahead search
+        :param max_depth: The maximal number of pieces to drop
+        :param time_budget: The maximal time (in seconds) to search for a move, None for no limit
+        :param node_budget: The maximal number of drops to try for a move, None for no limit
+        """
+        self.bot = bot
+        self.max_depth = max_depth
+        self.time_budget = time_budget
+        self.node_budget = node_budget
+        # The statistics of the last search
+        self.nodes = 0
+        self.depth = 0
+        self.deadline = None
+        self.enforce_budget = False
+        # The score of every board evaluated by the current search, and the value of every node searched by it, keyed
+        # by the board, the known pieces left to drop and the depth left
+        self.evaluations = {}
+        self.values = {}
+
+    def search(self, board, cpid, npid=None):
+        """
+        Searches for the best move. The moves are tried on a copy of the board, so the board itself is not changed
+        :param board: The game board
+        :param cpid: The current piece's ID
+        :param npid: The next piece's ID, or None if it is not known
+        :return: The best move as (rotation, column offset) (None if every move loses), its score, and the depth of
+        the iteration which found it
+        """
+        self.nodes = 0
+        self.depth = 0
+        self.deadline = time.perf_counter() + self.time_budget if self.time_budget is not None else None
+        self.enforce_budget = False
+        self.evaluations = {}
+        self.values = {}
+        board = self.bot.engine.copy_board(board)
+        known = (cpid,) if npid is None else (cpid, npid)
+        best_move, best_score = None, - math.inf
+        for depth in range(1, self.max_depth + 1):
+            try:
+                move, score = self.max_node(board, known[0], known[1:], depth)
+            except BudgetExceeded:
+                break
+            finally:
+                self.enforce_budget = True
+            if move is None and best_move is not None:
+                # Every move loses at this depth, so the move of the shallower search is still the best guess
+                break
+            best_move, best_score = move, score
+            self.depth = depth
+            if move is None:
+                break
+        return best_move, best_score, self.depth
+
+    def max_node(self, board, pid, known, depth):
+        """
+        Finds the best drop of a piece. The drops are tried on the board and taken back
+        :param board: The game board
+        :param pid: The ID of the piece to drop
+        :param known: The IDs of the known pieces which are dropped after it
+        :param depth: The number of pieces left to drop, including this one
+        :return: The best move as (rotation, column offset) (None if every move loses) and its value
+        """
+        engine = self.bot.engine
+        rotations = self.bot.pf.pieces[pid]
+        max_score = - math.inf
+        best_move = None
+        for rid, col_offset in self.candidate_moves(board, pid, depth > 1):
+            self.count_node()
+            undo = engine.apply_piece(rotations[rid], col_offset, board)
+            if undo is not None:
+                try:
+                    score = self.evaluate(board) if depth == 1 else self.node_value(board, known, depth - 1)
+                finally:
+                    engine.undo_piece(undo, board)
+                if score > max_score:
+                    max_score = score
+                    best_move = (rid, col_offset)
+        return best_move, max_score
+
+    def node_value(self, board, known, depth):
+        """
+        :param board: The game board
+        :param known: The IDs of the known pieces left to drop
+        :param depth: The number of pieces left to drop
+        :return: The value of the board: the best value of the next known piece's drops, or the average over all the
+        pieces if there are no more known pieces (-inf if some piece cannot be dropped)
+        """
+        key = (self.bot.engine.board_key(board), known, depth)
+        value = self.values.get(key)
+        if value is None:
+            if known:
+                _, value = self.max_node(board, known[0], known[1:], depth)
+            else:
+                value = sum(self.max_node(board, pid, (), depth)[1] for pid in range(NUM_PIECES)) / NUM_PIECES
+            self.values[key] = value
+        return value
+
+    def candidate_moves(self, board, pid, expand):
+        """
+        :param board: The game board
+        :param pid: The ID of the piece to drop
+        :param expand: Will the drops be expanded with more pieces? Only then are they limited by the bot's beam
+        :return: The moves to try as (rotation, column offset). With a beam, these are the beam_width drops with the
+        best scores, in the same order as without a beam
+        """
+        moves = self.bot.pf.get_moves(pid)
+        beam_width = self.bot.beam_width
+        if not expand or beam_width is None or len(moves) <= beam_width:
+            return moves
+        engine = self.bot.engine
+        scores = []
+        for rid, col_offset in moves:
+            self.count_node()
+            undo = engine.apply_piece(self.bot.pf.pieces[pid][rid], col_offset, board)
+            if undo is None:
+                scores.append(- math.inf)
+            else:
+                try:
+                    scores.append(self.evaluate(board))
+                finally:
+                    engine.undo_piece(undo, board)
+        beam = sorted(range(len(moves)), key=lambda m: scores[m], reverse=True)[:beam_width]
+        return [moves[m] for m in sorted(beam)]
+
+    def evaluate(self, board):
+        """
+        :param board: The game board
+        :return: The board's score from the bot's weights (memoized)
+        """
+        key = self.bot.engine.board_key(board)
+        score = self.evaluations.get(key)
+        if score is None:
+            score = self.bot.eval_board(board)
+            self.evaluations[key] = score
+        return score
+
+    def count_node(self):
+        """
+        Counts a drop, and stops the search if its budget ran out (except in the first iteration)
+        """
+        self.nodes += 1
+        if not self.enforce_budget:
+            return
+        if self.node_budget is not None and self.nodes > self.node_budget:
+            raise BudgetExceeded()
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise BudgetExceeded()
@@ -83,4 +83,193 @@ def extract_features(board):
     :param board: The game board
     :return: Feature vector
     """
+    tracker = getattr(board, 'tracker', None)
+    if tracker is not None:
+        return tracker.features
     return extract_heights_and_holes(board) + extract_wells(board)
+
+
+class FeatureTracker:
+    """
+    Keeps the features of a board from tetris_env.tetris up to date as pieces are dropped, so they do not need to be
+    extracted from the whole board after every drop. It is attached to the board (board.tracker), copied with it, and
+    updated by tetris.drop_piece(). Only the columns the piece touched (and their neighbors, for the wells) are
+    rescanned. When lines are cleared, all the columns are rescanned.
+    """
+    __slots__ = ('heights', 'holes', 'wells', 'max_wells', 'features')
+
+    def __init__(self, board=None):
+        """
+        :param board: The game board to track. If it is None, the tracker is left empty (used by copy())
+        """
+        if board is not None:
+            width = len(board[0])
+            self.heights = board.heights[:]
+            self.holes = [0] * width
+            self.wells = [0] * width
+            self.max_wells = [0] * width
+            self.recalculate(board)
+
+    def copy(self):
+        """
+        :return: A copy of the tracker, for a copy of its board
+        """
+        tracker = FeatureTracker()
+        tracker.heights = self.heights[:]
+        tracker.holes = self.holes[:]
+        tracker.wells = self.wells[:]
+        tracker.max_wells = self.max_wells[:]
+        tracker.features = self.features
+        return tracker
+
+    def save(self):
+        """
+        :return: The state of the tracker, which can be restored with restore()
+        """
+        return self.heights[:], self.holes[:], self.wells[:], self.max_wells[:], self.features
+
+    def restore(self, state):
+        """
+        Restores a state returned by save()
+        :param state: The saved state
+        """
+        self.heights[:], self.holes[:], self.wells[:], self.max_wells[:], self.features = state
+
+    def recalculate(self, board):
+        """
+        Rescans all the columns of the board
+        :param board: The game board
+        """
+        board_height = len(board)
+        heights = self.heights
+        heights[:] = board.heights
+        for col in range(len(heights)):
+            holes = 0
+            for row in range(board_height - heights[col], board_height):
+                if board[row][col] == 0:
+                    holes += 1
+            self.holes[col] = holes
+            self.update_wells(board, col)
+        self.update_features()
+
+    def piece_dropped(self, board, col_offset, piece_width, cleared_lines):
+        """
+        Updates the features after a piece was dropped into the board
+        :param board: The game board, after the drop
+        :param col_offset: The column offset (from the left) of the piece
+        :param piece_width: The width of the piece
+        :param cleared_lines: The lines the drop cleared
+        """
+        if cleared_lines:
+            self.recalculate(board)
+            return
+        board_height = len(board)
+        heights = self.heights
+        for col in range(col_offset, col_offset + piece_width):
+            # The piece can only create holes between the previous top of the column and the piece itself
+            for row in range(board_height - board.heights[col], board_height - heights[col]):
+                if board[row][col] == 0:
+                    self.holes[col] += 1
+            heights[col] = board.heights[col]
+        for col in range(max(col_offset - 1, 0), min(col_offset + piece_width + 1, len(heights))):
+            self.update_wells(board, col)
+        self.update_features()
+
+    def update_wells(self, board, col):
+        """
+        Rescans the wells of a single column (see extract_wells())
+        :param board: The game board
+        :param col: The column number
+        """
+        board_height = len(board)
+        last_col = len(board[0]) - 1
+        heights = self.heights
+        # A well needs a non-empty neighbor, so it cannot be above the highest neighbor
+        if col == 0:
+            top = heights[1]
+        elif col == last_col:
+            top = heights[col - 1]
+        else:
+            top = min(heights[col - 1], heights[col + 1])
+        wells = 0
+        max_well = 0
+        curr_well = 0
+        for row in range(board_height - top, board_height):
+            line = board[row]
+            if line[col] == 0 and (col == 0 or line[col - 1] > 0) and (col == last_col or line[col + 1] > 0):
+                curr_well += 1
+                wells += 1
+                if curr_well > max_well:
+                    max_well = curr_well
+            else:
+                curr_well = 0
+        self.wells[col] = wells
+        self.max_wells[col] = max_well
+
+    def update_features(self):
+        """
+        Combines the columns' values into the feature vector (same order as extract_features())
+        """
+        heights = self.heights
+        roughness = 0
+        for i in range(len(heights) - 1):
+            roughness += abs(heights[i + 1] - heights[i])
+        height = max(heights)
+        self.features = (height, sum(heights), height - min(heights), sum(self.holes), roughness, max(self.max_wells),
+                         sum(self.wells))
+
+
+def extract_bitboard_features(board):
+    """
+    Same as extract_features(), but for a board from tetris_env.bitboard. Each row is handled as a whole with bitwise
+    operations instead of cell by cell
+    :param board: The game board (a BitBoard)
+    :return: Feature vector (same order as extract_features())
+    """
+    rows = board.rows
+    board_height = len(rows)
+    board_width = board.width
+    heights = [0] * board_width
+    holes = 0
+    # Columns which have a non-empty block somewhere above the current row
+    covered = 0
+    # A well square is empty with non-empty squares on both sides. The board's edges count as non-empty squares
+    left_wall = 1
+    right_wall = 1 << (board_width - 1)
+    wells_run = [0] * board_width
+    prev_wells = 0
+    max_well = 0
+    cum_well = 0
+    for row in range(board_height):
+        line = rows[row]
+        new_tops = line & ~covered
+        while new_tops:
+            low_bit = new_tops & -new_tops
+            heights[low_bit.bit_length() - 1] = board_height - row
+            new_tops ^= low_bit
+        holes += (covered & ~line).bit_count()
+        covered |= line
+
+        wells = ~line & board.full_row & ((line << 1) | left_wall) & ((line >> 1) | right_wall)
+        ended = prev_wells & ~wells
+        while ended:
+            low_bit = ended & -ended
+            wells_run[low_bit.bit_length() - 1] = 0
+            ended ^= low_bit
+        prev_wells = wells
+        while wells:
+            low_bit = wells & -wells
+            col = low_bit.bit_length() - 1
+            wells_run[col] += 1
+            cum_well += 1
+            if wells_run[col] > max_well:
+                max_well = wells_run[col]
+            wells ^= low_bit
+
+    roughness = 0
+    for i in range(board_width - 1):
+        roughness += abs(heights[i + 1] - heights[i])
+    height = max(heights)
+    rel_height = height - min(heights)
+    cum_height = sum(heights)
+    return height, cum_height, rel_height, holes, roughness, max_well, cum_well
@@ -0,0 +1,117 @@
+import time
+from collections import Counter, defaultdict
+
+from bot.tetris_bot import ENGINES, TetrisBot
+from tetris_env import bitboard, tetris
+
+# The number of calls of every instrumented function, and the number of items they handled
+counters = Counter()
+# The total time (in seconds) spent in every instrumented function, including the functions it calls
+timers = defaultdict(float)
+
+# The instrumented functions, as (owner, function name, counter name, count function). The count function takes the
+# call's arguments and result, and returns the number of items it handled (None counts the calls only)
+INSTRUMENTED = [
+    (engine, name, f'{engine.__name__.split(".")[-1]}.{counter}', count)
+    for engine in (tetris, bitboard)
+    for name, counter, count in (
+        ('apply_piece', 'drops', None),
+        ('undo_piece', 'undos', None),
+        ('copy_board', 'copies', None),
+        ('update_lines', 'line_clears', lambda args, result: len(result)),
+    )
+] + [
+    # The list engine finds the landing row from the columns' heights, so only the bitboard engine checks collisions
+    (bitboard, 'collision_detection', 'bitboard.collisions', lambda args, result: int(result)),
+    (TetrisBot, 'find_best_move', 'bot.moves', None),
+    (TetrisBot, 'find_best_move_lookahead', 'bot.moves', None),
+    (TetrisBot, 'eval_board', 'bot.evaluations', None),
+    (TetrisBot, 'eval_boards', 'bot.evaluations', lambda args, result: len(result)),
+]
+
+# The original functions and ENGINES entries, while the instrumentation is enabled
+_originals = {}
+_original_engines = {}
+
+
+def instrument(func, name, count):
+    """
+    Wraps a function so it counts its calls and their time
+    :param func: The function
+    :param name: The name of its counter and timer
+    :param count: The count function (see INSTRUMENTED)
+    :return: The wrapped function
+    """
+    calls = f'{name}.calls'
+    items = name if count is not None else None
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        timers[name] += time.perf_counter() - start
+        counters[calls] += 1
+        if items is not None:
+            counters[items] += count(args, result)
+        return result
+
+    return wrapper
+
+
+def enable():
+    """
+    Starts counting and timing the instrumented functions (and the feature extraction of every engine). The functions
+    are replaced with wrappers in their modules and classes, so while the instrumentation is disabled, they are the
+    original functions and cost nothing extra. Bots created before this is called do not count their feature
+    extractions
+    """
+    if _originals:
+        return
+    for owner, func_name, name, count in INSTRUMENTED:
+        func = getattr(owner, func_name)
+        _originals[(owner, func_name)] = func
+        setattr(owner, func_name, instrument(func, name, count))
+    # Bots take their feature extraction function from ENGINES when they are created
+    for engine_name, (engine, extract_features) in list(ENGINES.items()):
+        _original_engines[engine_name] = (engine, extract_features)
+        ENGINES[engine_name] = (engine, instrument(extract_features, 'bot.feature_extractions', None))
+
+
+def disable():
+    """
+    Restores the original functions
+    """
+    for (owner, func_name), func in _originals.items():
+        setattr(owner, func_name, func)
+    ENGINES.update(_original_engines)
+    _originals.clear()
+    _original_engines.clear()
+
+
+def is_enabled():
+    return bool(_originals)
+
+
+def reset():
+    """
+    Zeroes the counters and the timers
+    """
+    counters.clear()
+    timers.clear()
+
+
+def snapshot():
+    """
+    :return: A copy of the counters and the timers, which can be sent between processes
+    """
+    return dict(counters), dict(timers)
+
+
+def merge(total, other):
+    """
+    Adds a snapshot to another one
+    :param total: The snapshot which is added to (changed in place)
+    :param other: The snapshot to add
+    """
+    for dst, src in zip(total, other):
+        for name, value in src.items():
+            dst[name] = dst.get(name, 0) + value
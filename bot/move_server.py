@@ -0,0 +1,425 @@
+import asyncio
+import collections
+import itertools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from bot.batch_evaluation import batch_scores
+from bot.tetris_bot import TetrisBot, snapshot_features
+from evolution.messages import read_message_async, write_message_async
+
+
+class MoveRequest:
+    """
+    A request for the best move, waiting in the server's queue
+    """
+    __slots__ = ('genome_id', 'rows', 'cpid', 'npid', 'future')
+
+    def __init__(self, genome_id, rows, cpid, npid, future):
+        """
+        :param genome_id: The ID of the genome which plays the move
+        :param rows: The visible rows of the board, from top to bottom (0 for an empty square)
+        :param cpid: The current piece's ID
+        :param npid: The next piece's ID, or None if it is not known
+        :param future: The future the (move, score) result is set to
+        """
+        self.genome_id = genome_id
+        self.rows = rows
+        self.cpid = cpid
+        self.npid = npid
+        self.future = future
+
+
+class MoveServer:
+    """
+    Serves the best moves of trained genomes over TCP, using the length-prefixed JSON messages of evolution.messages.
+    A 'move' request has an ID, a genome ID, the board's visible rows, the current piece and the next piece (or null),
+    and is answered with the move as [rotation, column offset] (null if every move loses) and its score. Requests may
+    be pipelined on a connection, and are answered as soon as they are ready, with the ID of the request. A 'stats'
+    request is answered with the server's latency percentiles. A request which cannot be answered is answered with an
+    'error' message instead, and the connection stays open.
+    Concurrent requests (of any connection and any genome) are micro-batched: the boards reachable from all of them are
+    stacked and their features are calculated in one NumPy pass, same as TetrisBot's 'numpy' evaluator does for a
+    single request. The evaluation runs in a separate thread, so requests keep arriving and form the next batch while a
+    batch is evaluated
+    """
+    def __init__(self, genomes, host='127.0.0.1', port=47600, engine='list', beam_width=None, max_batch=64,
+                 batch_window=0.001, latency_window=10000, max_bots=256):
+        """
+        :param genomes: A dictionary of the served genomes by their IDs (see load_genomes()). They are kept for the
+        server's lifetime, with a bot for every board size they are asked about (see max_bots)
+        :param host: The address to listen on
+        :param port: The port to listen on
+        :param engine: The game engine the moves are searched with, one of bot.tetris_bot.ENGINES' keys
+        :param beam_width: The bots' beam width (see TetrisBot)
+        :param max_batch: The maximal number of requests evaluated together
+        :param batch_window: The maximal time (in seconds) to wait for more requests after the first request of a batch
+        arrives. A longer window makes larger batches, at the cost of latency when the server is not busy
+        :param latency_window: Number of recent requests the latency percentiles are calculated over
+        :param max_bots: The maximal number of (genome, board size) bots kept. When there are more, the least recently
+        used bot is dropped, so clients cannot grow the server's memory by asking about many board sizes
+        """
+        self.genomes = {str(genome_id): list(g) for genome_id, g in genomes.items()}
+        self.address = (host, port)
+        self.engine = engine
+        self.beam_width = beam_width
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        # The bots by (genome ID, height, width), from the least recently used one
+        self.bots = collections.OrderedDict()
+        self.max_bots = max_bots
+        self.latencies = collections.deque(maxlen=latency_window)
+        self.num_requests = 0
+        self.num_batches = 0
+        self.queue = None
+        self.server = None
+        self.batcher = None
+        # A single thread evaluates the batches, so their NumPy work does not block the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    @staticmethod
+    def load_genomes(path):
+        """
+        :param path: A JSON file with a dictionary of genomes by their IDs
+        :return: The dictionary
+        """
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    async def start(self):
+        """
+        Starts accepting connections and evaluating requests
+        """
+        self.queue = asyncio.Queue()
+        self.batcher = asyncio.create_task(self.run_batches())
+        self.server = await asyncio.start_server(self.handle_client, *self.address)
+
+    async def stop(self):
+        """
+        Stops accepting connections, and stops evaluating requests
+        """
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        if self.batcher is not None:
+            self.batcher.cancel()
+            self.batcher = None
+        self.executor.shutdown(wait=False)
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def handle_client(self, reader, writer):
+        """
+        Handles the requests of a connection until it ends
+        :param reader: The connection's reader
+        :param writer: The connection's writer
+        """
+        send_lock = asyncio.Lock()
+        answers = set()
+        try:
+            while True:
+                try:
+                    message = await read_message_async(reader)
+                except ValueError:
+                    # The message was read whole, so the connection can go on with the next one
+                    async with send_lock:
+                        await write_message_async(writer, {'type': 'error', 'id': None,
+                                                           'error': 'The message is not valid JSON'})
+                    continue
+                if message is None:
+                    break
+                if not isinstance(message, dict):
+                    answer = {'type': 'error', 'id': None, 'error': 'A request must be a JSON object'}
+                elif message.get('type') == 'move':
+                    answer = asyncio.create_task(self.answer_move(message, writer, send_lock))
+                    answers.add(answer)
+                    answer.add_done_callback(answers.discard)
+                    continue
+                elif message.get('type') == 'stats':
+                    answer = dict(self.stats(), type='stats', id=message.get('id'))
+                else:
+                    answer = {'type': 'error', 'id': message.get('id'),
+                              'error': f'Unknown request type: {message.get("type")!r}'}
+                async with send_lock:
+                    await write_message_async(writer, answer)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            for answer in answers:
+                answer.cancel()
+            writer.close()
+
+    async def answer_move(self, message, writer, send_lock):
+        """
+        Queues a move request, and sends its answer once its batch is evaluated
+        :param message: The request
+        :param writer: The connection's writer
+        :param send_lock: A lock which keeps the answers of the connection from interleaving
+        """
+        start = time.perf_counter()
+        try:
+            future = asyncio.get_running_loop().create_future()
+            self.queue.put_nowait(MoveRequest(str(message['genome']), message['board'], message['piece'],
+                                              message.get('next'), future))
+            move, score = await future
+            answer = {'type': 'move', 'id': message.get('id'), 'move': move, 'score': score}
+        except KeyError as e:
+            answer = {'type': 'error', 'id': message.get('id'), 'error': f'Missing field: {e}'}
+        except Exception as e:
+            # Bad requests fail with a ValueError, and anything else failed while their batch was evaluated
+            answer = {'type': 'error', 'id': message.get('id'), 'error': str(e)}
+        try:
+            async with send_lock:
+                await write_message_async(writer, answer)
+        except ConnectionError:
+            return
+        self.latencies.append(time.perf_counter() - start)
+        self.num_requests += 1
+
+    async def run_batches(self):
+        """
+        Collects the queued requests into batches and evaluates them, until the server stops
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                results = await loop.run_in_executor(self.executor, self.evaluate_batch, batch)
+            except Exception as e:
+                # The batch's requests fail, and the server goes on with the next batch
+                results = [RuntimeError(f'The evaluation failed: {e}')] * len(batch)
+            self.num_batches += 1
+            for request, result in zip(batch, results):
+                if request.future.done():
+                    continue
+                if isinstance(result, Exception):
+                    request.future.set_exception(result)
+                else:
+                    request.future.set_result(result)
+
+    def get_bot(self, genome_id, height, width):
+        """
+        :param genome_id: The genome's ID
+        :param height: The board's height
+        :param width: The board's width
+        :return: The bot of the genome for boards of this size
+        """
+        key = (genome_id, height, width)
+        bot = self.bots.get(key)
+        if bot is None:
+            bot = TetrisBot(height, width, self.genomes[genome_id], engine=self.engine, evaluator='numpy',
+                            beam_width=self.beam_width)
+            self.bots[key] = bot
+            if len(self.bots) > self.max_bots:
+                self.bots.popitem(last=False)
+        else:
+            self.bots.move_to_end(key)
+        return bot
+
+    @staticmethod
+    def check_piece(bot, pid, name):
+        """
+        :param bot: The bot which plays the move
+        :param pid: A piece ID from a request
+        :param name: The name of the piece in the error message
+        :raise ValueError: If it is not the ID of one of the bot's pieces
+        """
+        if type(pid) is not int or not 0 <= pid < len(bot.pf.pieces):
+            raise ValueError(f'Unknown {name}: {pid!r}')
+
+    @staticmethod
+    def check_rows(rows):
+        """
+        :param rows: The board's rows from a request
+        :raise ValueError: If they are not a non-empty list of rows of the same (non-zero) width, where every square is
+        a non-negative integer
+        """
+        if type(rows) is not list or not rows or type(rows[0]) is not list or not rows[0]:
+            raise ValueError('The board must be a non-empty list of non-empty rows')
+        width = len(rows[0])
+        for row in rows:
+            if type(row) is not list or len(row) != width:
+                raise ValueError(f'Every row of the board must have {width} squares')
+            if not all(type(val) is int and val >= 0 for val in row):
+                raise ValueError('Every square of the board must be a non-negative integer')
+
+    def evaluate_batch(self, batch):
+        """
+        Finds the best moves of a batch of requests. The features of all the reachable boards of the same size are
+        calculated together, and each request's boards are then scored with its own genome
+        :param batch: A list of MoveRequest
+        :return: The result of each request: a ([rotation, column offset], score) tuple (None, None if every move
+        loses), or the exception the request raised
+        """
+        results = [None] * len(batch)
+        # The requests' candidates grouped by the boards' size, as (request index, bot, moves, starts, boards)
+        groups = collections.defaultdict(list)
+        for index, request in enumerate(batch):
+            try:
+                self.check_rows(request.rows)
+                height, width = len(request.rows), len(request.rows[0])
+                bot = self.get_bot(request.genome_id, height, width)
+                self.check_piece(bot, request.cpid, 'piece')
+                if request.npid is not None:
+                    self.check_piece(bot, request.npid, 'next piece')
+                # Filled squares are stored as 1, so any positive value fits the boards' snapshots
+                board = bot.engine.board_from_rows([[1 if val else 0 for val in row] for row in request.rows])
+                if request.npid is None:
+                    moves, boards = bot.move_candidates(board, request.cpid)
+                    starts = None
+                else:
+                    moves, starts, boards = bot.lookahead_candidates(board, request.cpid, request.npid)
+            except KeyError:
+                results[index] = ValueError(f'Unknown genome: {request.genome_id}')
+                continue
+            except (IndexError, ValueError, TypeError) as e:
+                results[index] = ValueError(f'Bad request: {e}')
+                continue
+            if not boards:
+                results[index] = (None, None)
+                continue
+            groups[(height, width)].append((index, bot, moves, starts, boards))
+        for (_, width), candidates in groups.items():
+            try:
+                features = snapshot_features([board for _, _, _, _, boards in candidates for board in boards], width)
+                start = 0
+                for index, bot, moves, starts, boards in candidates:
+                    scores = batch_scores(features[start:start + len(boards)], bot.weights)
+                    start += len(boards)
+                    if starts is None:
+                        move, score = bot.choose_move(moves, scores)
+                    else:
+                        move, score = bot.choose_lookahead_move(moves, starts, scores)
+                    results[index] = (list(move), float(score)) if move is not None else (None, None)
+            except Exception as e:
+                # Only the requests of this board size fail
+                for index, _, _, _, _ in candidates:
+                    results[index] = RuntimeError(f'The evaluation failed: {e}')
+        return results
+
+    def stats(self):
+        """
+        :return: A dictionary with the number of answered requests and evaluated batches, the mean batch size, and the
+        median, 99th percentile and maximum of the recent requests' latencies (in milliseconds)
+        """
+        stats = {'requests': self.num_requests, 'batches': self.num_batches,
+                 'mean_batch': self.num_requests / self.num_batches if self.num_batches else 0}
+        if self.latencies:
+            p50, p99 = np.percentile(self.latencies, [50, 99]) * 1000
+            stats.update(p50_ms=p50, p99_ms=p99, max_ms=max(self.latencies) * 1000)
+        return stats
+
+
+class MoveClient:
+    """
+    A connection to a MoveServer. Any number of requests can be awaited together on the same connection
+    """
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.pending = {}
+        self.ids = itertools.count()
+        self.receiver = None
+
+    async def connect(self, host='127.0.0.1', port=47600):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.receiver = asyncio.create_task(self.receive())
+
+    async def close(self):
+        if self.receiver is not None:
+            self.receiver.cancel()
+            self.receiver = None
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.writer = None
+
+    async def receive(self):
+        """
+        Hands the server's answers to the requests which wait for them
+        """
+        try:
+            while True:
+                message = await read_message_async(self.reader)
+                if message is None:
+                    break
+                future = self.pending.pop(message['id'], None)
+                if future is None or future.done():
+                    continue
+                if message['type'] == 'error':
+                    future.set_exception(ValueError(message['error']))
+                else:
+                    future.set_result(message)
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('The connection to the server was lost'))
+            self.pending.clear()
+
+    async def request(self, message):
+        """
+        :param message: A request (without an ID)
+        :return: The server's answer
+        """
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        await write_message_async(self.writer, dict(message, id=request_id))
+        return await future
+
+    async def best_move(self, genome_id, rows, cpid, npid=None):
+        """
+        :param genome_id: The ID of the genome which plays the move
+        :param rows: The visible rows of the board, from top to bottom (0 for an empty square)
+        :param cpid: The current piece's ID
+        :param npid: The next piece's ID, or None if it is not known
+        :return: The best move as (rotation, column offset) (None if every move loses) and its score
+        """
+        answer = await self.request({'type': 'move', 'genome': genome_id, 'board': rows, 'piece': cpid,
+                                     'next': npid})
+        return (tuple(answer['move']) if answer['move'] is not None else None), answer['score']
+
+    async def stats(self):
+        """
+        :return: The server's statistics (see MoveServer.stats())
+        """
+        answer = await self.request({'type': 'stats'})
+        del answer['type'], answer['id']
+        return answer
+
+
+def run_server(genomes, host='127.0.0.1', port=47600, **kwargs):
+    """
+    Runs a move server until interrupted
+    :param genomes: A dictionary of genomes by their IDs, or the path of a JSON file with one
+    :param host: The address to listen on
+    :param port: The port to listen on
+    :param kwargs: Any other keyword argument of MoveServer
+    """
+    if isinstance(genomes, str):
+        genomes = MoveServer.load_genomes(genomes)
+    try:
+        asyncio.run(MoveServer(genomes, host, port, **kwargs).serve_forever())
+    except KeyboardInterrupt:
+        pass
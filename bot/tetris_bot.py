@@ -1,21 +1,62 @@
 import math
 import random
 
-from bot.feature_extraction import extract_features
-from tetris_env import tetris
+import numpy as np
+
+from bot.batch_evaluation import batch_features, batch_scores, bitboard_rows_to_cells
+from bot.expectimax import ExpectimaxSearch
+from bot.feature_extraction import FeatureTracker, extract_bitboard_features, extract_features
+from tetris_env import bitboard, tetris
 from tetris_env.piece_factory import PieceFactory
 
+# The available game engines, and the feature extraction function which matches each engine's board
+ENGINES = {
+    'list': (tetris, extract_features),
+    'bitboard': (bitboard, extract_bitboard_features)
+}
+
+
+def snapshot_features(boards, width):
+    """
+    Calculates the features of many boards at once
+    :param boards: Boards from TetrisBot.snapshot_board(), all of the same size
+    :param width: The boards' width
+    :return: A 2D array with the shape (boards, features)
+    """
+    if isinstance(boards[0], bytes):
+        cells = np.frombuffer(b''.join(boards), dtype=np.int8).reshape(len(boards), -1, width) > 0
+    else:
+        cells = bitboard_rows_to_cells(np.array(boards, dtype=np.int64), width)
+    return batch_features(cells)
+
 
 class TetrisBot:
     """
     A bot which plays tetris given the feature weights
     """
-    def __init__(self, height, width, genome, lookahead=True):
+    def __init__(self, height, width, genome, lookahead=True, engine='list', incremental_features=True,
+                 evaluator='scalar', beam_width=None, transpositions=True, search_depth=None, time_budget=None,
+                 node_budget=None):
         """
         :param height: The board's height
         :param width:  The board's width
         :param genome: The weights for the features
         :param lookahead: Should the bot look at the next piece when considering the best move?
+        :param engine: The game engine to use, one of ENGINES' keys
+        :param incremental_features: Should the features be updated with every drop instead of extracted from the whole
+        board? (only for the list engine with the scalar evaluator)
+        :param evaluator: How the boards reachable from the current position are scored. 'scalar' scores each board on
+        its own with eval_board(), 'numpy' stacks all of them and scores them together with bot.batch_evaluation. Both
+        choose the same moves
+        :param beam_width: When looking ahead, only the drops of the current piece with the beam_width best scores (by
+        themselves) are expanded with the next piece. None expands all of them
+        :param transpositions: When looking ahead, drops of the current piece which lead to the same board are only
+        expanded once (the result is the same)
+        :param search_depth: If it is set, the moves are found by an expectimax search (see bot.expectimax) which drops
+        up to this many pieces, averaging over the unseen ones. Otherwise, the bot drops one piece, or two with
+        lookahead
+        :param time_budget: The maximal time (in seconds) of the expectimax search of a move, None for no limit
+        :param node_budget: The maximal number of drops the expectimax search of a move tries, None for no limit
         """
         self.height = height
         self.width = width
@@ -23,20 +64,40 @@ class TetrisBot:
         self.pf = PieceFactory(width)
         self.genome_len = len(genome)
         self.lookahead = lookahead
+        self.engine, self.extract_features = ENGINES[engine]
+        self.incremental_features = incremental_features
+        if evaluator not in ('scalar', 'numpy'):
+            raise ValueError(f'Unknown evaluator: {evaluator}')
+        self.evaluator = evaluator
+        self.beam_width = beam_width
+        self.transpositions = transpositions
+        if search_depth is not None:
+            self.search = ExpectimaxSearch(self, search_depth, time_budget, node_budget)
+        else:
+            self.search = None
 
-    def play_game(self, with_print=False):
+    def play_game(self, with_print=False, max_pieces=None, pieces=None):
         """
         Play a single game of Tetris using the weights given to the bot
         :param with_print: Print the board?
+        :param max_pieces: If it is set, the game is stopped after this many pieces, and its score is max_pieces (the
+        real score is censored)
+        :param pieces: The sequence the pieces are taken from (a PieceSequence). If it is None, the pieces are drawn
+        from the random module
         :return: Number of pieces dropped in the game
         """
+        next_piece = pieces.next_piece if pieces is not None else lambda: random.randint(0, 6)
         pieces_counter = 0
-        board = tetris.create_board(self.height, self.width)
-        curr_pid = random.randint(0, 6)
-        next_pid = random.randint(0, 6)
-        while True:
+        board = self.engine.create_board(self.height, self.width)
+        if self.incremental_features and self.evaluator == 'scalar' and isinstance(board, tetris.Board):
+            board.tracker = FeatureTracker(board)
+        curr_pid = next_piece()
+        next_pid = next_piece()
+        while max_pieces is None or pieces_counter < max_pieces:
             pieces_counter += 1
-            if self.lookahead:
+            if self.search is not None:
+                board, _ = self.find_best_move_expectimax(board, curr_pid, next_pid if self.lookahead else None)
+            elif self.lookahead:
                 board, _ = self.find_best_move_lookahead(board, curr_pid, next_pid)
             else:
                 board, _ = self.find_best_move(board, curr_pid)
@@ -45,10 +106,10 @@ class TetrisBot:
                     print('GAME OVER')
                 break
             if with_print:
-                tetris.pretty_print_board(board)
+                self.engine.pretty_print_board(board)
                 print('-' * 20)
             curr_pid = next_pid
-            next_pid = random.randint(0, 6)
+            next_pid = next_piece()
         return pieces_counter
 
     def find_best_move_lookahead(self, board, cpid, npid):
@@ -59,21 +120,20 @@ class TetrisBot:
         :param npid: The next piece's ID
         :return: The board after dropping the current piece in the best position (it does not drop the next one)
         """
-        roas = self.pf.get_rotations_and_offset_limit(cpid)
-        max_score = - math.inf
-        best_board = None
-        for (piece, offset_limit) in roas:
-            for col_offset in range(offset_limit + 1):
-                new_board = tetris.copy_board(board)
-                if not tetris.drop_piece(piece, col_offset, new_board):
-                    # For each way to drop the current piece, we also evaluate all the ways we can drop the next piece
-                    # after we dropped the current one. The score of the current drop is the best score of the drop
-                    # of the next piece
-                    _, score = self.find_best_move(new_board, npid)
-                    if score > max_score:
-                        max_score = score
-                        best_board = new_board
-        return best_board, max_score
+        move, max_score = self.best_move_lookahead(board, cpid, npid)
+        return self.make_move(board, cpid, move), max_score
+
+    def find_best_move_expectimax(self, board, cpid, npid=None):
+        """
+        Calculates the best move with the expectimax search, within the bot's budget
+        :param board: The game board
+        :param cpid: The current piece's ID
+        :param npid: The next piece's ID, or None if it is not known
+        :return: The board after dropping the current piece in the best position and the move's expected score
+        """
+        search = self.search if self.search is not None else ExpectimaxSearch(self)
+        move, max_score, _ = search.search(board, cpid, npid)
+        return self.make_move(board, cpid, move), max_score
 
     def find_best_move(self, board, pid):
         """
@@ -82,18 +142,242 @@ class TetrisBot:
         :param pid: Piece ID in range [0,6]
         :return: The game board after dropping the piece in the optimal position and the score of the board
         """
+        move, max_score = self.best_move(board, pid)
+        return self.make_move(board, pid, move), max_score
+
+    def make_move(self, board, pid, move):
+        """
+        Drops the piece into a copy of the board
+        :param board: The game board
+        :param pid: Piece ID in range [0,6]
+        :param move: The move as (rotation, column offset), or None if there is no move that does not lose
+        :return: The new game board, or None if there is no move
+        """
+        if move is None:
+            return None
+        rid, col_offset = move
+        new_board = self.engine.copy_board(board)
+        self.engine.drop_piece(self.pf.pieces[pid][rid], col_offset, new_board)
+        return new_board
+
+    def best_move_lookahead(self, board, cpid, npid):
+        """
+        Same as find_best_move_lookahead(), but returns the move instead of the board. The moves are tried on the board
+        itself and taken back, so the board is the same as before once the function returns
+        :param board: The game board
+        :param cpid: The current piece's ID
+        :param npid: The next piece's ID
+        :return: The best move as (rotation, column offset) (None if every move loses) and its score
+        """
+        if self.evaluator == 'numpy':
+            return self.best_move_lookahead_batch(board, cpid, npid)
+        max_score = - math.inf
+        best_move = None
+        # The score of every board reached so far after dropping the current piece
+        transpositions = {}
+        for rid, col_offset in self.lookahead_moves(board, cpid):
+            undo = self.engine.apply_piece(self.pf.pieces[cpid][rid], col_offset, board)
+            if undo is not None:
+                # For each way to drop the current piece, we also evaluate all the ways we can drop the next piece
+                # after we dropped the current one. The score of the current drop is the best score of the drop
+                # of the next piece
+                key = self.engine.board_key(board) if self.transpositions else None
+                score = transpositions.get(key)
+                if score is None:
+                    _, score = self.best_move(board, npid)
+                    if key is not None:
+                        transpositions[key] = score
+                self.engine.undo_piece(undo, board)
+                if score > max_score:
+                    max_score = score
+                    best_move = (rid, col_offset)
+        return best_move, max_score
+
+    def lookahead_moves(self, board, pid):
+        """
+        The drops of the current piece that the lookahead search expands with the next piece. Without a beam, these are
+        all the drops (the ones that lose are skipped by the search). With a beam, these are the beam_width drops with
+        the best scores, in the same order as without a beam
+        :param board: The game board
+        :param pid: The current piece's ID
+        :return: A sequence of moves as (rotation, column offset)
+        """
+        if self.beam_width is None:
+            return self.pf.get_moves(pid)
+        roas = self.pf.get_rotations_and_offset_limit(pid)
+        moves = []
+        boards = []
+        for rid, (piece, offset_limit) in enumerate(roas):
+            for col_offset in range(offset_limit + 1):
+                undo = self.engine.apply_piece(piece, col_offset, board)
+                if undo is not None:
+                    moves.append((rid, col_offset))
+                    boards.append(self.snapshot_board(board) if self.evaluator == 'numpy' else self.eval_board(board))
+                    self.engine.undo_piece(undo, board)
+        if len(moves) <= self.beam_width:
+            return moves
+        scores = self.eval_boards(boards) if self.evaluator == 'numpy' else boards
+        beam = sorted(range(len(moves)), key=lambda m: scores[m], reverse=True)[:self.beam_width]
+        return [moves[m] for m in sorted(beam)]
+
+    def best_move(self, board, pid):
+        """
+        Same as find_best_move(), but returns the move instead of the board. The moves are tried on the board itself
+        and taken back, so the board is the same as before once the function returns
+        :param board: The game board
+        :param pid: Piece ID in range [0,6]
+        :return: The best move as (rotation, column offset) (None if every move loses) and its score
+        """
+        if self.evaluator == 'numpy':
+            return self.best_move_batch(board, pid)
         roas = self.pf.get_rotations_and_offset_limit(pid)
         max_score = - math.inf
-        best_board = None
-        for (piece, offset_limit) in roas:
+        best_move = None
+        for rid, (piece, offset_limit) in enumerate(roas):
             for col_offset in range(offset_limit + 1):
-                new_board = tetris.copy_board(board)
-                if not tetris.drop_piece(piece, col_offset, new_board):
-                    move_score = self.eval_board(new_board)
+                undo = self.engine.apply_piece(piece, col_offset, board)
+                if undo is not None:
+                    move_score = self.eval_board(board)
+                    self.engine.undo_piece(undo, board)
                     if move_score > max_score:
                         max_score = move_score
-                        best_board = new_board
-        return best_board, max_score
+                        best_move = (rid, col_offset)
+        return best_move, max_score
+
+    def best_move_batch(self, board, pid):
+        """
+        Same as best_move(), but all the reachable boards are scored together with NumPy
+        :param board: The game board
+        :param pid: Piece ID in range [0,6]
+        :return: The best move as (rotation, column offset) (None if every move loses) and its score
+        """
+        moves, boards = self.move_candidates(board, pid)
+        if not moves:
+            return None, - math.inf
+        return self.choose_move(moves, self.eval_boards(boards))
+
+    def move_candidates(self, board, pid):
+        """
+        The boards reachable by dropping a piece, for scoring them in a batch (see best_move_batch())
+        :param board: The game board
+        :param pid: Piece ID in range [0,6]
+        :return: A list of the moves which do not lose as (rotation, column offset), and a list of the boards they
+        lead to (from snapshot_board())
+        """
+        moves = []
+        boards = []
+        for rid, (piece, offset_limit) in enumerate(self.pf.get_rotations_and_offset_limit(pid)):
+            for col_offset in range(offset_limit + 1):
+                undo = self.engine.apply_piece(piece, col_offset, board)
+                if undo is not None:
+                    moves.append((rid, col_offset))
+                    boards.append(self.snapshot_board(board))
+                    self.engine.undo_piece(undo, board)
+        return moves, boards
+
+    @staticmethod
+    def choose_move(moves, scores):
+        """
+        :param moves: The moves from move_candidates()
+        :param scores: The scores of their boards
+        :return: The best move and its score
+        """
+        best = int(scores.argmax())
+        return moves[best], scores[best]
+
+    def best_move_lookahead_batch(self, board, cpid, npid):
+        """
+        Same as best_move_lookahead(), but the boards reachable after dropping both pieces are scored together with
+        NumPy
+        :param board: The game board
+        :param cpid: The current piece's ID
+        :param npid: The next piece's ID
+        :return: The best move as (rotation, column offset) (None if every move loses) and its score
+        """
+        moves, starts, boards = self.lookahead_candidates(board, cpid, npid)
+        if not boards:
+            return None, - math.inf
+        return self.choose_lookahead_move(moves, starts, self.eval_boards(boards))
+
+    def lookahead_candidates(self, board, cpid, npid):
+        """
+        The boards reachable by dropping the current piece and then the next one, for scoring them in a batch (see
+        best_move_lookahead_batch())
+        :param board: The game board
+        :param cpid: The current piece's ID
+        :param npid: The next piece's ID
+        :return: The moves of the current piece which do not lose as (rotation, column offset), where each move's boards
+        start in the boards list (see choose_lookahead_move()), and the boards (from snapshot_board())
+        """
+        next_roas = self.pf.get_rotations_and_offset_limit(npid)
+        moves = []
+        # The index in boards of the first board reached from each move, or the index of an earlier move which reached
+        # the same board (as a negative number, -1 for the first move)
+        starts = []
+        boards = []
+        transpositions = {}
+        for rid, col_offset in self.lookahead_moves(board, cpid):
+            undo = self.engine.apply_piece(self.pf.pieces[cpid][rid], col_offset, board)
+            if undo is not None:
+                key = self.engine.board_key(board) if self.transpositions else None
+                if key in transpositions:
+                    starts.append(-1 - transpositions[key])
+                else:
+                    if key is not None:
+                        transpositions[key] = len(moves)
+                    starts.append(len(boards))
+                    for next_piece, next_offset_limit in next_roas:
+                        for next_col_offset in range(next_offset_limit + 1):
+                            next_undo = self.engine.apply_piece(next_piece, next_col_offset, board)
+                            if next_undo is not None:
+                                boards.append(self.snapshot_board(board))
+                                self.engine.undo_piece(next_undo, board)
+                moves.append((rid, col_offset))
+                self.engine.undo_piece(undo, board)
+        return moves, starts, boards
+
+    @staticmethod
+    def choose_lookahead_move(moves, starts, scores):
+        """
+        :param moves: The moves from lookahead_candidates()
+        :param starts: Where the boards of each move start, from lookahead_candidates()
+        :param scores: The scores of the boards
+        :return: The best move as (rotation, column offset) (None if every move loses) and its score
+        """
+        # The score of a move is the best score of the next piece's drops. Moves after which the next piece cannot be
+        # dropped are left with -inf, so they are not chosen
+        move_scores = np.full(len(moves), - math.inf)
+        end = len(scores)
+        for i in reversed(range(len(moves))):
+            if starts[i] >= 0:
+                if starts[i] < end:
+                    move_scores[i] = scores[starts[i]:end].max()
+                end = starts[i]
+        for i in range(len(moves)):
+            if starts[i] < 0:
+                move_scores[i] = move_scores[-1 - starts[i]]
+        best = int(move_scores.argmax())
+        if move_scores[best] == - math.inf:
+            return None, - math.inf
+        return moves[best], move_scores[best]
+
+    def snapshot_board(self, board):
+        """
+        :param board: The game board
+        :return: The board's rows in a form that eval_boards() can stack (the board itself can be changed afterwards)
+        """
+        rows = getattr(board, 'rows', None)
+        if rows is not None:
+            return rows[:]
+        return b''.join(map(bytes, board))
+
+    def eval_boards(self, boards):
+        """
+        Calculates the scores of many boards at once
+        :param boards: Boards from snapshot_board()
+        :return: An array with the score of each board
+        """
+        return batch_scores(snapshot_features(boards, self.width), self.weights)
 
     def eval_board(self, board):
         """
@@ -101,7 +385,7 @@ class TetrisBot:
         :param board: The game board
         :return: The board's score
         """
-        features = extract_features(board)
+        features = self.extract_features(board)
         score = 0
         for i in range(self.genome_len):
             score += self.weights[i] * features[i]
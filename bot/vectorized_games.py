@@ -0,0 +1,194 @@
+import numpy as np
+
+from bot.batch_evaluation import batch_features
+from tetris_env.piece_factory import PieceFactory
+from tetris_env.piece_sequence import PieceSequence
+
+
+class PlacementTable:
+    """
+    All the ways to drop a single piece into a board of a given width, as arrays. Candidate c is the c-th
+    (rotation, column offset) pair, in the same order TetrisBot tries them
+    """
+    def __init__(self, pf, pid):
+        """
+        :param pf: A PieceFactory for the board's width
+        :param pid: Piece ID in range [0,6]
+        """
+        self.moves = []
+        columns = []
+        bottom_contours = []
+        cell_rows = []
+        cell_columns = []
+        piece_heights = []
+        for rid, (piece, offset_limit) in enumerate(pf.get_rotations_and_offset_limit(pid)):
+            cells = piece.cells
+            width = piece.width
+            for col_offset in range(offset_limit + 1):
+                self.moves.append((rid, col_offset))
+                # Every piece is padded to 4 columns. The padding repeats the last column, with a contour so deep it
+                # never decides the landing level
+                columns.append([col_offset + min(col, width - 1) for col in range(4)])
+                bottom_contours.append([piece.bottom_contour[col] if col < width else 1000 for col in range(4)])
+                cell_rows.append([row for row, _ in cells])
+                cell_columns.append([col_offset + col for _, col in cells])
+                piece_heights.append(piece.height)
+        self.columns = np.array(columns)
+        self.bottom_contours = np.array(bottom_contours)
+        self.cell_rows = np.array(cell_rows)
+        self.cell_columns = np.array(cell_columns)
+        self.piece_heights = np.array(piece_heights)
+
+
+class VectorizedGames:
+    """
+    Plays many games of Tetris at once. The boards of all the games are held in one array with the shape
+    (games, height + 4, width), and every step drops one piece in each of the live games: all the reachable boards are
+    created and scored with array operations, and each game takes its best one. A game can have its own genome and its
+    own piece sequence. Games are played the same way as TetrisBot.play_game() plays them, so a game with the same
+    genome and pieces gets the same score
+    """
+    def __init__(self, height, width, lookahead=True, chunk_size=64):
+        """
+        :param height: The boards' height
+        :param width: The boards' width
+        :param lookahead: Should the bots look at the next piece when considering the best move?
+        :param chunk_size: The number of games whose reachable boards are created together. With lookahead, each game
+        has about (4 * width) ** 2 of them, so this bounds the memory used by a step
+        """
+        self.height = height
+        self.width = width
+        self.rows = height + 4
+        self.lookahead = lookahead
+        self.chunk_size = chunk_size
+        pf = PieceFactory(width)
+        self.tables = [PlacementTable(pf, pid) for pid in range(pf.num_pieces)]
+
+    def play(self, genomes, pieces=None, max_pieces=None):
+        """
+        Plays one game for each genome
+        :param genomes: The genome of each game
+        :param pieces: The piece sequence of each game (PieceSequence). If it is None, each game gets a random one
+        :param max_pieces: The maximum number of pieces of each game (a list, with None for no limit), or one maximum
+        for all of them
+        :return: A list with the number of pieces dropped in each game
+        """
+        num_games = len(genomes)
+        if pieces is None:
+            pieces = [PieceSequence() for _ in range(num_games)]
+        if not isinstance(max_pieces, (list, tuple)):
+            max_pieces = [max_pieces] * num_games
+        limits = np.array([np.inf if limit is None else limit for limit in max_pieces])
+        weights = np.array(genomes, dtype=np.float64)
+        boards = np.zeros((num_games, self.rows, self.width), dtype=bool)
+        curr_pids = np.array([sequence.next_piece() for sequence in pieces])
+        next_pids = np.array([sequence.next_piece() for sequence in pieces])
+        counters = np.zeros(num_games, dtype=np.int64)
+        alive = counters < limits
+
+        while alive.any():
+            live = np.nonzero(alive)[0]
+            counters[live] += 1
+            moved = np.zeros(num_games, dtype=bool)
+            for start in range(0, len(live), self.chunk_size):
+                chunk = live[start:start + self.chunk_size]
+                self.step(boards, weights, curr_pids, next_pids, chunk, moved)
+            alive &= moved
+            for game in np.nonzero(alive)[0]:
+                curr_pids[game] = next_pids[game]
+                next_pids[game] = pieces[game].next_piece()
+            alive &= counters < limits
+        return counters.tolist()
+
+    def step(self, boards, weights, curr_pids, next_pids, games, moved):
+        """
+        Drops the current piece of each of the given games in its best position
+        :param boards: The boards of all the games (changed in place)
+        :param weights: The weights of all the games
+        :param curr_pids: The current piece of each game
+        :param next_pids: The next piece of each game
+        :param games: The indexes of the games to play
+        :param moved: An array which is set to True for the games that had a move (the others are over)
+        """
+        for pid in range(len(self.tables)):
+            group = games[curr_pids[games] == pid]
+            if len(group) == 0:
+                continue
+            results, valid = self.place(boards[group], pid)
+            if self.lookahead:
+                scores = np.full(valid.shape, - np.inf)
+                # The score of a move is the best score of the next piece's drops after it
+                for npid in range(len(self.tables)):
+                    sub = np.nonzero(next_pids[group] == npid)[0]
+                    if len(sub) == 0:
+                        continue
+                    num_moves = results.shape[1]
+                    next_results, next_valid = self.place(results[sub].reshape(-1, self.rows, self.width), npid)
+                    next_scores = self.score(next_results, np.repeat(weights[group[sub]], num_moves, axis=0))
+                    next_scores[~next_valid] = - np.inf
+                    scores[sub] = next_scores.max(axis=1).reshape(len(sub), num_moves)
+            else:
+                scores = self.score(results, weights[group])
+            scores[~valid] = - np.inf
+            # argmax takes the first of the best moves, same as TetrisBot
+            best = scores.argmax(axis=1)
+            has_move = np.isfinite(scores[np.arange(len(group)), best])
+            boards[group[has_move]] = results[np.nonzero(has_move)[0], best[has_move]]
+            moved[group[has_move]] = True
+
+    def place(self, boards, pid):
+        """
+        Drops a piece in every possible position of every board
+        :param boards: An array of boards with the shape (boards, rows, width)
+        :param pid: Piece ID in range [0,6]
+        :return: The resulting boards with the shape (boards, moves, rows, width), and an array with the shape
+        (boards, moves) which is False where the drop ends the game (those boards are meaningless)
+        """
+        table = self.tables[pid]
+        num_boards = len(boards)
+        num_moves = len(table.moves)
+        has_blocks = boards.any(axis=1)
+        heights = np.where(has_blocks, self.rows - boards.argmax(axis=1), 0)
+        # The level (counted from the lowest line) the lowest row of the piece lands on, same as tetris.apply_piece()
+        levels = np.maximum((heights[:, table.columns] - table.bottom_contours).max(axis=2), 0)
+        row_offsets = self.rows - 1 - levels
+        valid = row_offsets - table.piece_heights >= 3
+
+        results = np.repeat(boards[:, None], num_moves, axis=1)
+        cell_rows = np.where(valid[:, :, None], row_offsets[:, :, None] - table.cell_rows, 0)
+        results[np.arange(num_boards)[:, None, None], np.arange(num_moves)[None, :, None], cell_rows,
+                table.cell_columns[None]] = True
+        self.clear_lines(results.reshape(-1, self.rows, self.width))
+        return results, valid
+
+    def clear_lines(self, boards):
+        """
+        Clears the full lines of the boards, and moves the lines above them down
+        :param boards: An array of boards with the shape (boards, rows, width) (changed in place)
+        """
+        full = boards.all(axis=2)
+        with_full = np.nonzero(full.any(axis=1))[0]
+        if len(with_full) == 0:
+            return
+        full = full[with_full]
+        # A stable sort puts the full lines at the top and keeps the order of the others
+        order = np.argsort(~full, axis=1, kind='stable')
+        cleared = np.take_along_axis(boards[with_full], order[:, :, None], axis=1)
+        cleared[np.arange(self.rows)[None, :] < full.sum(axis=1)[:, None]] = False
+        boards[with_full] = cleared
+
+    def score(self, results, weights):
+        """
+        Scores the boards of many games. Like bot.batch_evaluation.batch_scores(), the products are accumulated one
+        feature at a time, so the scores are exactly the same as TetrisBot.eval_board()
+        :param results: An array of boards with the shape (games, moves, rows, width)
+        :param weights: The weights of each game, with the shape (games, features)
+        :return: The scores with the shape (games, moves)
+        """
+        num_games, num_moves = results.shape[:2]
+        features = batch_features(results.reshape(-1, self.rows, self.width)).reshape(num_games, num_moves, -1)
+        features = features.astype(np.float64)
+        scores = np.zeros((num_games, num_moves))
+        for i in range(weights.shape[1]):
+            scores += weights[:, i, None] * features[:, :, i]
+        return scores
@@ -0,0 +1,31 @@
+import os
+import pickle
+
+CHECKPOINT_VERSION = 1
+
+
+def save_checkpoint(path, state):
+    """
+    Saves a checkpoint of a run. The file is replaced only after the new checkpoint was fully written to the disk, so a
+    run which is stopped while saving still has its previous checkpoint
+    :param path: The path of the checkpoint file
+    :param state: A dictionary with the state of the run (see EvolutionEnv.save_checkpoint())
+    """
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as f:
+        pickle.dump((CHECKPOINT_VERSION, state), f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def load_checkpoint(path):
+    """
+    :param path: The path of the checkpoint file
+    :return: The state of the run which was saved by save_checkpoint()
+    """
+    with open(path, 'rb') as f:
+        version, state = pickle.load(f)
+    if version != CHECKPOINT_VERSION:
+        raise ValueError(f'Unsupported checkpoint version: {version}')
+    return state
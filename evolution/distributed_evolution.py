@@ -0,0 +1,383 @@
+import collections
+import multiprocessing
+import multiprocessing as mp
+import queue
+import random
+import socket
+import threading
+import time
+
+from bot.tetris_bot import TetrisBot
+from evolution.evolution import EvolutionEnv
+from evolution.messages import read_message, write_message
+from tetris_env.piece_sequence import PieceSequence
+
+
+class WorkerConnection:
+    """
+    The coordinator's side of a connection with a worker
+    """
+    def __init__(self, connection, address):
+        """
+        :param connection: The worker's socket
+        :param address: The worker's address
+        """
+        self.connection = connection
+        self.address = address
+        self.send_lock = threading.Lock()
+        self.last_seen = time.monotonic()
+        # Is the worker waiting for jobs?
+        self.ready = False
+        # The IDs of the jobs the worker is playing
+        self.assigned = set()
+
+    def send(self, message):
+        with self.send_lock:
+            write_message(self.connection, message)
+
+    def disconnect(self):
+        """
+        Shuts the connection down, which ends the worker's handler thread
+        """
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class Coordinator:
+    """
+    Hands out games to workers which connect to it over TCP, possibly from other machines (see run_worker()).
+    A job is all the games of one genome that have to be played: the genome, the bot's settings (including the board's
+    size), the maximum number of pieces and the seed of every game. Workers stream back the score of every game as soon
+    as it ends. Small jobs are batched, so a worker gets at least batch_size games per round trip.
+    Workers send heartbeats while they play. A worker that was not heard from for heartbeat_timeout seconds, or whose
+    connection is lost, is dropped, and the games of its jobs that did not end are handed to other workers
+    """
+    def __init__(self, host='127.0.0.1', port=47500, batch_size=8, heartbeat_timeout=30):
+        """
+        :param host: The address to listen on. By default only workers on this machine can connect. The protocol is not
+        authenticated, so listening on other addresses (such as '0.0.0.0', for workers on other machines) should only
+        be done on a trusted network
+        :param port: The port to listen on
+        :param batch_size: The minimum number of games sent to a worker at once (as long as there are enough games)
+        :param heartbeat_timeout: Number of seconds after which a silent worker is considered dead
+        """
+        self.address = (host, port)
+        self.batch_size = batch_size
+        self.heartbeat_timeout = heartbeat_timeout
+        self.lock = threading.Lock()
+        # The IDs of the jobs which wait for a worker
+        self.pending = collections.deque()
+        # The unfinished jobs by their ID, with the genome index they belong to. A job's games are only the ones which
+        # did not end yet
+        self.jobs = {}
+        self.results = queue.Queue()
+        self.workers = set()
+        self.next_id = 0
+        self.server = None
+
+    def start(self):
+        """
+        Starts accepting workers
+        """
+        self.server = socket.create_server(self.address)
+        threading.Thread(target=self.accept_workers, daemon=True).start()
+        threading.Thread(target=self.monitor_workers, daemon=True).start()
+
+    def stop(self):
+        """
+        Tells the workers to stop, and stops accepting new ones
+        """
+        server, self.server = self.server, None
+        if server is not None:
+            server.close()
+        with self.lock:
+            workers = list(self.workers)
+        for worker in workers:
+            try:
+                worker.send({'type': 'stop'})
+            except OSError:
+                pass
+            worker.disconnect()
+
+    def accept_workers(self):
+        server = self.server
+        while True:
+            try:
+                connection, address = server.accept()
+            except OSError:
+                return
+            worker = WorkerConnection(connection, address)
+            with self.lock:
+                self.workers.add(worker)
+            threading.Thread(target=self.handle_worker, args=(worker,), daemon=True).start()
+
+    def handle_worker(self, worker):
+        """
+        Handles the messages of a worker until its connection ends
+        :param worker: The worker's connection
+        """
+        try:
+            while True:
+                message = read_message(worker.connection)
+                if message is None:
+                    break
+                worker.last_seen = time.monotonic()
+                if message['type'] == 'ready':
+                    with self.lock:
+                        worker.ready = True
+                    self.dispatch()
+                elif message['type'] == 'score':
+                    self.record_score(worker, message['job'], message['game'], message['score'])
+        except OSError:
+            pass
+        finally:
+            self.remove_worker(worker)
+
+    def monitor_workers(self):
+        """
+        Drops workers whose heartbeats stopped
+        """
+        while self.server is not None:
+            time.sleep(self.heartbeat_timeout / 4)
+            now = time.monotonic()
+            with self.lock:
+                silent = [worker for worker in self.workers if now - worker.last_seen > self.heartbeat_timeout]
+            for worker in silent:
+                worker.disconnect()
+
+    def remove_worker(self, worker):
+        """
+        Drops a worker, and puts its unfinished jobs back at the front of the queue
+        :param worker: The worker's connection
+        """
+        with self.lock:
+            self.workers.discard(worker)
+            for job_id in worker.assigned:
+                if job_id in self.jobs:
+                    self.pending.appendleft(job_id)
+            worker.assigned.clear()
+            worker.ready = False
+        worker.connection.close()
+        self.dispatch()
+
+    def dispatch(self):
+        """
+        Sends the pending jobs to the workers which are waiting for jobs
+        """
+        messages = []
+        with self.lock:
+            for worker in self.workers:
+                if not self.pending:
+                    break
+                if not worker.ready:
+                    continue
+                jobs = []
+                num_games = 0
+                while self.pending and num_games < self.batch_size:
+                    job_id = self.pending.popleft()
+                    _, job = self.jobs[job_id]
+                    jobs.append(dict(job, games=list(job['games'])))
+                    num_games += len(job['games'])
+                    worker.assigned.add(job_id)
+                worker.ready = False
+                messages.append((worker, {'type': 'jobs', 'jobs': jobs}))
+        for worker, message in messages:
+            try:
+                worker.send(message)
+            except OSError:
+                # The worker's handler will notice the connection is lost and requeue the jobs
+                worker.disconnect()
+
+    def record_score(self, worker, job_id, j, score):
+        """
+        Records the score of a game
+        :param worker: The connection of the worker which played the game
+        :param job_id: The ID of the game's job
+        :param j: The game index
+        :param score: The game's score
+        """
+        with self.lock:
+            if job_id not in self.jobs:
+                return
+            i, job = self.jobs[job_id]
+            remaining = [game for game in job['games'] if game[0] != j]
+            # A game which was already scored (by a worker that was considered dead) is not recorded twice
+            if len(remaining) == len(job['games']):
+                return
+            job['games'] = remaining
+            if not remaining:
+                del self.jobs[job_id]
+                worker.assigned.discard(job_id)
+        self.results.put((i, j, score))
+
+    def play_games(self, games, settings):
+        """
+        Plays games on the workers. It waits for workers to connect if there are none
+        :param games: A list of (genome index, game index, genome, max pieces, seed) tuples, same as in
+        EvolutionEnv.play_games(). The seeds must not be None
+        :param settings: A dictionary with the keyword arguments for TetrisBot (other than the genome)
+        :return: An iterable of (genome index, game index, game score) tuples, in the order the games end
+        """
+        genome_jobs = {}
+        for i, j, g, max_pieces, seed in games:
+            if i not in genome_jobs:
+                genome_jobs[i] = {'genome': list(g), 'settings': settings, 'max_pieces': max_pieces, 'games': []}
+            genome_jobs[i]['games'].append([j, seed])
+        with self.lock:
+            for i, job in genome_jobs.items():
+                job['id'] = self.next_id
+                self.jobs[self.next_id] = (i, job)
+                self.pending.append(self.next_id)
+                self.next_id += 1
+        self.dispatch()
+        for _ in range(len(games)):
+            yield self.results.get()
+
+
+def connect(host, port, timeout):
+    """
+    Connects to the coordinator, retrying until it accepts the connection
+    :param host: The coordinator's host
+    :param port: The coordinator's port
+    :param timeout: Number of seconds to keep retrying
+    :return: The socket
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return socket.create_connection((host, port))
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(1)
+
+
+def run_worker(host, port, heartbeat_interval=5, connect_timeout=60):
+    """
+    Plays the games handed out by a coordinator, until the coordinator stops or the connection is lost
+    :param host: The coordinator's host
+    :param port: The coordinator's port
+    :param heartbeat_interval: Number of seconds between heartbeats. It should be well below the coordinator's
+    heartbeat_timeout
+    :param connect_timeout: Number of seconds to wait for the coordinator to start
+    """
+    connection = connect(host, port, connect_timeout)
+    send_lock = threading.Lock()
+    stopped = threading.Event()
+
+    def send(message):
+        with send_lock:
+            write_message(connection, message)
+
+    def send_heartbeats():
+        while not stopped.wait(heartbeat_interval):
+            try:
+                send({'type': 'heartbeat'})
+            except OSError:
+                return
+
+    threading.Thread(target=send_heartbeats, daemon=True).start()
+    try:
+        send({'type': 'ready'})
+        while True:
+            message = read_message(connection)
+            if message is None or message['type'] == 'stop':
+                return
+            for job in message['jobs']:
+                for j, seed in job['games']:
+                    bot = TetrisBot(genome=job['genome'], **job['settings'])
+                    game_score = bot.play_game(with_print=False, max_pieces=job['max_pieces'],
+                                               pieces=PieceSequence(seed))
+                    send({'type': 'score', 'job': job['id'], 'game': j, 'score': game_score})
+            send({'type': 'ready'})
+    except OSError:
+        pass
+    finally:
+        stopped.set()
+        connection.close()
+
+
+def run_workers(host, port, num_processes=-1, **kwargs):
+    """
+    Runs several workers on this machine, each in its own process
+    :param host: The coordinator's host
+    :param port: The coordinator's port
+    :param num_processes: The number of workers. If it is not set, it will be equal to the number of cores
+    :param kwargs: Any other keyword argument of run_worker()
+    """
+    num_processes = multiprocessing.cpu_count() if num_processes == -1 else num_processes
+    processes = [mp.Process(target=run_worker, args=(host, port), kwargs=kwargs) for _ in range(num_processes)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+class DistributedEvolutionEnv(EvolutionEnv):
+    """
+    An evolution environment which plays its games on workers that connect to it, possibly from other machines.
+    Workers are started with run_worker() or run_workers(), and can join or leave at any time during the run
+    """
+    def __init__(self, pop_size=100, generations=40, p_mutation=0.2, p_crossover=1, k_tournament=3, g_size=7,
+                 init_low_lim=-100, init_high_lim=100, games_per_fitness=5, board_height=12, board_width=6,
+                 with_logging=True, with_printing=True, host='127.0.0.1', port=47500, batch_size=8,
+                 heartbeat_timeout=30, **kwargs):
+        """
+        :param host: The address the coordinator listens on (see Coordinator). It has to be set explicitly for workers
+        on other machines to connect
+        :param port: The port the coordinator listens on
+        :param batch_size: The minimum number of games sent to a worker at once
+        :param heartbeat_timeout: Number of seconds after which a silent worker is considered dead, and its games are
+        handed to other workers
+        :param kwargs: Any other keyword argument of EvolutionEnv, other than vectorized (the games are spread over the
+        workers instead)
+        :raise ValueError: If vectorized is set
+        """
+        if kwargs.get('vectorized'):
+            raise ValueError('DistributedEvolutionEnv does not support vectorized games')
+        super().__init__(pop_size, generations, p_mutation, p_crossover, k_tournament, g_size, init_low_lim,
+                         init_high_lim, games_per_fitness, board_height, board_width, with_logging, with_printing,
+                         **kwargs)
+        self.coordinator = Coordinator(host, port, batch_size, heartbeat_timeout)
+        self.coordinator_started = False
+
+    def close(self):
+        # The coordinator keeps its workers for the entire run, and tells them to stop when it ends
+        self.stop_coordinator()
+        super().close()
+
+    def get_coordinator(self):
+        """
+        :return: The coordinator. It is started on the first call
+        """
+        if not self.coordinator_started:
+            self.coordinator.start()
+            self.coordinator_started = True
+        return self.coordinator
+
+    def stop_coordinator(self):
+        """
+        Stops the coordinator, if it was started
+        """
+        if self.coordinator_started:
+            self.coordinator.stop()
+            self.coordinator_started = False
+
+    def play_games(self, games):
+        # Same as in ParallelEvolutionEnv, games of a run without a seed get a random one
+        tasks = [(i, j, g, max_pieces, seed if seed is not None else random.getrandbits(64))
+                 for i, j, g, max_pieces, seed in games]
+        settings = {'height': self.board_height, 'width': self.board_width, 'engine': self.engine,
+                    'evaluator': self.evaluator, 'beam_width': self.beam_width}
+        genomes = {i: g for i, _, g, _, _ in games}
+        remaining = collections.Counter(i for i, _, _, _, _ in games)
+        for i, j, game_score in self.get_coordinator().play_games(tasks, settings):
+            if self.telemetry:
+                # The games' durations are not reported by the workers
+                self.record_game(game_score, None)
+            remaining[i] -= 1
+            if self.with_printing and remaining[i] == 0:
+                print(f'{["%.2f" % elem for elem in genomes[i]]} finished')
+            yield i, j, game_score
@@ -1,9 +1,21 @@
+import json
 import logging
 import math
+import os
 import random
+import time
 from datetime import datetime
 
+import numpy as np
+
+from bot import instrumentation
 from bot.tetris_bot import TetrisBot
+from bot.vectorized_games import VectorizedGames
+from evolution.checkpoint import load_checkpoint, save_checkpoint
+from evolution.fitness_cache import FitnessCache
+from evolution.run_log import RunLogWriter
+from evolution.surrogate import SurrogateModel, prediction_error
+from tetris_env.piece_sequence import PieceSequence, game_seed
 
 
 class EvolutionEnv:
@@ -13,7 +25,12 @@ class EvolutionEnv:
 
     def __init__(self, pop_size=100, generations=40, p_mutation=0.2, p_crossover=1, k_tournament=3, g_size=7,
                  init_low_lim=-100, init_high_lim=100, games_per_fitness=5, board_height=12, board_width=6,
-                 with_logging=True, with_printing=True):
+                 with_logging=True, with_printing=True, engine='list', evaluator='scalar', beam_width=None,
+                 racing=False, racing_min_games=3, racing_z=1.96, racing_min_cv=0.5, racing_min_selections=0.5,
+                 racing_elite_selections=2, max_pieces=None, seed=None, common_random_numbers=False, cache_size=0,
+                 cache_path=None, vectorized=False, vector_chunk_size=64, log_path=None, log_format='text',
+                 checkpoint_path=None, checkpoint_interval=1, telemetry=False, surrogate=None, surrogate_fraction=0.3,
+                 surrogate_games=1, surrogate_min_samples=50, surrogate_min_correlation=0.3, generation_callback=None):
         """
         :param pop_size: Population size
         :param generations: Number of generations
@@ -28,6 +45,62 @@ class EvolutionEnv:
         :param board_width: Board's width
         :param with_logging: Should we log the run
         :param with_printing: Print info to screen (not same info as logging)
+        :param engine: The game engine the bots use (see bot.tetris_bot.ENGINES)
+        :param evaluator: How the bots score boards, 'scalar' or 'numpy' (see TetrisBot)
+        :param beam_width: The number of drops of the current piece the bots expand when looking ahead (see TetrisBot)
+        :param racing: Should the games be played in rounds, with genomes which are clearly decided getting fewer games
+        (see race())
+        :param racing_min_games: Number of games every genome plays before racing can decide anything about it (at
+        least 2)
+        :param racing_z: The z-score of the confidence intervals of the genomes' fitnesses when racing. The intervals
+        use the matching quantile of Student's t-distribution, since they are calculated from a few games
+        :param racing_min_cv: The smallest coefficient of variation (standard deviation relative to the mean) assumed
+        for a genome's games when racing, so a genome whose few games happen to have close scores does not get a narrow
+        interval. Games' lengths are roughly geometric, so their standard deviation is close to their mean
+        :param racing_min_selections: Genomes which are sure to rank below the first genome that is expected to win
+        fewer tournaments than this stop playing games when racing
+        :param racing_elite_selections: Genomes which are sure to rank above everyone that is expected to win fewer
+        tournaments than this are elite. When racing, their next games are limited to max_pieces
+        :param max_pieces: The maximum number of pieces in an elite genome's game. Longer games are stopped and scored
+        as max_pieces, which is only a lower bound of their length, so an elite genome is never ranked below the genomes
+        it was ahead of (see rank_elite()). If it is None, games are not limited
+        :param seed: The seed of the run. If it is set, the evolutionary operators use their own random generator, and
+        the pieces of every game are generated from a seed derived from (seed, generation, game index, genome index), so
+        the run can be repeated exactly no matter how the games are distributed. If it is None, the random module is
+        used as is
+        :param common_random_numbers: If it is set (along with seed), the genome index is left out of the games' seeds,
+        so all the genomes of a generation play the same piece sequences
+        :param cache_size: The maximum number of evaluations kept in the fitness cache. Genomes whose evaluation is in
+        the cache (same genome, board, games' seeds and search settings, see fitness_key()) are not played again. 0
+        disables the cache. In a seeded run with the cache, the games' seeds are derived from (seed, game index, genome
+        values) instead, or from (seed, game index) with common_random_numbers, so a genome which survives unchanged
+        plays the same games in every generation and its evaluation is reused. In a run without a seed, a cached fitness
+        is a single noisy sample, which the genome keeps for as long as it survives instead of being sampled again
+        :param cache_path: A file to save the fitness cache to after every generation, and load it from at the start
+        :param vectorized: Should all the games that are played together be played in lockstep with
+        bot.vectorized_games.VectorizedGames, instead of one by one? (engine, evaluator and beam_width do not apply to
+        it, and it always looks ahead)
+        :param vector_chunk_size: The number of games whose moves are created together when vectorized
+        :param log_path: The path of the log file. If it is None, the log is named after the time the run started
+        :param log_format: 'text' to log everything as text lines, or 'binary' to log generations, genomes and games
+        into a compact binary run log (see evolution.run_log), without the other records
+        :param checkpoint_path: A file to save the state of the run to. If it exists when evolve() starts, the run
+        resumes from it (see resume())
+        :param checkpoint_interval: Number of generations between checkpoints
+        :param telemetry: Should the games be instrumented (see bot.instrumentation), and their throughput, the
+        workers' utilization and the tail of the games' lengths be logged after every generation? (see
+        finish_telemetry())
+        :param surrogate: The kind of the surrogate model which screens the genomes before their games are played,
+        'knn' or 'ridge' (see evolution.surrogate.SurrogateModel), or None for no screening (see screen())
+        :param surrogate_fraction: The part of the genomes to be evaluated which is screened out
+        :param surrogate_games: Number of games played by a genome which was screened out (at least 1). The fitness of
+        a screened genome is the mean of these games, but no higher than the worst fitness of the genomes which played
+        all their games, so a lucky game cannot make it win tournaments against them
+        :param surrogate_min_samples: Number of genomes the surrogate has to be trained on before it screens genomes
+        :param surrogate_min_correlation: The surrogate only screens genomes if the rank correlation of its predictions
+        and the fitnesses of the previous generation was at least this
+        :param generation_callback: A function which is called with the summary of every generation (see
+        summarize_generation()) once its fitnesses are calculated
         """
         self.pop_size = pop_size
         self.generations = generations
@@ -40,8 +113,47 @@ class EvolutionEnv:
         self.board_width = board_width
         self.with_logging = with_logging
         self.with_printing = with_printing
+        self.log_path = log_path
+        self.log_format = log_format
+        self.run_log = None
+        self.log_handler = None
+        self.engine = engine
+        self.evaluator = evaluator
+        self.beam_width = beam_width
+        self.racing = racing
+        if racing and racing_min_games < 2:
+            raise ValueError('racing_min_games must be at least 2, so the variance of the games can be estimated')
+        self.racing_min_games = racing_min_games
+        self.racing_z = racing_z
+        self.racing_min_cv = racing_min_cv
+        self.racing_min_selections = racing_min_selections
+        self.racing_elite_selections = racing_elite_selections
+        self.max_pieces = max_pieces
+        self.seed = seed
+        self.common_random_numbers = common_random_numbers
+        self.rng = random if seed is None else random.Random(seed)
+        self.generation = 0
+        self.vectorized = vectorized
+        self.vector_chunk_size = vector_chunk_size
+        self.cache = FitnessCache(cache_size, cache_path) if cache_size > 0 else None
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self.telemetry = telemetry
+        # The (game score, duration) of every game of the generation, and the instrumentation of the games
+        self.game_stats = []
+        self.game_instrumentation = ({}, {})
+        self.telemetry_start = 0
+        self.surrogate = SurrogateModel(surrogate) if surrogate is not None else None
+        self.surrogate_fraction = surrogate_fraction
+        self.surrogate_games = max(surrogate_games, 1)
+        self.surrogate_min_samples = surrogate_min_samples
+        self.surrogate_min_correlation = surrogate_min_correlation
+        # The rank correlation of the surrogate's predictions of the last generation, or None if it did not predict
+        self.surrogate_correlation = None
+        self.generation_callback = generation_callback
+        self.generation_start = time.perf_counter()
         self.logger = self.init_logging()
-        self.population = [[random.randint(init_low_lim, init_high_lim) for _ in range(g_size)] for _ in
+        self.population = [[self.rng.randint(init_low_lim, init_high_lim) for _ in range(g_size)] for _ in
                            range(pop_size)]
         self.fitnesses = []
 
@@ -49,45 +161,534 @@ class EvolutionEnv:
         logging.basicConfig(level=logging.DEBUG)
         logger = logging.getLogger(__name__)
         logger.propagate = False
+        # basicConfig() does nothing if the application configured logging before, so the level is set here too
+        logger.setLevel(logging.DEBUG)
 
         if self.with_logging:
-            file_name = f'logs\\Run Log {datetime.now().strftime("%Y %m %d %H %M %S")}.log'
+            file_name = self.log_path
+            if file_name is None:
+                extension = 'bin' if self.log_format == 'binary' else 'log'
+                file_name = os.path.join('logs', f'Run Log {datetime.now().strftime("%Y %m %d %H %M %S")}.{extension}')
+            if self.log_format == 'binary':
+                self.run_log = RunLogWriter(file_name, self.g_size)
+                return logger
             f_handler = logging.FileHandler(file_name)
             f_handler.setLevel(logging.DEBUG)
             l_format = logging.Formatter('%(message)s')
             f_handler.setFormatter(l_format)
             logger.addHandler(f_handler)
+            self.log_handler = f_handler
         return logger
 
     def evolve(self):
         """
         Performs the evolutionary algorithm
         """
-        for i in range(self.generations):
-            self.logger.debug(f'Generation {i}')
-            if self.with_printing:
-                print(f'Generation {i}')
-            self.calc_pop_fitness()
-            new_population = []
-            for _ in range(self.pop_size // 2):
-                # Select parents
-                p1 = self.tournament()
-                p2 = self.tournament()
-                # Create children
-                c1, c2 = self.crossover(p1, p2)
-                # Mutate and add children
-                new_population.append(self.mutation(c1))
-                new_population.append(self.mutation(c2))
-            self.population = new_population
+        try:
+            for i in range(self.resume(), self.generations):
+                self.start_generation(i)
+                self.calc_pop_fitness()
+                if self.checkpoint_path is not None and (i + 1) % self.checkpoint_interval == 0:
+                    self.save_checkpoint()
+                self.population = self.breed()
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Releases the run's resources once it ends. Subclasses which hold more resources (such as worker processes)
+        release them too
+        """
+        # A run which stopped in the middle of a generation leaves the instrumentation enabled
+        instrumentation.disable()
+        self.close_logs()
+
+    def close_logs(self):
+        """
+        Closes the run's log file once the run ends. The text log's handler is removed from the logger, which is shared
+        by all the environments in the process, so later runs do not write into this run's log
+        """
+        if self.run_log is not None:
+            self.run_log.close()
+            self.run_log = None
+        if self.log_handler is not None:
+            self.logger.removeHandler(self.log_handler)
+            self.log_handler.close()
+            self.log_handler = None
+
+    def checkpoint_config(self):
+        """
+        :return: The settings a run has to keep when it is resumed from a checkpoint
+        """
+        return {'pop_size': self.pop_size, 'p_mutation': self.p_mutation, 'p_crossover': self.p_crossover,
+                'k_tournament': self.k, 'g_size': self.g_size, 'games_per_fitness': self.games_per_fitness,
+                'board_height': self.board_height, 'board_width': self.board_width, 'engine': self.engine,
+                'evaluator': self.evaluator, 'beam_width': self.beam_width, 'racing': self.racing,
+                'max_pieces': self.max_pieces, 'seed': self.seed, 'common_random_numbers': self.common_random_numbers,
+                'vectorized': self.vectorized}
+
+    def save_checkpoint(self):
+        """
+        Saves the state of the run after the fitnesses of the current generation were calculated. The checkpoint only
+        holds the current generation, so its size does not grow during the run
+        """
+        state = {'generation': self.generation, 'population': self.population, 'fitnesses': self.fitnesses,
+                 'config': self.checkpoint_config(), 'rng_state': self.rng.getstate()}
+        if self.surrogate is not None:
+            state['surrogate'] = self.surrogate.state()
+            state['surrogate_correlation'] = self.surrogate_correlation
+        save_checkpoint(self.checkpoint_path, state)
+
+    def resume(self):
+        """
+        Loads the run's checkpoint, if there is one, and breeds the generation which follows it. The random state is
+        restored too, so a seeded run continues exactly as if it was never stopped. The number of generations may be
+        changed, but the other settings have to be the same
+        :return: The number of the first generation to run
+        """
+        if self.checkpoint_path is None or not os.path.exists(self.checkpoint_path):
+            return 0
+        state = load_checkpoint(self.checkpoint_path)
+        config = self.checkpoint_config()
+        changed = [key for key in config if state['config'].get(key) != config[key]]
+        if changed:
+            raise ValueError(f'The checkpoint {self.checkpoint_path} was saved with different settings: {changed}')
+        self.generation = state['generation']
+        self.population = state['population']
+        self.fitnesses = state['fitnesses']
+        self.rng.setstate(state['rng_state'])
+        if self.surrogate is not None and 'surrogate' in state:
+            self.surrogate.load_state(state['surrogate'])
+            self.surrogate_correlation = state['surrogate_correlation']
+        if self.with_printing:
+            print(f'Resuming after generation {self.generation}')
+        self.population = self.breed()
+        return self.generation + 1
+
+    def start_generation(self, i):
+        """
+        Marks the start of a generation
+        :param i: The generation number
+        """
+        self.generation = i
+        self.generation_start = time.perf_counter()
+        self.log_generation(i)
+        if self.with_printing:
+            print(f'Generation {i}')
+
+    def breed(self):
+        """
+        Creates the next generation from the current one, whose fitnesses were already calculated
+        :return: The new population
+        """
+        new_population = []
+        for _ in range(self.pop_size // 2):
+            # Select parents
+            p1 = self.tournament()
+            p2 = self.tournament()
+            # Create children
+            c1, c2 = self.crossover(p1, p2)
+            # Mutate and add children
+            new_population.append(self.mutation(c1))
+            new_population.append(self.mutation(c2))
+        return new_population
 
     def calc_pop_fitness(self):
         """
         Calculates the fitnesses of the entire population
         """
+        if self.telemetry:
+            self.start_telemetry()
+        scores = [[] for _ in range(self.pop_size)]
+        pending = list(range(self.pop_size))
+        duplicates = {}
+        if self.cache is not None:
+            # Genomes which were already evaluated are taken from the cache, and identical genomes in the population
+            # are only played once
+            keys = [self.fitness_key(i) for i in range(self.pop_size)]
+            first_with_key = {}
+            self.cache.reset_counters()
+            pending = []
+            for i in range(self.pop_size):
+                if keys[i] in first_with_key:
+                    duplicates[i] = first_with_key[keys[i]]
+                    self.cache.hits += 1
+                    continue
+                cached = self.cache.get(keys[i])
+                if cached is not None:
+                    scores[i] = cached
+                else:
+                    first_with_key[keys[i]] = i
+                    pending.append(i)
+
+        # The number of games of the genomes which were screened out by the surrogate
+        predictions = None
+        limits = {}
+        if self.surrogate is not None and pending and len(self.surrogate) >= self.surrogate_min_samples:
+            predictions = dict(zip(pending, self.surrogate.predict([self.population[i] for i in pending])))
+            limits = self.screen(pending, predictions)
+
+        elite = set()
+        if self.racing:
+            elite = self.race(scores, pending, limits)
+        else:
+            for i in pending:
+                scores[i] = [0] * limits.get(i, self.games_per_fitness)
+            games = [(i, j, self.population[i], None, self.game_seed(i, j)) for i in pending
+                     for j in range(limits.get(i, self.games_per_fitness))]
+            for i, j, game_score in self.play_games(games):
+                scores[i][j] = game_score
+
+        for i, first in duplicates.items():
+            scores[i] = scores[first][:]
+            if first in elite:
+                elite.add(i)
+        if self.cache is not None:
+            # Only full evaluations are cached, not ones that were cut short by racing
+            for i in pending:
+                if len(scores[i]) == self.games_per_fitness and self.max_pieces not in scores[i]:
+                    self.cache.put(keys[i], scores[i])
+            self.cache.save()
         self.fitnesses = []
         for i in range(self.pop_size):
-            print(f'Genome {i}')
-            self.fitnesses.append(self.calc_fitness(self.population[i]))
+            self.log_genome(self.population[i], scores[i])
+            self.fitnesses.append(sum(scores[i]) / len(scores[i]))
+        if self.cache is not None:
+            self.logger.debug(f'Cache: {self.cache.hits} hits, {self.cache.misses} misses')
+        if elite:
+            self.rank_elite(elite, limits)
+        if limits:
+            self.rank_screened(limits)
+        if self.surrogate is not None:
+            self.update_surrogate(pending, predictions, limits)
+        if self.telemetry:
+            self.log_telemetry(self.finish_telemetry())
+        if self.generation_callback is not None:
+            self.generation_callback(self.summarize_generation())
+
+    def summarize_generation(self):
+        """
+        :return: A dictionary with the generation number, the mean, best, worst and standard deviation of the
+        fitnesses, the best genome, and the time (in seconds) since the generation started
+        """
+        best = max(range(self.pop_size), key=lambda i: self.fitnesses[i])
+        return {'generation': self.generation, 'mean_fitness': float(np.mean(self.fitnesses)),
+                'max_fitness': float(self.fitnesses[best]), 'min_fitness': float(min(self.fitnesses)),
+                'std_fitness': float(np.std(self.fitnesses)), 'best_genome': [float(v) for v in self.population[best]],
+                'seconds': time.perf_counter() - self.generation_start}
+
+    def start_telemetry(self):
+        """
+        Starts collecting the telemetry of a generation
+        """
+        instrumentation.enable()
+        instrumentation.reset()
+        self.game_stats = []
+        self.game_instrumentation = ({}, {})
+        self.telemetry_start = time.perf_counter()
+
+    def record_game(self, game_score, duration, game_instrumentation=None):
+        """
+        Adds a game to the telemetry of the generation. play_games() calls it for every game when telemetry is on
+        :param game_score: The game's score
+        :param duration: The time (in seconds) the game took to play, or None if it is not known
+        :param game_instrumentation: The instrumentation snapshot of the game, if it was played in another process
+        """
+        self.game_stats.append((game_score, duration))
+        if game_instrumentation is not None:
+            instrumentation.merge(self.game_instrumentation, game_instrumentation)
+
+    def telemetry_workers(self):
+        """
+        :return: The number of workers that play the games (for their utilization)
+        """
+        return 1
+
+    def finish_telemetry(self):
+        """
+        Summarizes the telemetry of the generation, and disables the instrumentation until the next generation, so the
+        code which runs between the generations (and any bot created afterwards in the process) is not instrumented
+        :return: A dictionary with the generation's wall time, number of games and pieces, pieces and games per second,
+        the workers' utilization (the part of their time spent on playing games), percentiles of the games' lengths,
+        and the instrumentation's counters and timers (summed over the workers)
+        """
+        seconds = time.perf_counter() - self.telemetry_start
+        instrumentation.disable()
+        instrumentation.merge(self.game_instrumentation, instrumentation.snapshot())
+        counters, timers = self.game_instrumentation
+        lengths = [game_score for game_score, _ in self.game_stats]
+        durations = [duration for _, duration in self.game_stats if duration is not None]
+        telemetry = {'generation': self.generation, 'seconds': seconds, 'games': len(lengths), 'pieces': sum(lengths),
+                     'pieces_per_second': sum(lengths) / seconds, 'games_per_second': len(lengths) / seconds}
+        if durations:
+            telemetry['worker_utilization'] = sum(durations) / (seconds * self.telemetry_workers())
+        if lengths:
+            p50, p90, p99 = np.percentile(lengths, [50, 90, 99])
+            telemetry['game_length'] = {'p50': p50, 'p90': p90, 'p99': p99, 'max': max(lengths)}
+        telemetry['counters'] = counters
+        telemetry['timers'] = timers
+        return telemetry
+
+    def screen(self, pending, predictions):
+        """
+        Chooses the genomes which the surrogate predicts to be the worst. They play only surrogate_games games instead
+        of games_per_fitness. Genomes are only screened if the surrogate ranked the previous generation well enough
+        :param pending: The indexes of the genomes which need to play their games
+        :param predictions: The surrogate's predicted fitness of each pending genome, by its index
+        :return: The number of games of every screened genome, by its index
+        """
+        if self.surrogate_correlation is None or self.surrogate_correlation < self.surrogate_min_correlation:
+            return {}
+        num_screened = int(len(pending) * self.surrogate_fraction)
+        return {i: self.surrogate_games for i in sorted(pending, key=lambda i: predictions[i])[:num_screened]}
+
+    def rank_elite(self, elite, limits):
+        """
+        Ranks the elite genomes of racing above the other genomes. Their games after they became elite were limited to
+        max_pieces, so their fitness is only a lower bound, and their own fitness is only kept if it is already higher
+        :param elite: The indexes of the elite genomes
+        :param limits: The number of games of every screened genome, by its index. Screened genomes are ranked by
+        rank_screened() instead
+        """
+        others = [self.fitnesses[i] for i in range(self.pop_size) if i not in elite and i not in limits]
+        if not others:
+            return
+        floor = max(others)
+        for i in elite:
+            if i not in limits:
+                self.fitnesses[i] = max(self.fitnesses[i], floor)
+
+    def rank_screened(self, limits):
+        """
+        Ranks the screened genomes below the genomes which played all their games. Their fitness comes from fewer games,
+        so its variance is higher, and their own fitness is only kept if it is already lower
+        :param limits: The number of games of every screened genome, by its index
+        """
+        evaluated = [self.fitnesses[i] for i in range(self.pop_size) if i not in limits]
+        if not evaluated:
+            return
+        floor = min(evaluated)
+        for i in limits:
+            self.fitnesses[i] = min(self.fitnesses[i], floor)
+
+    def update_surrogate(self, pending, predictions, limits):
+        """
+        Measures the surrogate's predictions against the fitnesses of the genomes which played all their games, logs
+        it, and trains the surrogate on these genomes. The screened genomes are left out of its training, since their
+        fitnesses come from fewer games and are capped (see rank_screened())
+        :param pending: The indexes of the genomes which played games
+        :param predictions: The surrogate's predictions, by the genomes' indexes (None if it did not predict)
+        :param limits: The number of games of every screened genome, by its index
+        """
+        stats = {'samples': len(self.surrogate), 'screened': len(limits),
+                 'games_saved': sum(self.games_per_fitness - games for games in limits.values())}
+        if predictions is not None:
+            evaluated = [i for i in pending if i not in limits]
+            error = prediction_error([predictions[i] for i in evaluated], [self.fitnesses[i] for i in evaluated])
+            self.surrogate_correlation = error['rank_correlation']
+            stats.update(error)
+        for i in pending:
+            if i not in limits:
+                self.surrogate.add(self.population[i], self.fitnesses[i])
+        self.log_surrogate(stats)
+
+    def fitness_key(self, i):
+        """
+        The key of a genome's evaluation in the fitness cache. Evaluations with the same key play the same games with
+        the same search, so a cache which is loaded from cache_path is not reused by a run whose bots play differently
+        :param i: The genome's index in the population
+        :return: A hashable key
+        """
+        seeds = None if self.seed is None else tuple(self.game_seed(i, j) for j in range(self.games_per_fitness))
+        # The bots always look ahead, and the beam width does not apply to vectorized games (the engine and the
+        # evaluator do not change the moves, so they are left out)
+        search = (('lookahead', True), ('beam_width', None if self.vectorized else self.beam_width))
+        return tuple(self.population[i]), self.board_height, self.board_width, seeds, search
+
+    def race(self, scores, pending, limits=None):
+        """
+        Plays the games in rounds of one game per genome, and stops giving games to genomes whose rank is already
+        clear. The tournament selection in evolve() holds pop_size tournaments, so the genome in rank r (0 is the best)
+        is expected to win pop_size * C(pop_size - 1 - r, k - 1) / C(pop_size, k) of them. After racing_min_games
+        rounds, a confidence interval is calculated for every genome's fitness:
+        - Genomes whose interval is entirely below the fitness of the best genome that is expected to win fewer than
+        racing_min_selections tournaments are hopeless. They stop playing, and keep the fitness of their games so far.
+        - Genomes whose interval is entirely above the intervals of all the genomes that are expected to win fewer than
+        racing_elite_selections tournaments are elite. Their next games are limited to max_pieces
+        The intervals use Student's t-distribution (see t_score()), and a variance of at least (racing_min_cv * mean)^2
+        :param scores: The scores of each genome's games. Genomes which are not pending already have all their scores
+        (from the cache) and take part in the ranking. The scores of the pending genomes are added to it
+        :param pending: The indexes of the genomes which need to play their games
+        :param limits: The maximum number of games of some of the genomes, by their index (see screen())
+        :return: The indexes of the elite genomes
+        """
+        limits = limits or {}
+        active = set(pending)
+        elite = set()
+        for j in range(self.games_per_fitness):
+            games = [(i, j, self.population[i], self.max_pieces if i in elite else None, self.game_seed(i, j))
+                     for i in sorted(active)]
+            for i, _, game_score in self.play_games(games):
+                scores[i].append(game_score)
+            active -= {i for i in active if limits.get(i, self.games_per_fitness) <= j + 1}
+            if j + 1 < self.racing_min_games:
+                continue
+            # Duplicates of other genomes have no scores yet, and are left out of the ranking
+            ranked = [i for i in range(self.pop_size) if scores[i]]
+            means = {i: sum(scores[i]) / len(scores[i]) for i in ranked}
+            half_widths = {i: self.half_width(scores[i]) for i in ranked}
+            ranked.sort(key=lambda x: means[x], reverse=True)
+            cutoff_rank = self.first_rank_below(self.racing_min_selections)
+            cutoff = means[ranked[cutoff_rank]] if cutoff_rank < len(ranked) else - math.inf
+            elite_rank = self.first_rank_below(self.racing_elite_selections)
+            elite_cutoff = max([means[i] + half_widths[i] for i in ranked[elite_rank:]], default=- math.inf)
+            for i in list(active):
+                if means[i] + half_widths[i] < cutoff:
+                    active.remove(i)
+                elif means[i] - half_widths[i] > elite_cutoff:
+                    elite.add(i)
+        return elite
+
+    def half_width(self, scores):
+        """
+        :param scores: The scores of a genome's games (at least 2)
+        :return: The half-width of the confidence interval of the genome's fitness when racing
+        """
+        mean = sum(scores) / len(scores)
+        variance = max(self.variance(scores), (self.racing_min_cv * mean) ** 2)
+        return self.t_score(self.racing_z, len(scores) - 1) * math.sqrt(variance / len(scores))
+
+    def first_rank_below(self, selections):
+        """
+        Finds the best rank which is expected to win fewer tournaments than the given number (see race())
+        :param selections: Expected number of tournaments won
+        :return: The rank (0 is the best), or pop_size if there is no such rank
+        """
+        total = math.comb(self.pop_size, self.k)
+        for rank in range(self.pop_size):
+            if self.pop_size * math.comb(self.pop_size - 1 - rank, self.k - 1) / total < selections:
+                return rank
+        return self.pop_size
+
+    @staticmethod
+    def t_score(z, df):
+        """
+        Converts a z-score to the quantile of Student's t-distribution with the same tail probability, with the
+        Cornish-Fisher expansion (its error is below 1% for df >= 2, and it underestimates the quantile for df = 1)
+        :param z: The z-score
+        :param df: The degrees of freedom
+        :return: The t-score
+        """
+        terms = ((z ** 3 + z) / 4,
+                 (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96,
+                 (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384,
+                 (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160)
+        return z + sum(term / df ** (power + 1) for power, term in enumerate(terms))
+
+    @staticmethod
+    def variance(scores):
+        """
+        :param scores: The scores of a genome's games
+        :return: The sample variance of the scores (0 if there is only one)
+        """
+        if len(scores) < 2:
+            return 0
+        mean = sum(scores) / len(scores)
+        return sum((score - mean) ** 2 for score in scores) / (len(scores) - 1)
+
+    def game_seed(self, i, j):
+        """
+        :param i: The genome's index in the population
+        :param j: The game index
+        :return: The seed of the game's pieces, or None if the run is not seeded
+        """
+        if self.seed is None:
+            return None
+        if self.cache is not None:
+            # The games do not depend on the generation or on the genome's index, so a genome plays the same games in
+            # every generation, and its evaluation can be taken from the cache
+            return game_seed(self.seed, None, j, None if self.common_random_numbers else tuple(self.population[i]))
+        return game_seed(self.seed, self.generation, j, None if self.common_random_numbers else i)
+
+    def play_games(self, games):
+        """
+        Plays the given games. Subclasses can override this to play the games in a different way
+        :param games: A list of (genome index, game index, genome, max pieces, seed) tuples
+        :return: An iterable of (genome index, game index, game score) tuples, in any order
+        """
+        if self.vectorized:
+            yield from self.play_games_vectorized(games)
+            return
+        for i, j, g, max_pieces, seed in games:
+            if j == 0:
+                print(f'Genome {i}')
+            start = time.perf_counter()
+            game_score = self.play_game(g, max_pieces, seed)
+            if self.telemetry:
+                self.record_game(game_score, time.perf_counter() - start)
+            yield i, j, game_score
+
+    def play_games_vectorized(self, games):
+        """
+        Plays all the given games together (see VectorizedGames)
+        :param games: A list of (genome index, game index, genome, max pieces, seed) tuples
+        :return: A list of (genome index, game index, game score) tuples
+        """
+        start = time.perf_counter()
+        vectorized_games = VectorizedGames(self.board_height, self.board_width, chunk_size=self.vector_chunk_size)
+        game_scores = vectorized_games.play([g for _, _, g, _, _ in games],
+                                            [PieceSequence(seed) for _, _, _, _, seed in games],
+                                            [max_pieces for _, _, _, max_pieces, _ in games])
+        if self.telemetry:
+            # The games are played together, so each one is considered to take an equal share of the time
+            duration = (time.perf_counter() - start) / len(games)
+            for game_score in game_scores:
+                self.record_game(game_score, duration)
+        return [(i, j, game_score) for (i, j, _, _, _), game_score in zip(games, game_scores)]
+
+    def log_generation(self, i):
+        """
+        Logs the start of a generation
+        :param i: The generation number
+        """
+        if self.run_log is not None:
+            self.run_log.write_generation(i)
+            return
+        self.logger.debug(f'Generation {i}')
+
+    def log_telemetry(self, telemetry):
+        """
+        Logs the telemetry of a generation. In a text log it is a 'Perf:' line with the telemetry as JSON
+        :param telemetry: The telemetry from finish_telemetry()
+        """
+        if self.run_log is not None:
+            self.run_log.write_telemetry(telemetry)
+            return
+        self.logger.debug(f'Perf: {json.dumps(telemetry)}')
+
+    def log_surrogate(self, stats):
+        """
+        Logs the surrogate's statistics of a generation. In a text log it is a 'Surrogate:' line with the statistics as
+        JSON, and in a binary run log it is a telemetry record with them under 'surrogate'
+        :param stats: The statistics from update_surrogate()
+        """
+        if self.run_log is not None:
+            self.run_log.write_telemetry({'generation': self.generation, 'surrogate': stats})
+            return
+        self.logger.debug(f'Surrogate: {json.dumps(stats)}')
+
+    def log_genome(self, g, scores):
+        """
+        Logs a genome and the scores of its games
+        :param g: The genome
+        :param scores: The scores of the genome's games
+        """
+        if self.run_log is not None:
+            self.run_log.write_genome(g, scores)
+            return
+        self.logger.debug(f'G: {g}')
+        for j in range(len(scores)):
+            self.logger.debug(f'T{j}: {scores[j]}')
 
     def tournament(self):
         """
@@ -96,7 +697,7 @@ class EvolutionEnv:
         """
         max_fitness = - math.inf
         best_indv = None
-        for i in random.sample(range(self.pop_size), self.k):
+        for i in self.rng.sample(range(self.pop_size), self.k):
             curr_fitness = self.fitnesses[i]
             if curr_fitness > max_fitness:
                 max_fitness = curr_fitness
@@ -110,8 +711,8 @@ class EvolutionEnv:
         :param g2: Parent 2
         :return: Two children
         """
-        if random.uniform(0, 1) < self.p_crossover:
-            i, j = sorted(random.sample(range(1, self.g_size - 1), 2))
+        if self.rng.uniform(0, 1) < self.p_crossover:
+            i, j = sorted(self.rng.sample(range(1, self.g_size - 1), 2))
             return g1[0:i] + g2[i:j] + g1[j:self.g_size], g2[0:i] + g1[i:j] + g2[j:self.g_size]
         else:
             return g1, g2
@@ -123,29 +724,31 @@ class EvolutionEnv:
         :return: The mutated genome
         """
         for i in range(self.g_size):
-            if random.uniform(0, 1) < self.p_mutation:
-                g[i] *= random.gauss(1, 0.5)
+            if self.rng.uniform(0, 1) < self.p_mutation:
+                g[i] *= self.rng.gauss(1, 0.5)
         return g
 
     def calc_fitness(self, g):
         """
-        Calculates the fitness of a given genome
+        Calculates the fitness of a given genome, outside of the population. Its games are played with random pieces
+        through play_games(), so they are played the same way as the population's games
         :param g: The individual/genome
         :return: The fitness value
         """
-        self.logger.debug(f'G: {g}')
-        score = 0
-        for i in range(self.games_per_fitness):
-            game_score = self.play_game(g)
-            self.logger.debug(f'T{i}: {game_score}')
-            score += game_score
-        return score / self.games_per_fitness
+        games = [(None, j, g, None, None) for j in range(self.games_per_fitness)]
+        scores = [game_score for _, _, game_score in sorted(self.play_games(games), key=lambda game: game[1])]
+        self.log_genome(g, scores)
+        return sum(scores) / len(scores)
 
-    def play_game(self, g):
+    def play_game(self, g, max_pieces=None, seed=None):
         """
         Plays a single game of Tetris given the genome
         :param g: The genome
+        :param max_pieces: The maximum number of pieces in the game (None for no limit)
+        :param seed: The seed of the game's pieces. If it is None, the pieces are drawn from the random module
         :return: The number of pieces dropped in the game
         """
-        bot = TetrisBot(self.board_height, self.board_width, g)
-        return bot.play_game(with_print=False)
+        bot = TetrisBot(self.board_height, self.board_width, g, engine=self.engine, evaluator=self.evaluator,
+                        beam_width=self.beam_width)
+        pieces = PieceSequence(seed) if seed is not None else None
+        return bot.play_game(with_print=False, max_pieces=max_pieces, pieces=pieces)
@@ -0,0 +1,67 @@
+import os
+import pickle
+from collections import OrderedDict
+
+
+class FitnessCache:
+    """
+    A bounded cache of the game scores of evaluated genomes. When it is full, the least recently used entry is evicted.
+    It can be saved to a file and loaded in the next run
+    """
+    def __init__(self, max_size=10000, path=None):
+        """
+        :param max_size: The maximum number of entries
+        :param path: The file the cache is saved to. If it exists, the cache is loaded from it
+        """
+        self.max_size = max_size
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as f:
+                self.entries = pickle.load(f)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def get(self, key):
+        """
+        :param key: The evaluation's key (see EvolutionEnv.fitness_key())
+        :return: The scores of the games, or None if they are not in the cache
+        """
+        scores = self.entries.get(key)
+        if scores is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return list(scores)
+
+    def put(self, key, scores):
+        """
+        Adds the scores of an evaluation to the cache
+        :param key: The evaluation's key (see EvolutionEnv.fitness_key())
+        :param scores: The scores of the games
+        """
+        self.entries[key] = tuple(scores)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def reset_counters(self):
+        """
+        Resets the hit and miss counters
+        """
+        self.hits = 0
+        self.misses = 0
+
+    def save(self):
+        """
+        Saves the cache to its file (if it has one). The file is replaced only after it was fully written
+        """
+        if self.path is None:
+            return
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump(self.entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,276 @@
+import multiprocessing as mp
+import os
+import queue
+import socket
+import threading
+from datetime import datetime
+
+from evolution.evolution import EvolutionEnv
+from evolution.messages import read_message, write_message
+
+
+class QueueTransport:
+    """
+    Moves migrants between islands which run on the same machine, through multiprocessing queues. The islands are
+    connected in a ring: each island sends its migrants to the next one
+    """
+    def __init__(self, inboxes, index):
+        """
+        :param inboxes: The queue of every island
+        :param index: The index of the island this transport belongs to
+        """
+        self.inboxes = inboxes
+        self.index = index
+
+    @staticmethod
+    def create(num_islands):
+        """
+        :param num_islands: Number of islands
+        :return: A list with the transport of each island
+        """
+        inboxes = [mp.Queue() for _ in range(num_islands)]
+        return [QueueTransport(inboxes, i) for i in range(num_islands)]
+
+    def start(self):
+        pass
+
+    def send(self, migrants):
+        """
+        Sends migrants to the next island
+        :param migrants: A list of (genome, fitness) tuples
+        """
+        self.inboxes[(self.index + 1) % len(self.inboxes)].put(migrants)
+
+    def receive(self):
+        """
+        Takes the migrants which arrived so far, without waiting for others
+        :return: A list of (genome, fitness) tuples
+        """
+        migrants = []
+        while True:
+            try:
+                migrants.extend(self.inboxes[self.index].get_nowait())
+            except queue.Empty:
+                return migrants
+
+    def close(self):
+        pass
+
+
+class SocketTransport:
+    """
+    Moves migrants between islands over TCP, so the islands can run on different machines. Each island listens on its
+    own address and connects to the next island's address to send its migrants. Messages are JSON, prefixed by their
+    length. Arriving migrants are collected by a background thread, so an island never waits for the others
+    """
+    def __init__(self, addresses, index, timeout=10):
+        """
+        :param addresses: The (host, port) address of every island
+        :param index: The index of the island this transport belongs to
+        :param timeout: Timeout in seconds for sending migrants
+        """
+        self.addresses = [tuple(address) for address in addresses]
+        self.index = index
+        self.timeout = timeout
+        self.server = None
+        self.inbox = None
+
+    @staticmethod
+    def create(num_islands, host='127.0.0.1', base_port=47000):
+        """
+        Creates the transports of islands which all run on the same host, on consecutive ports
+        :param num_islands: Number of islands
+        :param host: The host the islands run on
+        :param base_port: The port of the first island
+        :return: A list with the transport of each island
+        """
+        addresses = [(host, base_port + i) for i in range(num_islands)]
+        return [SocketTransport(addresses, i) for i in range(num_islands)]
+
+    def start(self):
+        """
+        Starts listening for migrants. It has to be called in the process of the island
+        """
+        self.inbox = queue.Queue()
+        self.server = socket.create_server(self.addresses[self.index])
+        threading.Thread(target=self.listen, daemon=True).start()
+
+    def listen(self):
+        """
+        Accepts connections from other islands and puts their migrants in the inbox, until the server is closed
+        """
+        while True:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                return
+            with connection:
+                migrants = read_message(connection)
+            if migrants is not None:
+                self.inbox.put([(genome, fitness) for genome, fitness in migrants])
+
+    def send(self, migrants):
+        """
+        Sends migrants to the next island. If the next island cannot be reached, the migrants are dropped
+        :param migrants: A list of (genome, fitness) tuples
+        """
+        address = self.addresses[(self.index + 1) % len(self.addresses)]
+        try:
+            with socket.create_connection(address, timeout=self.timeout) as connection:
+                write_message(connection, migrants)
+        except OSError:
+            pass
+
+    def receive(self):
+        """
+        Takes the migrants which arrived so far, without waiting for others
+        :return: A list of (genome, fitness) tuples
+        """
+        migrants = []
+        while True:
+            try:
+                migrants.extend(self.inbox.get_nowait())
+            except queue.Empty:
+                return migrants
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+
+
+def run_island(env, transport, migration_interval, migration_size):
+    """
+    Runs the evolutionary algorithm of a single island. Every migration_interval generations, after the fitnesses are
+    calculated, the island sends copies of its best genomes to the next island, and the migrants which arrived from the
+    previous island replace its worst genomes (with the fitness they had on their island), before the next generation
+    is bred. This can be called directly to run an island on another machine, with a SocketTransport. The environment
+    is closed (see EvolutionEnv.close()) when the island ends. Islands are not checkpointed, since the migrants which
+    are on their way between islands would be lost when they are resumed
+    :param env: The island's evolution environment
+    :param transport: The island's transport
+    :param migration_interval: Number of generations between migrations
+    :param migration_size: Number of genomes sent in every migration
+    :return: The island's last population and fitnesses
+    :raise ValueError: If the environment has a checkpoint_path
+    """
+    if env.checkpoint_path is not None:
+        env.close()
+        raise ValueError('Islands do not support checkpoint_path')
+    transport.start()
+    try:
+        for i in range(env.generations):
+            env.start_generation(i)
+            env.calc_pop_fitness()
+            if (i + 1) % migration_interval == 0:
+                ranked = sorted(range(env.pop_size), key=lambda x: env.fitnesses[x], reverse=True)
+                transport.send([(list(env.population[x]), env.fitnesses[x]) for x in ranked[:migration_size]])
+                immigrants = transport.receive()
+                for x, (genome, fitness) in zip(reversed(ranked), immigrants):
+                    env.population[x] = genome
+                    env.fitnesses[x] = fitness
+                if immigrants:
+                    env.logger.debug(f'Migrants: {len(immigrants)}')
+            # The last generation is not bred, so its fitnesses match the population
+            if i + 1 < env.generations:
+                env.population = env.breed()
+    finally:
+        transport.close()
+        env.close()
+    return env.population, env.fitnesses
+
+
+def island_process(env_class, env_kwargs, transport, migration_interval, migration_size, results, index):
+    """
+    The target of an island's process
+    """
+    env = env_class(**env_kwargs)
+    results.put((index,) + run_island(env, transport, migration_interval, migration_size))
+
+
+class IslandEvolution:
+    """
+    Runs several populations (islands) on this machine, each in its own process, which evolve independently and
+    exchange their best genomes every few generations. Islands on other machines can be run with run_island()
+    """
+    def __init__(self, num_islands=4, migration_interval=5, migration_size=2, transport='queue', base_port=47000,
+                 env_class=EvolutionEnv, **env_kwargs):
+        """
+        :param num_islands: Number of islands
+        :param migration_interval: Number of generations between migrations
+        :param migration_size: Number of genomes sent in every migration
+        :param transport: 'queue' to move migrants through multiprocessing queues, or 'socket' to move them through TCP
+        sockets on localhost
+        :param base_port: The port of the first island when using sockets (the others use the following ports)
+        :param env_class: The evolution environment of each island (EvolutionEnv or one of its subclasses)
+        :param env_kwargs: The keyword arguments of the islands' environments. If a seed is given, each island gets its
+        own seed derived from it, and if logging is on without a log_path, each island gets its own log file. Islands
+        do not support checkpoint_path (see run_island())
+        :raise ValueError: If checkpoint_path is given
+        """
+        if env_kwargs.get('checkpoint_path') is not None:
+            raise ValueError('Islands do not support checkpoint_path')
+        self.num_islands = num_islands
+        self.migration_interval = migration_interval
+        self.migration_size = migration_size
+        if transport == 'queue':
+            self.transports = QueueTransport.create(num_islands)
+        elif transport == 'socket':
+            self.transports = SocketTransport.create(num_islands, base_port=base_port)
+        else:
+            raise ValueError(f'Unknown transport: {transport}')
+        self.env_class = env_class
+        self.env_kwargs = env_kwargs
+        self.populations = []
+        self.fitnesses = []
+
+    def island_kwargs(self, index):
+        """
+        :param index: The island's index
+        :return: The keyword arguments of the island's environment
+        """
+        kwargs = dict(self.env_kwargs)
+        if kwargs.get('seed') is not None:
+            kwargs['seed'] = f'{kwargs["seed"]}/{index}'
+        if kwargs.get('with_logging', True) and kwargs.get('log_path') is None:
+            time = datetime.now().strftime("%Y %m %d %H %M %S")
+            extension = 'bin' if kwargs.get('log_format') == 'binary' else 'log'
+            kwargs['log_path'] = os.path.join('logs', f'Run Log {time} Island {index}.{extension}')
+        return kwargs
+
+    def evolve(self):
+        """
+        Runs all the islands until they finish. Afterwards, populations and fitnesses hold the last population of each
+        island. If an island's process dies before it sends its results, the other islands are stopped and a
+        RuntimeError is raised
+        """
+        results = mp.Queue()
+        processes = [mp.Process(target=island_process,
+                                args=(self.env_class, self.island_kwargs(i), self.transports[i],
+                                      self.migration_interval, self.migration_size, results, i))
+                     for i in range(self.num_islands)]
+        for process in processes:
+            process.start()
+        outcomes = {}
+        try:
+            while len(outcomes) < len(processes):
+                try:
+                    index, population, fitnesses = results.get(timeout=1)
+                    outcomes[index] = (population, fitnesses)
+                    continue
+                except queue.Empty:
+                    pass
+                # A process which ended without its results crashed. Its results may still be in the queue if it
+                # ended right after sending them, so it is only declared dead when the queue is empty
+                dead = [i for i, process in enumerate(processes)
+                        if i not in outcomes and process.exitcode is not None]
+                if dead and results.empty():
+                    codes = ', '.join(f'{i} (exit code {processes[i].exitcode})' for i in dead)
+                    raise RuntimeError(f'Islands died before finishing: {codes}')
+        finally:
+            for process in processes:
+                if process.is_alive() and len(outcomes) < len(processes):
+                    process.terminate()
+                process.join()
+        self.populations = [outcomes[i][0] for i in range(self.num_islands)]
+        self.fitnesses = [outcomes[i][1] for i in range(self.num_islands)]
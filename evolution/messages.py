@@ -0,0 +1,66 @@
+import asyncio
+import json
+import struct
+
+
+def write_message(connection, message):
+    """
+    Sends a JSON message through a socket, prefixed by its length
+    :param connection: The socket
+    :param message: A JSON-serializable object
+    """
+    data = json.dumps(message).encode()
+    connection.sendall(struct.pack('!I', len(data)) + data)
+
+
+def read_message(connection):
+    """
+    Reads a message sent by write_message()
+    :param connection: The socket
+    :return: The message, or None if the connection was closed before the whole message arrived
+    """
+    header = read_exactly(connection, 4)
+    if header is None:
+        return None
+    data = read_exactly(connection, struct.unpack('!I', header)[0])
+    return json.loads(data) if data is not None else None
+
+
+def read_exactly(connection, size):
+    """
+    :param connection: The socket
+    :param size: Number of bytes to read
+    :return: The bytes, or None if the connection was closed before they all arrived
+    """
+    data = b''
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+async def write_message_async(writer, message):
+    """
+    Same as write_message(), for an asyncio stream
+    :param writer: The stream's writer
+    :param message: A JSON-serializable object
+    """
+    data = json.dumps(message).encode()
+    writer.write(struct.pack('!I', len(data)) + data)
+    await writer.drain()
+
+
+async def read_message_async(reader):
+    """
+    Same as read_message(), for an asyncio stream
+    :param reader: The stream's reader
+    :return: The message, or None if the connection was closed before the whole message arrived
+    """
+    try:
+        header = await reader.readexactly(4)
+        data = await reader.readexactly(struct.unpack('!I', header)[0])
+    except asyncio.IncompleteReadError:
+        return None
+    return json.loads(data)
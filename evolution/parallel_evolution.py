@@ -1,7 +1,48 @@
+import collections
 import multiprocessing
 import multiprocessing as mp
+import random
+import time
 
+from bot import instrumentation
+from bot.tetris_bot import TetrisBot
 from evolution.evolution import EvolutionEnv
+from tetris_env.piece_sequence import PieceSequence
+
+# The settings of the games played by a worker process, set once when the process starts by init_worker()
+worker_settings = None
+worker_telemetry = False
+
+
+def init_worker(settings, telemetry=False):
+    """
+    Initializes a worker process of the pool
+    :param settings: A dictionary with the keyword arguments for TetrisBot (other than the genome)
+    :param telemetry: Should the games be instrumented?
+    """
+    global worker_settings, worker_telemetry
+    worker_settings = settings
+    worker_telemetry = telemetry
+    if telemetry:
+        instrumentation.enable()
+
+
+def play_game(game):
+    """
+    Plays a single game in a worker process
+    :param game: A (genome index, game index, genome, max pieces, seed) tuple, same as in EvolutionEnv.play_games()
+    :return: A (genome index, game index, game score) tuple. With telemetry, the game's duration and instrumentation
+    snapshot are added to it
+    """
+    i, j, g, max_pieces, seed = game
+    if worker_telemetry:
+        instrumentation.reset()
+    start = time.perf_counter()
+    bot = TetrisBot(genome=g, **worker_settings)
+    game_score = bot.play_game(with_print=False, max_pieces=max_pieces, pieces=PieceSequence(seed))
+    if worker_telemetry:
+        return i, j, game_score, time.perf_counter() - start, instrumentation.snapshot()
+    return i, j, game_score
 
 
 class ParallelEvolutionEnv(EvolutionEnv):
@@ -10,29 +51,65 @@ class ParallelEvolutionEnv(EvolutionEnv):
     """
     def __init__(self, pop_size=100, generations=40, p_mutation=0.2, p_crossover=1, k_tournament=3, g_size=7,
                  init_low_lim=-100, init_high_lim=100, games_per_fitness=5, board_height=12, board_width=6,
-                 with_logging=True, with_printing=True, num_cores=-1):
+                 with_logging=True, with_printing=True, num_cores=-1, **kwargs):
         """
         :param num_cores: The number of processes in the pool. If it is not set, it will be equal to the number of cores
+        :param kwargs: Any other keyword argument of EvolutionEnv, other than vectorized (the games are spread over the
+        workers instead)
+        :raise ValueError: If vectorized is set
         """
+        if kwargs.get('vectorized'):
+            raise ValueError(f'{type(self).__name__} does not support vectorized games')
         super().__init__(pop_size, generations, p_mutation, p_crossover, k_tournament, g_size, init_low_lim,
-                         init_high_lim, games_per_fitness, board_height, board_width, with_logging, with_printing)
+                         init_high_lim, games_per_fitness, board_height, board_width, with_logging, with_printing,
+                         **kwargs)
         self.num_cores = multiprocessing.cpu_count() if num_cores == -1 else num_cores
+        self.pool = None
+
+    def close(self):
+        # The same pool is used for the entire run, and closed when it ends
+        self.close_pool()
+        super().close()
+
+    def get_pool(self):
+        """
+        :return: The pool of worker processes. It is created on the first call
+        """
+        if self.pool is None:
+            settings = {'height': self.board_height, 'width': self.board_width, 'engine': self.engine,
+                        'evaluator': self.evaluator, 'beam_width': self.beam_width}
+            self.pool = mp.Pool(processes=self.num_cores, initializer=init_worker, initargs=(settings, self.telemetry))
+        return self.pool
+
+    def close_pool(self):
+        """
+        Closes the pool of worker processes, if it was created
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def telemetry_workers(self):
+        return self.num_cores
 
-    def calc_pop_fitness(self):
-        # Runs games for all individuals and log them
-        results = mp.Pool(processes=self.num_cores).map(self.calc_fitness, self.population)
-        for i in range(self.pop_size):
-            self.logger.debug(f'G: {self.population[i]}')
-            for j in range(self.games_per_fitness):
-                self.logger.debug(f'T{j}: {results[i][j]}')
-        # Turn the game scores into fitnesses
-        self.fitnesses = [sum(result) / self.games_per_fitness for result in results]
-
-    def calc_fitness(self, g):
-        scores = []
-        for i in range(self.games_per_fitness):
-            game_score = self.play_game(g)
-            scores.append(game_score)
-        if self.with_printing:
-            print(f'{["%.2f" % elem for elem in g]} finished with {sum(scores) / self.games_per_fitness}')
-        return scores
+    def play_games(self, games):
+        # Each game is a separate task, so a genome which plays long games does not hold a single worker while the
+        # others are idle. Only the genome and the seed of the game's pieces are sent to the workers. Games of a run
+        # without a seed get a random one
+        tasks = [(i, j, g, max_pieces, seed if seed is not None else random.getrandbits(64))
+                 for i, j, g, max_pieces, seed in games]
+        genomes = {i: g for i, _, g, _, _ in games}
+        counts = collections.Counter(i for i, _, _, _, _ in games)
+        remaining = counts.copy()
+        totals = collections.Counter()
+        for result in self.get_pool().imap_unordered(play_game, tasks):
+            i, j, game_score = result[:3]
+            if self.telemetry:
+                self.record_game(game_score, *result[3:])
+            remaining[i] -= 1
+            totals[i] += game_score
+            if self.with_printing and remaining[i] == 0:
+                g = genomes[i]
+                print(f'{["%.2f" % elem for elem in g]} finished with {totals[i] / counts[i]}')
+            yield i, j, game_score
@@ -0,0 +1,234 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+# The binary run log starts with a header, followed by records. Each record starts with its type:
+# A generation record is followed by the generation number.
+# A genome record is followed by the number of games, the genome's values and the score of each game.
+# A telemetry record is followed by the length of the telemetry, and the telemetry itself as JSON. It holds either the
+# performance telemetry of a generation or the statistics of its surrogate model.
+# Records are only appended, so a run that was cut off leaves a valid log, except maybe for a partial last record.
+# Version 2 added the telemetry record. Logs of version 1 can still be read, since they are a subset of version 2
+MAGIC = b'ETRL'
+VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+HEADER = struct.Struct('<4sBH')
+GENERATION_RECORD = b'N'
+GENOME_RECORD = b'I'
+TELEMETRY_RECORD = b'P'
+GENERATION = struct.Struct('<I')
+NUM_GAMES = struct.Struct('<H')
+TELEMETRY_LENGTH = struct.Struct('<I')
+
+
+class RunLogWriter:
+    """
+    Writes a binary run log, which holds the same records as the text log of EvolutionEnv (generations, genomes and
+    game scores) in a fraction of its size and time. If the file already exists, the new records are appended to it
+    """
+    def __init__(self, path, g_size):
+        """
+        :param path: The path of the log file
+        :param g_size: Genome size
+        """
+        self.g_size = g_size
+        self.genome_format = struct.Struct(f'<{g_size}d')
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            with open(path, 'rb') as f:
+                file_version, file_g_size = read_header(f)
+            if file_g_size != g_size:
+                raise ValueError(f'The log {path} holds genomes of size {file_g_size}, not {g_size}')
+            if file_version != VERSION:
+                raise ValueError(f'The log {path} has version {file_version}, and cannot be appended to')
+        # Every record is written with a single unbuffered write, so a record is never left in a buffer when the run
+        # stops
+        self.file = open(path, 'ab', buffering=0)
+        if not exists:
+            self.file.write(HEADER.pack(MAGIC, VERSION, g_size))
+
+    def write_generation(self, generation):
+        """
+        :param generation: The number of the generation which starts
+        """
+        self.file.write(GENERATION_RECORD + GENERATION.pack(generation))
+
+    def write_genome(self, g, scores):
+        """
+        :param g: The genome
+        :param scores: The scores of the genome's games
+        """
+        self.file.write(GENOME_RECORD + NUM_GAMES.pack(len(scores)) + self.genome_format.pack(*g) +
+                        struct.pack(f'<{len(scores)}i', *scores))
+
+    def write_telemetry(self, telemetry):
+        """
+        :param telemetry: The telemetry of a generation (see EvolutionEnv.finish_telemetry())
+        """
+        data = json.dumps(telemetry).encode()
+        self.file.write(TELEMETRY_RECORD + TELEMETRY_LENGTH.pack(len(data)) + data)
+
+    def close(self):
+        self.file.close()
+
+
+def read_header(f):
+    """
+    :param f: A binary run log, opened for reading at its start
+    :return: The format's version and the genome size
+    """
+    header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError('Not a binary run log')
+    magic, version, g_size = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError('Not a binary run log')
+    if version not in SUPPORTED_VERSIONS:
+        raise ValueError(f'Unsupported binary run log version: {version}')
+    return version, g_size
+
+
+def is_run_log(path):
+    """
+    :param path: The path of a log file
+    :return: True if it is a binary run log, False if it is a text log
+    """
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_run_log(path):
+    """
+    Reads a binary run log one generation at a time, so only a single generation is held in memory
+    :param path: The path of the log file
+    :return: An iterable of (generation, genomes, scores) tuples. genomes is an array with the shape
+    (individuals, genome size). scores is an array with the shape (individuals, games), and since individuals may have
+    played a different number of games (see EvolutionEnv.race()), the games an individual did not play are NaN
+    """
+    with open(path, 'rb') as f:
+        _, g_size = read_header(f)
+        genome_size = 8 * g_size
+        generation = None
+        genomes = []
+        scores = []
+        while True:
+            record_type = f.read(1)
+            if record_type == GENERATION_RECORD:
+                data = f.read(GENERATION.size)
+                if len(data) < GENERATION.size:
+                    break
+                if generation is not None:
+                    yield generation_arrays(generation, genomes, scores, g_size)
+                generation = GENERATION.unpack(data)[0]
+                genomes = []
+                scores = []
+            elif record_type == GENOME_RECORD:
+                data = f.read(NUM_GAMES.size)
+                if len(data) < NUM_GAMES.size:
+                    break
+                num_games = NUM_GAMES.unpack(data)[0]
+                data = f.read(genome_size + 4 * num_games)
+                if len(data) < genome_size + 4 * num_games:
+                    break
+                genomes.append(np.frombuffer(data, dtype='<f8', count=g_size))
+                scores.append(np.frombuffer(data, dtype='<i4', offset=genome_size))
+            elif record_type == TELEMETRY_RECORD:
+                data = f.read(TELEMETRY_LENGTH.size)
+                if len(data) < TELEMETRY_LENGTH.size:
+                    break
+                length = TELEMETRY_LENGTH.unpack(data)[0]
+                if len(f.read(length)) < length:
+                    break
+            else:
+                # The end of the log, or a partial record left by a run that was cut off
+                break
+        if generation is not None:
+            yield generation_arrays(generation, genomes, scores, g_size)
+
+
+def read_telemetry(path):
+    """
+    Reads the telemetry records of a binary run log
+    :param path: The path of the log file
+    :return: An iterable of the telemetry dictionaries, in the order they were written
+    """
+    with open(path, 'rb') as f:
+        _, g_size = read_header(f)
+        while True:
+            record_type = f.read(1)
+            if record_type == GENERATION_RECORD:
+                size = GENERATION.size
+            elif record_type == GENOME_RECORD:
+                data = f.read(NUM_GAMES.size)
+                if len(data) < NUM_GAMES.size:
+                    return
+                size = 8 * g_size + 4 * NUM_GAMES.unpack(data)[0]
+            elif record_type == TELEMETRY_RECORD:
+                data = f.read(TELEMETRY_LENGTH.size)
+                if len(data) < TELEMETRY_LENGTH.size:
+                    return
+                length = TELEMETRY_LENGTH.unpack(data)[0]
+                data = f.read(length)
+                if len(data) < length:
+                    return
+                yield json.loads(data)
+                continue
+            else:
+                return
+            if len(f.read(size)) < size:
+                return
+
+
+def generation_arrays(generation, genomes, scores, g_size):
+    """
+    Stacks the records of a generation into arrays
+    :return: A (generation, genomes, scores) tuple, as described in read_run_log()
+    """
+    num_games = max((len(indv) for indv in scores), default=0)
+    scores_array = np.full((len(scores), num_games), np.nan)
+    for i, indv in enumerate(scores):
+        scores_array[i, :len(indv)] = indv
+    genomes_array = np.array(genomes) if genomes else np.empty((0, g_size))
+    return generation, genomes_array, scores_array
+
+
+def convert_text_log(text_path, binary_path):
+    """
+    Converts a text log of EvolutionEnv into a binary run log. Records other than generations, genomes and games (like
+    the fitness cache's statistics) are not converted
+    :param text_path: The path of the text log
+    :param binary_path: The path of the binary log to create
+    """
+    writer = None
+    pending_generations = []
+    g = None
+    scores = []
+
+    def write_genome():
+        nonlocal writer
+        if writer is None:
+            writer = RunLogWriter(binary_path, len(g))
+        for generation in pending_generations:
+            writer.write_generation(generation)
+        pending_generations.clear()
+        writer.write_genome(g, scores)
+
+    with open(text_path, 'r') as log:
+        for line in log:
+            if line.startswith('T'):
+                scores.append(int(line.split(':')[1].strip()))
+            elif line.startswith('G:') or line.startswith('Generation'):
+                if g is not None:
+                    write_genome()
+                    g = None
+                if line.startswith('G:'):
+                    g = [float(value) for value in line.split(':')[1].strip(' []\n').split(',')]
+                    scores = []
+                else:
+                    pending_generations.append(int(line.split()[1]))
+    if g is not None:
+        write_genome()
+    if writer is not None:
+        writer.close()
@@ -0,0 +1,132 @@
+import queue
+
+from evolution.parallel_evolution import ParallelEvolutionEnv, play_game
+from tetris_env.piece_sequence import game_seed
+
+
+class SteadyStateEvolutionEnv(ParallelEvolutionEnv):
+    """
+    An evolution environment without a barrier between generations. A new child is bred as soon as a worker frees up,
+    from the individuals whose fitness is known at that time, and every child replaces the worst individual once its
+    games end. The run ends after generations * pop_size evaluations, same as the generational environment.
+    Every pop_size finished evaluations are logged as a generation, with the same records as EvolutionEnv, so the log
+    can be analyzed the same way. Racing, the fitness cache, vectorized games, the surrogate, checkpoints, telemetry and
+    generation callbacks are not supported by this environment
+    """
+    # The keyword arguments of EvolutionEnv which this environment does not support, with their default values
+    UNSUPPORTED = {'racing': False, 'cache_size': 0, 'vectorized': False, 'surrogate': None, 'checkpoint_path': None,
+                   'telemetry': False, 'generation_callback': None}
+
+    def __init__(self, *args, **kwargs):
+        """
+        :param args: The positional arguments of ParallelEvolutionEnv
+        :param kwargs: The keyword arguments of ParallelEvolutionEnv
+        :raise ValueError: If one of the unsupported options is set, or if k_tournament is larger than pop_size (the
+        tournaments could never be held, and the run would wait forever)
+        """
+        unsupported = [name for name, default in self.UNSUPPORTED.items() if kwargs.get(name, default) != default]
+        if unsupported:
+            raise ValueError(f'SteadyStateEvolutionEnv does not support: {", ".join(unsupported)}')
+        super().__init__(*args, **kwargs)
+        if self.k > self.pop_size:
+            self.close()
+            raise ValueError(f'k_tournament ({self.k}) must not be larger than pop_size ({self.pop_size})')
+
+    def evolve(self):
+        """
+        Performs the steady-state evolutionary algorithm
+        """
+        try:
+            self.evolve_steady_state()
+        finally:
+            self.close()
+
+    def evolve_steady_state(self):
+        """
+        The main loop of the run. Games are sent to the pool one by one, and their results are handled as they arrive
+        """
+        pool = self.get_pool()
+        results = queue.Queue()
+        budget = self.generations * self.pop_size
+        # Genomes being evaluated, by their evaluation number, with the scores of their games so far
+        evaluating = {}
+        submitted = 0
+        finished = 0
+        games_in_flight = 0
+
+        def submit(g):
+            nonlocal submitted, games_in_flight
+            evaluating[submitted] = (g, [None] * self.games_per_fitness)
+            for j in range(self.games_per_fitness):
+                game = (submitted, j, g, None, self.evaluation_seed(submitted, j))
+                pool.apply_async(play_game, (game,), callback=results.put, error_callback=results.put)
+            submitted += 1
+            games_in_flight += self.games_per_fitness
+
+        initial_population = self.population
+        self.population = []
+        self.fitnesses = []
+        for g in initial_population:
+            submit(g)
+
+        while finished < budget:
+            result = results.get()
+            if isinstance(result, BaseException):
+                raise result
+            n, j, game_score = result[:3]
+            games_in_flight -= 1
+            g, scores = evaluating[n]
+            scores[j] = game_score
+            if None not in scores:
+                del evaluating[n]
+                if finished % self.pop_size == 0:
+                    self.generation = finished // self.pop_size
+                    self.log_generation(self.generation)
+                    if self.with_printing:
+                        print(f'Generation {self.generation}')
+                self.log_genome(g, scores)
+                fitness = sum(scores) / len(scores)
+                if self.with_printing:
+                    print(f'{["%.2f" % elem for elem in g]} finished with {fitness}')
+                self.replace_worst(g, fitness)
+                finished += 1
+
+            # Breed new children while there are idle workers
+            while games_in_flight < self.num_cores and submitted < budget and len(self.population) >= self.k:
+                # The parents are copied, since they stay in the population while their children are mutated
+                c1, c2 = self.crossover(self.tournament()[:], self.tournament()[:])
+                submit(self.mutation(c1))
+                if submitted < budget:
+                    submit(self.mutation(c2))
+
+    def evaluation_seed(self, n, j):
+        """
+        :param n: The evaluation number (the order in which the genome was submitted)
+        :param j: The game index
+        :return: The seed of the game's pieces, or None if the run is not seeded
+        """
+        if self.seed is None:
+            return None
+        return game_seed(self.seed, n // self.pop_size, j, None if self.common_random_numbers else n)
+
+    def replace_worst(self, g, fitness):
+        """
+        Adds an evaluated genome to the population. Once the population is full, it replaces the worst individual
+        :param g: The genome
+        :param fitness: Its fitness
+        """
+        if len(self.population) < self.pop_size:
+            self.population.append(g)
+            self.fitnesses.append(fitness)
+            return
+        worst = min(range(self.pop_size), key=lambda i: self.fitnesses[i])
+        self.population[worst] = g
+        self.fitnesses[worst] = fitness
+
+    def tournament(self):
+        """
+        Tournament selection without replacement, among the individuals whose fitness is already known
+        :return: The winner of the tournament
+        """
+        best = max(self.rng.sample(range(len(self.population)), self.k), key=lambda i: self.fitnesses[i])
+        return self.population[best]
@@ -0,0 +1,139 @@
+import numpy as np
+
+
+class SurrogateModel:
+    """
+    A cheap model of the genomes' fitness, trained online on every genome evaluated during a run, which is used to
+    screen the offspring before their games are played (see EvolutionEnv's surrogate).
+    The bots' moves do not change when a genome is multiplied by a positive number, so the genomes are normalized to
+    unit length. The fitness is learned on a log scale, since the games' lengths grow by orders of magnitude as the
+    genomes improve.
+    'knn' predicts the distance-weighted mean of the k nearest evaluated genomes. 'ridge' fits a ridge regression over
+    the normalized genome and the products of all its pairs of values
+    """
+    def __init__(self, kind='knn', k=5, alpha=1.0, max_samples=5000):
+        """
+        :param kind: 'knn' or 'ridge'
+        :param k: Number of neighbors of the 'knn' model
+        :param alpha: The regularization of the 'ridge' model
+        :param max_samples: The maximum number of samples kept. When there are more, the oldest ones are forgotten
+        """
+        if kind not in ('knn', 'ridge'):
+            raise ValueError(f'Unknown surrogate model: {kind}')
+        self.kind = kind
+        self.k = k
+        self.alpha = alpha
+        self.max_samples = max_samples
+        self.genomes = []
+        self.targets = []
+        # The ridge regression's coefficients, fitted when a prediction is needed after samples were added
+        self.coefficients = None
+
+    def __len__(self):
+        return len(self.targets)
+
+    def add(self, g, fitness):
+        """
+        Adds an evaluated genome to the samples
+        :param g: The genome
+        :param fitness: Its fitness
+        """
+        self.genomes.append(self.normalize(g))
+        self.targets.append(np.log1p(max(fitness, 0)))
+        if len(self.targets) > self.max_samples:
+            del self.genomes[0], self.targets[0]
+        self.coefficients = None
+
+    def predict(self, genomes):
+        """
+        :param genomes: A list of genomes
+        :return: An array with the predicted fitness of each genome
+        """
+        x = np.array([self.normalize(g) for g in genomes])
+        if self.kind == 'knn':
+            return np.expm1(self.predict_knn(x))
+        if self.coefficients is None:
+            self.coefficients = self.fit_ridge()
+        return np.expm1(self.ridge_features(x) @ self.coefficients)
+
+    def predict_knn(self, x):
+        """
+        :param x: A 2D array of normalized genomes
+        :return: The predicted log fitnesses
+        """
+        samples = np.array(self.genomes)
+        targets = np.array(self.targets)
+        distances = np.sqrt(((x[:, None, :] - samples[None, :, :]) ** 2).sum(axis=2))
+        k = min(self.k, len(samples))
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        weights = 1 / (np.take_along_axis(distances, nearest, axis=1) + 1e-9)
+        return (weights * targets[nearest]).sum(axis=1) / weights.sum(axis=1)
+
+    def fit_ridge(self):
+        """
+        :return: The coefficients of the ridge regression (the first one is the intercept, which is not regularized)
+        """
+        features = self.ridge_features(np.array(self.genomes))
+        penalty = self.alpha * np.eye(features.shape[1])
+        penalty[0, 0] = 0
+        return np.linalg.solve(features.T @ features + penalty, features.T @ np.array(self.targets))
+
+    @staticmethod
+    def ridge_features(x):
+        """
+        :param x: A 2D array of normalized genomes
+        :return: The features of the ridge regression: a constant, the values and the products of all their pairs
+        """
+        rows, columns = np.triu_indices(x.shape[1])
+        return np.hstack([np.ones((len(x), 1)), x, x[:, rows] * x[:, columns]])
+
+    @staticmethod
+    def normalize(g):
+        """
+        :param g: A genome
+        :return: The genome scaled to unit length, as an array
+        """
+        g = np.asarray(g, dtype=np.float64)
+        norm = np.linalg.norm(g)
+        return g / norm if norm > 0 else g
+
+    def state(self):
+        """
+        :return: The samples, for a checkpoint
+        """
+        return {'genomes': [g.tolist() for g in self.genomes], 'targets': list(self.targets)}
+
+    def load_state(self, state):
+        """
+        :param state: Samples from state()
+        """
+        self.genomes = [np.array(g) for g in state['genomes']]
+        self.targets = list(state['targets'])
+        self.coefficients = None
+
+
+def average_ranks(values):
+    """
+    :param values: A 1D array
+    :return: The rank of each value (from 0), where tied values all get the average of their ranks
+    """
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    first_ranks = np.cumsum(counts) - counts
+    return (first_ranks + (counts - 1) / 2)[inverse]
+
+
+def prediction_error(predicted, actual):
+    """
+    Measures how well the surrogate predicted the fitnesses of a generation
+    :param predicted: The predicted fitnesses
+    :param actual: The fitnesses from the games
+    :return: A dictionary with the number of genomes, the mean absolute error, and the rank correlation (Spearman) of
+    the predictions (None if there are fewer than 2 genomes or all the values are equal)
+    """
+    predicted = np.asarray(predicted, dtype=np.float64)
+    actual = np.asarray(actual, dtype=np.float64)
+    error = {'genomes': len(actual), 'mae': float(np.abs(predicted - actual).mean()) if len(actual) else None,
+             'rank_correlation': None}
+    if len(set(actual)) > 1 and len(set(predicted)) > 1:
+        error['rank_correlation'] = float(np.corrcoef(average_ranks(predicted), average_ranks(actual))[0, 1])
+    return error
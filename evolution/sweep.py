@@ -0,0 +1,319 @@
+import hashlib
+import inspect
+import itertools
+import json
+import multiprocessing as mp
+import os
+import queue
+import random
+import sqlite3
+import time
+import traceback
+
+from evolution.checkpoint import load_checkpoint
+from evolution.evolution import EvolutionEnv
+
+
+def grid_configs(space):
+    """
+    :param space: A dictionary of the swept keyword arguments, each with a list of its values
+    :return: A list with a configuration (a dictionary of keyword arguments) for every combination of the values
+    """
+    names = sorted(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_configs(space, num_runs, seed=None):
+    """
+    :param space: A dictionary of the swept keyword arguments. A list is a choice of values, and a (low, high) tuple is
+    a range the value is drawn from uniformly (an integer if both bounds are integers)
+    :param num_runs: Number of configurations to draw
+    :param seed: The seed of the draws, so the same configurations are drawn when the sweep is resumed
+    :return: A list of configurations (dictionaries of keyword arguments)
+    """
+    rng = random.Random(seed)
+    names = sorted(space)
+    configs = []
+    for _ in range(num_runs):
+        config = {}
+        for name in names:
+            values = space[name]
+            if isinstance(values, list):
+                config[name] = rng.choice(values)
+            elif all(isinstance(bound, int) for bound in values):
+                config[name] = rng.randint(*values)
+            else:
+                config[name] = rng.uniform(*values)
+        configs.append(config)
+    return configs
+
+
+class SweepDatabase:
+    """
+    The results of parameter sweeps, in a SQLite database. 'runs' has a row for every run with its configuration (as
+    JSON, so it can be queried with json_extract()) and its status, and 'generations' has the summary of every
+    generation of every run (see EvolutionEnv.summarize_generation())
+    """
+    def __init__(self, path):
+        """
+        :param path: The database file. It is created if it does not exist
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        # Readers (such as the analysis of a running sweep) do not block the sweep's writes
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                sweep TEXT NOT NULL,
+                env TEXT NOT NULL,
+                config TEXT NOT NULL,
+                status TEXT NOT NULL,
+                started REAL,
+                finished REAL,
+                error TEXT
+            );
+            CREATE TABLE IF NOT EXISTS generations (
+                run_id TEXT NOT NULL REFERENCES runs (run_id),
+                generation INTEGER NOT NULL,
+                mean_fitness REAL,
+                max_fitness REAL,
+                min_fitness REAL,
+                std_fitness REAL,
+                best_genome TEXT,
+                seconds REAL,
+                PRIMARY KEY (run_id, generation)
+            );
+        ''')
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def finished_runs(self):
+        """
+        :return: A set of the IDs of the runs which finished
+        """
+        return {row['run_id'] for row in self.connection.execute("SELECT run_id FROM runs WHERE status = 'finished'")}
+
+    def start_run(self, run_id, sweep, env, config, first_generation=0):
+        """
+        Records that a run started. A run which was started before (and did not finish) is restarted, and the
+        generations it recorded from first_generation on are removed, so they are not mixed with the new attempt's
+        :param run_id: The run's ID
+        :param sweep: The name of the sweep
+        :param env: The name of the run's environment class
+        :param config: The run's configuration, as JSON
+        :param first_generation: The first generation the run will play: 0, or the generation after its checkpoint
+        when it is resumed
+        """
+        self.connection.execute('DELETE FROM generations WHERE run_id = ? AND generation >= ?',
+                                (run_id, first_generation))
+        self.connection.execute('INSERT OR REPLACE INTO runs (run_id, sweep, env, config, status, started) '
+                                "VALUES (?, ?, ?, ?, 'running', ?)", (run_id, sweep, env, config, time.time()))
+        self.connection.commit()
+
+    def add_generation(self, run_id, summary):
+        """
+        :param run_id: The run's ID
+        :param summary: The summary of the generation (see EvolutionEnv.summarize_generation()). A generation which
+        was recorded before (by a run that was resumed from a checkpoint) is replaced
+        """
+        self.connection.execute(
+            'INSERT OR REPLACE INTO generations VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (run_id, summary['generation'], summary['mean_fitness'], summary['max_fitness'], summary['min_fitness'],
+             summary['std_fitness'], json.dumps(summary['best_genome']), summary['seconds']))
+        self.connection.commit()
+
+    def finish_run(self, run_id, error=None):
+        """
+        :param run_id: The run's ID
+        :param error: The reason the run failed, or None if it finished
+        """
+        self.connection.execute('UPDATE runs SET status = ?, finished = ?, error = ? WHERE run_id = ?',
+                                ('finished' if error is None else 'failed', time.time(), error, run_id))
+        self.connection.commit()
+
+    def query(self, sql, params=()):
+        """
+        :param sql: A query over the runs and generations tables
+        :param params: The query's parameters
+        :return: A list of the resulting rows, as dictionaries
+        """
+        return [dict(row) for row in self.connection.execute(sql, params)]
+
+
+def run_process(env_class, env_kwargs, run_id, results):
+    """
+    The target of a run's process. The summary of every generation and the run's outcome are sent to the sweep
+    """
+    def report(summary):
+        results.put(('generation', run_id, summary))
+
+    try:
+        env_class(generation_callback=report, **env_kwargs).evolve()
+    except Exception:
+        results.put(('failed', run_id, traceback.format_exc()))
+    else:
+        results.put(('finished', run_id, None))
+
+
+class Sweep:
+    """
+    Runs an evolution environment with many configurations, each in its own process, and stores the summary of every
+    generation in a SweepDatabase. Runs are started as long as their cores fit in the limit, and configurations which
+    already finished in the database are skipped, so an interrupted sweep continues where it stopped
+    """
+    def __init__(self, db_path, configs, base_kwargs=None, env_class=EvolutionEnv, max_cores=None, log_dir=None,
+                 checkpoint_dir=None, name='sweep'):
+        """
+        :param db_path: The SQLite database of the results
+        :param configs: A list of configurations, each a dictionary of keyword arguments of the environment (see
+        grid_configs() and random_configs())
+        :param base_kwargs: Keyword arguments of the environment which are shared by all the runs. A configuration's
+        values override them
+        :param env_class: The evolution environment of the runs (EvolutionEnv or one of its subclasses which has an
+        evolve() that calculates its fitnesses with calc_pop_fitness(), and reports them to its generation_callback)
+        :param max_cores: The maximal number of cores used by the runs together. A run uses one core, or its num_cores
+        for environments which have it. If it is not set, it will be equal to the number of cores
+        :param log_dir: The directory of the runs' log files, when logging is on (default: 'logs')
+        :param checkpoint_dir: A directory to save the runs' checkpoints to, so runs which were interrupted are
+        resumed. If it is not set, interrupted runs start over
+        :param name: The sweep's name, which is stored with its runs
+        :raise ValueError: If the environment does not report its generations, or a configuration (or base_kwargs) has
+        its own generation_callback, which would take the place of the sweep's
+        """
+        if not issubclass(env_class, EvolutionEnv) or 'generation_callback' in getattr(env_class, 'UNSUPPORTED', {}):
+            raise ValueError(f'{env_class.__name__} does not report its generations, so it cannot be swept')
+        if any('generation_callback' in kwargs for kwargs in [base_kwargs or {}] + configs):
+            raise ValueError('The sweep records the generations itself, so configurations cannot set '
+                             'generation_callback')
+        self.db_path = db_path
+        self.configs = configs
+        self.base_kwargs = base_kwargs or {}
+        self.env_class = env_class
+        self.max_cores = max_cores if max_cores is not None else mp.cpu_count()
+        self.log_dir = log_dir if log_dir is not None else 'logs'
+        self.checkpoint_dir = checkpoint_dir
+        self.name = name
+
+    def run_config(self, config):
+        """
+        :param config: A configuration
+        :return: The run's ID, which is derived from the environment and its keyword arguments, and the keyword
+        arguments as JSON
+        """
+        kwargs = dict(self.base_kwargs, **config)
+        config_json = json.dumps(kwargs, sort_keys=True, default=repr)
+        run_id = hashlib.sha1(f'{self.env_class.__name__}:{config_json}'.encode()).hexdigest()[:16]
+        return run_id, config_json
+
+    def run_kwargs(self, run_id, config):
+        """
+        :param run_id: The run's ID
+        :param config: The run's configuration
+        :return: The keyword arguments of the run's environment, with its own log file and checkpoint
+        """
+        kwargs = dict(self.base_kwargs, **config)
+        if kwargs.get('with_logging', True) and kwargs.get('log_path') is None:
+            extension = 'bin' if kwargs.get('log_format') == 'binary' else 'log'
+            kwargs['log_path'] = os.path.join(self.log_dir, f'Run Log {self.name} {run_id}.{extension}')
+        if self.checkpoint_dir is not None and kwargs.get('checkpoint_path') is None:
+            kwargs['checkpoint_path'] = os.path.join(self.checkpoint_dir, f'{self.name} {run_id}.ckpt')
+        return kwargs
+
+    def run_cores(self, kwargs):
+        """
+        :param kwargs: The keyword arguments of a run's environment
+        :return: The number of cores the run uses
+        """
+        parameter = inspect.signature(self.env_class).parameters.get('num_cores')
+        if parameter is None:
+            return 1
+        num_cores = kwargs.get('num_cores', parameter.default)
+        return self.max_cores if num_cores == -1 else min(num_cores, self.max_cores)
+
+    @staticmethod
+    def first_generation(kwargs):
+        """
+        :param kwargs: The keyword arguments of a run's environment
+        :return: The first generation the run will play: the one after its checkpoint, or 0 if it has none
+        """
+        path = kwargs.get('checkpoint_path')
+        if path is None or not os.path.exists(path):
+            return 0
+        return load_checkpoint(path)['generation'] + 1
+
+    def run(self):
+        """
+        Runs the configurations which did not finish yet, until they all end
+        :return: The IDs of the runs which failed
+        """
+        db = SweepDatabase(self.db_path)
+        try:
+            finished = db.finished_runs()
+            pending = []
+            for config in self.configs:
+                run_id, config_json = self.run_config(config)
+                if run_id not in finished and all(run_id != other for other, _, _ in pending):
+                    pending.append((run_id, config, config_json))
+            if pending:
+                os.makedirs(self.log_dir, exist_ok=True)
+                if self.checkpoint_dir is not None:
+                    os.makedirs(self.checkpoint_dir, exist_ok=True)
+            results = mp.Queue()
+            # The running processes and their cores by their run IDs
+            running = {}
+            failed = []
+            while pending or running:
+                free = self.max_cores - sum(cores for _, cores in running.values())
+                while pending:
+                    run_id, config, config_json = pending[0]
+                    kwargs = self.run_kwargs(run_id, config)
+                    cores = self.run_cores(kwargs)
+                    if cores > free:
+                        break
+                    pending.pop(0)
+                    db.start_run(run_id, self.name, self.env_class.__name__, config_json,
+                                 self.first_generation(kwargs))
+                    # The processes are not daemons, so environments which have their own pools can run in them
+                    process = mp.Process(target=run_process, args=(self.env_class, kwargs, run_id, results))
+                    process.start()
+                    running[run_id] = (process, cores)
+                    free -= cores
+                self.handle_results(db, results, running, failed)
+            return failed
+        finally:
+            db.close()
+
+    def handle_results(self, db, results, running, failed):
+        """
+        Waits for the runs' messages, records them in the database, and removes the runs which ended from running
+        :param db: The SweepDatabase
+        :param results: The queue of the runs' messages
+        :param running: The running processes and their cores by their run IDs
+        :param failed: A list the IDs of the runs which failed are added to
+        """
+        messages = []
+        try:
+            messages.append(results.get(timeout=1))
+            while True:
+                messages.append(results.get_nowait())
+        except queue.Empty:
+            pass
+        for kind, run_id, data in messages:
+            if kind == 'generation':
+                db.add_generation(run_id, data)
+                continue
+            db.finish_run(run_id, data)
+            if kind == 'failed':
+                failed.append(run_id)
+            process, _ = running.pop(run_id)
+            process.join()
+        # A process which ended without reporting its outcome was killed
+        for run_id, (process, _) in list(running.items()):
+            if process.exitcode is not None and results.empty():
+                db.finish_run(run_id, f'The process ended with exit code {process.exitcode}')
+                failed.append(run_id)
+                del running[run_id]
@@ -0,0 +1,51 @@
+import random
+
+import numpy as np
+import pytest
+
+from bot.batch_evaluation import batch_features
+from bot.feature_extraction import extract_features
+from bot.tetris_bot import TetrisBot, snapshot_features
+from tetris_env import tetris
+from tetris_env.piece_factory import PieceFactory
+from tetris_env.piece_sequence import PieceSequence
+
+GENOME = [-2, -1, -1, -15, -2, -1, -1]
+
+
+def random_boards(count, height=10, width=6, seed=0):
+    rng = random.Random(seed)
+    pf = PieceFactory(width)
+    boards = []
+    board = tetris.create_board(height, width)
+    while len(boards) < count:
+        pid = rng.randint(0, 6)
+        rid, col_offset = rng.choice(pf.get_moves(pid))
+        if tetris.drop_piece(pf.pieces[pid][rid], col_offset, board):
+            board = tetris.create_board(height, width)
+            continue
+        boards.append(tetris.copy_board(board))
+    return boards
+
+
+def test_batch_features_match_extract_features():
+    boards = random_boards(100)
+    features = batch_features(np.array([[list(row) for row in board] for board in boards]) > 0)
+    assert features.tolist() == [list(extract_features(board)) for board in boards]
+
+
+@pytest.mark.parametrize('engine', ['list', 'bitboard'])
+def test_snapshot_features_match_the_engine(engine):
+    bot = TetrisBot(10, 6, GENOME, engine=engine, evaluator='numpy')
+    boards = [bot.engine.board_from_rows([list(row) for row in board[4:]]) for board in random_boards(50, seed=1)]
+    features = snapshot_features([bot.snapshot_board(board) for board in boards], 6)
+    assert features.tolist() == [list(extract_features(board)) for board in random_boards(50, seed=1)]
+
+
+@pytest.mark.parametrize('engine', ['list', 'bitboard'])
+@pytest.mark.parametrize('lookahead', [False, True])
+def test_games_match_across_evaluators(engine, lookahead):
+    for seed in range(3):
+        scores = {TetrisBot(10, 6, GENOME, lookahead=lookahead, engine=engine, evaluator=evaluator).play_game(
+            max_pieces=300, pieces=PieceSequence(seed)) for evaluator in ('scalar', 'numpy')}
+        assert len(scores) == 1
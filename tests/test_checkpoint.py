@@ -0,0 +1,36 @@
+import pytest
+
+from evolution.checkpoint import load_checkpoint, save_checkpoint
+from evolution.evolution import EvolutionEnv
+
+ENV_KWARGS = dict(pop_size=4, games_per_fitness=2, board_height=8, board_width=5, seed=1, with_logging=False,
+                  with_printing=False)
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'run.ckpt')
+    save_checkpoint(path, {'generation': 3, 'population': [[1, 2]]})
+    assert load_checkpoint(path) == {'generation': 3, 'population': [[1, 2]]}
+    assert not (tmp_path / 'run.ckpt.tmp').exists()
+
+
+@pytest.mark.parametrize('surrogate', [None, 'knn'])
+def test_resumed_run_matches_an_uninterrupted_run(tmp_path, surrogate):
+    path = str(tmp_path / 'run.ckpt')
+    uninterrupted = EvolutionEnv(generations=4, surrogate=surrogate, surrogate_min_samples=4, **ENV_KWARGS)
+    uninterrupted.evolve()
+    EvolutionEnv(generations=2, checkpoint_path=path, surrogate=surrogate, surrogate_min_samples=4,
+                 **ENV_KWARGS).evolve()
+    assert load_checkpoint(path)['generation'] == 1
+    resumed = EvolutionEnv(generations=4, checkpoint_path=path, surrogate=surrogate, surrogate_min_samples=4,
+                           **ENV_KWARGS)
+    resumed.evolve()
+    assert resumed.population == uninterrupted.population
+    assert resumed.fitnesses == uninterrupted.fitnesses
+
+
+def test_resume_with_different_settings_fails(tmp_path):
+    path = str(tmp_path / 'run.ckpt')
+    EvolutionEnv(generations=1, checkpoint_path=path, **ENV_KWARGS).evolve()
+    with pytest.raises(ValueError, match='pop_size'):
+        EvolutionEnv(generations=2, checkpoint_path=path, **dict(ENV_KWARGS, pop_size=6)).evolve()
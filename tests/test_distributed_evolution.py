@@ -0,0 +1,26 @@
+import multiprocessing as mp
+
+from evolution.distributed_evolution import DistributedEvolutionEnv, run_worker
+from evolution.evolution import EvolutionEnv
+from tests.test_island_evolution import ENV_KWARGS, free_ports
+
+
+def test_workers_play_the_same_games_as_a_serial_run():
+    port, = free_ports(1)
+    env = DistributedEvolutionEnv(port=port, batch_size=2, **ENV_KWARGS)
+    assert env.coordinator.address == ('127.0.0.1', port)
+    workers = [mp.Process(target=run_worker, args=('127.0.0.1', port), kwargs={'connect_timeout': 30})
+               for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    try:
+        env.evolve()
+    finally:
+        for worker in workers:
+            worker.join(timeout=30)
+            if worker.is_alive():
+                worker.terminate()
+    serial = EvolutionEnv(**ENV_KWARGS)
+    serial.evolve()
+    assert env.population == serial.population
+    assert env.fitnesses == serial.fitnesses
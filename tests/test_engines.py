@@ -0,0 +1,71 @@
+import random
+
+import pytest
+
+from bot.feature_extraction import FeatureTracker, extract_bitboard_features, extract_features
+from bot.tetris_bot import TetrisBot
+from tetris_env import bitboard, tetris
+from tetris_env.piece_factory import PIECES, PieceFactory
+from tetris_env.piece_sequence import PieceSequence
+
+GENOME = [-2, -1, -1, -15, -2, -1, -1]
+
+
+def filled(board):
+    """
+    :return: The filled squares of a board of either engine, as rows of booleans from top to bottom
+    """
+    if isinstance(board, bitboard.BitBoard):
+        return [[bool(row >> col & 1) for col in range(board.width)] for row in board.rows]
+    return [[val > 0 for val in row] for row in board]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_drops_match(seed):
+    rng = random.Random(seed)
+    height, width = 10, 6
+    pf = PieceFactory(width)
+    list_board = tetris.create_board(height, width)
+    list_board.tracker = FeatureTracker(list_board)
+    bit_board = bitboard.create_board(height, width)
+    undos = []
+    for _ in range(200):
+        pid = rng.randint(0, 6)
+        rid, col_offset = rng.choice(pf.get_moves(pid))
+        piece = pf.pieces[pid][rid]
+        list_undo = tetris.apply_piece(piece, col_offset, list_board)
+        bit_undo = bitboard.apply_piece(piece, col_offset, bit_board)
+        assert (list_undo is None) == (bit_undo is None)
+        if list_undo is None:
+            break
+        undos.append((list_undo, bit_undo))
+        assert filled(list_board) == filled(bit_board)
+        assert extract_features(list_board) == extract_bitboard_features(bit_board)
+        list_board.tracker, tracker = None, list_board.tracker
+        assert extract_features(list_board) == tracker.features
+        list_board.tracker = tracker
+    # Taking the drops back in reverse order restores the same boards
+    for list_undo, bit_undo in reversed(undos[-20:]):
+        tetris.undo_piece(list_undo, list_board)
+        bitboard.undo_piece(bit_undo, bit_board)
+        assert filled(list_board) == filled(bit_board)
+        assert extract_features(list_board) == extract_bitboard_features(bit_board)
+
+
+def test_piece_matrices_drop_like_compiled_pieces():
+    pf = PieceFactory(6)
+    compiled = bitboard.create_board(10, 6)
+    raw = bitboard.create_board(10, 6)
+    for pid in range(7):
+        for rid, rows in enumerate(PIECES[pid][:len(pf.pieces[pid])]):
+            assert bitboard.piece_masks(rows) == pf.pieces[pid][rid].masks
+            assert bitboard.drop_piece(pf.pieces[pid][rid], 0, compiled) == bitboard.drop_piece(rows, 0, raw)
+            assert compiled.rows == raw.rows
+
+
+@pytest.mark.parametrize('lookahead', [False, True])
+def test_games_match_across_engines(lookahead):
+    for seed in range(3):
+        scores = {TetrisBot(10, 6, GENOME, lookahead=lookahead, engine=engine).play_game(
+            max_pieces=300, pieces=PieceSequence(seed)) for engine in ('list', 'bitboard')}
+        assert len(scores) == 1
@@ -0,0 +1,25 @@
+from bot.expectimax import ExpectimaxSearch
+from bot.tetris_bot import TetrisBot
+from tests.test_batch_evaluation import GENOME, random_boards
+
+
+def test_depth_2_matches_the_lookahead():
+    bot = TetrisBot(10, 6, GENOME, search_depth=2)
+    for i, board in enumerate(random_boards(30, seed=4)):
+        board = bot.engine.board_from_rows([list(row) for row in board[4:]])
+        move, score, depth = bot.search.search(board, i % 7, (i * 5) % 7)
+        expected, expected_score = bot.best_move_lookahead(board, i % 7, (i * 5) % 7)
+        if expected is None:
+            # Every move loses with the next piece, so the search falls back to the best drop of the current piece
+            assert depth == 1 and move == bot.best_move(board, i % 7)[0]
+        else:
+            assert depth == 2 and move == expected and score == expected_score
+
+
+def test_node_budget_keeps_the_first_iteration():
+    bot = TetrisBot(10, 6, GENOME)
+    search = ExpectimaxSearch(bot, max_depth=3, node_budget=1)
+    board = bot.engine.create_board(10, 6)
+    move, _, depth = search.search(board, 0, 1)
+    assert depth == 1
+    assert move == bot.best_move(board, 0)[0]
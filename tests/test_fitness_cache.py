@@ -0,0 +1,61 @@
+import pytest
+
+from evolution.evolution import EvolutionEnv
+from evolution.fitness_cache import FitnessCache
+
+
+def cached_env(**kwargs):
+    # Without crossover and mutation, the next generation is made of unchanged copies of the selected genomes
+    return EvolutionEnv(pop_size=6, generations=2, p_mutation=0, p_crossover=0, games_per_fitness=2, board_height=8,
+                        board_width=5, seed=3, cache_size=100, with_logging=False, with_printing=False, **kwargs)
+
+
+@pytest.mark.parametrize('common_random_numbers', [False, True])
+def test_unchanged_survivors_are_cache_hits(common_random_numbers):
+    env = cached_env(common_random_numbers=common_random_numbers)
+    env.start_generation(0)
+    env.calc_pop_fitness()
+    fitness_of = {tuple(g): fitness for g, fitness in zip(env.population, env.fitnesses)}
+    env.population = env.breed()
+    env.start_generation(1)
+    env.calc_pop_fitness()
+    assert env.cache.misses == 0
+    assert env.cache.hits == env.pop_size
+    assert env.fitnesses == [fitness_of[tuple(g)] for g in env.population]
+
+
+def test_cached_games_do_not_depend_on_the_generation():
+    env = cached_env()
+    env.start_generation(0)
+    env.calc_pop_fitness()
+    uncached = cached_env()
+    uncached.population = env.population
+    uncached.cache = FitnessCache(100)
+    uncached.start_generation(5)
+    uncached.calc_pop_fitness()
+    assert uncached.cache.hits == 0
+    assert uncached.fitnesses == env.fitnesses
+
+
+def test_lru_eviction():
+    cache = FitnessCache(2)
+    cache.put('a', [1])
+    cache.put('b', [2])
+    assert cache.get('a') == [1]
+    cache.put('c', [3])
+    assert cache.get('b') is None
+    assert cache.get('a') == [1] and cache.get('c') == [3]
+
+
+def test_search_settings_are_part_of_the_key(tmp_path):
+    path = str(tmp_path / 'cache.pkl')
+    env = cached_env(cache_path=path)
+    env.start_generation(0)
+    env.calc_pop_fitness()
+    for kwargs, hits in (({}, 6), ({'beam_width': 1}, 0), ({'vectorized': True}, 6),
+                         ({'vectorized': True, 'beam_width': 1}, 6)):
+        other = cached_env(cache_path=path, **kwargs)
+        other.population = env.population
+        other.start_generation(0)
+        other.calc_pop_fitness()
+        assert (other.cache.hits, other.cache.misses) == (hits, 6 - hits), kwargs
@@ -0,0 +1,28 @@
+from bot import instrumentation
+from bot.tetris_bot import ENGINES
+from evolution.evolution import EvolutionEnv
+from tetris_env import bitboard, tetris
+
+
+def test_telemetry_run_restores_the_original_functions():
+    originals = (tetris.apply_piece, bitboard.collision_detection, dict(ENGINES))
+    env = EvolutionEnv(pop_size=4, generations=2, games_per_fitness=1, board_height=8, board_width=5, seed=1,
+                       engine='bitboard', telemetry=True, with_logging=False, with_printing=False)
+    env.evolve()
+    assert not instrumentation.is_enabled()
+    assert (tetris.apply_piece, bitboard.collision_detection, dict(ENGINES)) == originals
+
+
+def test_counters():
+    instrumentation.reset()
+    instrumentation.enable()
+    try:
+        env = EvolutionEnv(pop_size=2, generations=1, games_per_fitness=1, board_height=8, board_width=5,
+                           seed=1, engine='bitboard', with_logging=False, with_printing=False)
+        env.play_game(env.population[0], seed=1)
+        counters, _ = instrumentation.snapshot()
+    finally:
+        instrumentation.disable()
+    assert counters['bitboard.drops.calls'] > 0
+    assert counters['bitboard.collisions.calls'] >= counters['bitboard.drops.calls']
+    assert counters['bot.feature_extractions.calls'] > 0
@@ -0,0 +1,123 @@
+import os
+import socket
+import time
+
+import pytest
+
+from evolution.evolution import EvolutionEnv
+from evolution.island_evolution import IslandEvolution, QueueTransport, SocketTransport, run_island
+from evolution.parallel_evolution import ParallelEvolutionEnv
+
+ENV_KWARGS = dict(pop_size=4, generations=2, games_per_fitness=1, board_height=8, board_width=5, seed=1,
+                  with_logging=False, with_printing=False)
+
+
+def free_ports(count):
+    sockets = [socket.socket() for _ in range(count)]
+    for s in sockets:
+        s.bind(('127.0.0.1', 0))
+    ports = [s.getsockname()[1] for s in sockets]
+    for s in sockets:
+        s.close()
+    return ports
+
+
+def receive_migrants(transport, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        migrants = transport.receive()
+        if migrants:
+            return migrants
+        time.sleep(0.01)
+    return []
+
+
+class StandInTransport:
+    """
+    Records the sent migrants, and delivers fixed immigrants
+    """
+    def __init__(self, immigrants):
+        self.immigrants = immigrants
+        self.sent = []
+
+    def start(self):
+        pass
+
+    def send(self, migrants):
+        self.sent.append(migrants)
+
+    def receive(self):
+        return self.immigrants
+
+    def close(self):
+        pass
+
+
+def test_queue_transport_sends_to_the_next_island():
+    transports = QueueTransport.create(3)
+    transports[2].send([([1, 2], 5.0)])
+    assert receive_migrants(transports[0]) == [([1, 2], 5.0)]
+    assert transports[1].receive() == []
+
+
+def test_socket_transport_sends_to_the_next_island():
+    addresses = [('127.0.0.1', port) for port in free_ports(2)]
+    transports = [SocketTransport(addresses, i) for i in range(2)]
+    for transport in transports:
+        transport.start()
+    try:
+        transports[0].send([([1, 2], 5.0), ([3, 4], 6.0)])
+        assert receive_migrants(transports[1]) == [([1, 2], 5.0), ([3, 4], 6.0)]
+        assert transports[0].receive() == []
+    finally:
+        for transport in transports:
+            transport.close()
+
+
+def test_migration_replaces_the_worst_genomes():
+    env = EvolutionEnv(**dict(ENV_KWARGS, generations=1))
+    immigrant = [7] * env.g_size
+    transport = StandInTransport([(immigrant, 1e9)])
+    population, fitnesses = run_island(env, transport, migration_interval=1, migration_size=2)
+    sent, = transport.sent
+    assert len(sent) == 2
+    assert sent[0][1] == max(fitness for _, fitness in sent)
+    assert population.count(immigrant) == 1 and max(fitnesses) == 1e9
+    # The best genomes which were sent stay on the island
+    assert all(genome in population for genome, _ in sent)
+
+
+def test_islands_evolve():
+    islands = IslandEvolution(num_islands=2, migration_interval=1, migration_size=1, **ENV_KWARGS)
+    islands.evolve()
+    assert len(islands.populations) == 2
+    assert all(len(fitnesses) == ENV_KWARGS['pop_size'] for fitnesses in islands.fitnesses)
+
+
+def test_dead_island_is_reported():
+    islands = IslandEvolution(num_islands=2, **dict(ENV_KWARGS, engine='missing'))
+    with pytest.raises(RuntimeError, match='Islands died'):
+        islands.evolve()
+
+
+def test_island_log_paths():
+    islands = IslandEvolution(num_islands=2, log_format='binary')
+    assert islands.island_kwargs(1)['log_path'].endswith('Island 1.bin')
+    assert os.path.dirname(islands.island_kwargs(1)['log_path']) == 'logs'
+    islands = IslandEvolution(num_islands=2, log_path='mine.log')
+    assert islands.island_kwargs(1)['log_path'] == 'mine.log'
+
+
+def test_island_closes_its_pool():
+    env = ParallelEvolutionEnv(num_cores=2, **dict(ENV_KWARGS, generations=1))
+    run_island(env, StandInTransport([]), migration_interval=1, migration_size=1)
+    assert env.pool is None
+
+
+def test_islands_reject_checkpoints(tmp_path):
+    path = str(tmp_path / 'run.ckpt')
+    with pytest.raises(ValueError, match='checkpoint_path'):
+        IslandEvolution(num_islands=2, checkpoint_path=path, **ENV_KWARGS)
+    with pytest.raises(ValueError, match='checkpoint_path'):
+        run_island(EvolutionEnv(checkpoint_path=path, **ENV_KWARGS), StandInTransport([]), 1, 1)
+    assert not os.path.exists(path)
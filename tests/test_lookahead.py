@@ -0,0 +1,65 @@
+import math
+
+import pytest
+
+from bot.tetris_bot import TetrisBot
+from tests.test_batch_evaluation import GENOME, random_boards
+from tests.test_engines import filled
+from tetris_env.piece_sequence import PieceSequence
+
+
+def copying_lookahead(bot, board, cpid, npid):
+    """
+    The lookahead search as it was written before the undo records, beam and transpositions: every drop is made on a
+    copy of the board
+    :return: The board after the best drop of the current piece and its score
+    """
+    engine = bot.engine
+    max_score, best_board = - math.inf, None
+    for piece, offset_limit in bot.pf.get_rotations_and_offset_limit(cpid):
+        for col_offset in range(offset_limit + 1):
+            new_board = engine.copy_board(board)
+            if engine.drop_piece(piece, col_offset, new_board):
+                continue
+            score = - math.inf
+            for next_piece, next_offset_limit in bot.pf.get_rotations_and_offset_limit(npid):
+                for next_offset in range(next_offset_limit + 1):
+                    next_board = engine.copy_board(new_board)
+                    if not engine.drop_piece(next_piece, next_offset, next_board):
+                        score = max(score, bot.eval_board(next_board))
+            if score > max_score:
+                max_score, best_board = score, new_board
+    return best_board, max_score
+
+
+@pytest.mark.parametrize('engine', ['list', 'bitboard'])
+@pytest.mark.parametrize('transpositions', [False, True])
+def test_lookahead_matches_the_copying_search(engine, transpositions):
+    bot = TetrisBot(10, 6, GENOME, engine=engine, incremental_features=False, transpositions=transpositions)
+    for i, board in enumerate(random_boards(40, seed=5)):
+        board = bot.engine.board_from_rows([list(row) for row in board[4:]])
+        cpid, npid = i % 7, (i * 3 + 1) % 7
+        expected_board, expected_score = copying_lookahead(bot, board, cpid, npid)
+        new_board, score = bot.find_best_move_lookahead(board, cpid, npid)
+        assert score == expected_score
+        assert (new_board is None) == (expected_board is None)
+        if new_board is not None:
+            assert filled(new_board) == filled(expected_board)
+
+
+def test_full_beam_and_transpositions_do_not_change_the_games():
+    for seed in range(3):
+        scores = {TetrisBot(10, 6, GENOME, beam_width=beam_width, transpositions=transpositions).play_game(
+            max_pieces=300, pieces=PieceSequence(seed))
+            for beam_width, transpositions in ((None, False), (None, True), (100, True))}
+        assert len(scores) == 1
+
+
+@pytest.mark.parametrize('evaluator', ['scalar', 'numpy'])
+def test_narrow_beam_plays_legal_games(evaluator):
+    bot = TetrisBot(10, 6, GENOME, beam_width=3, evaluator=evaluator)
+    assert bot.play_game(max_pieces=100, pieces=PieceSequence(0)) > 0
+    # The beam is chosen the same way by both evaluators
+    other = TetrisBot(10, 6, GENOME, beam_width=3, evaluator='scalar' if evaluator == 'numpy' else 'numpy')
+    assert (bot.play_game(max_pieces=100, pieces=PieceSequence(1))
+            == other.play_game(max_pieces=100, pieces=PieceSequence(1)))
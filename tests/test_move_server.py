@@ -0,0 +1,120 @@
+import asyncio
+import struct
+
+import pytest
+
+from bot.move_server import MoveClient, MoveServer
+from bot.tetris_bot import TetrisBot, snapshot_features
+from evolution.messages import read_message_async, write_message_async
+from tests.test_batch_evaluation import GENOME, random_boards
+
+
+def requests():
+    return [([list(row) for row in board[4:]], i % 7, (i * 3) % 7 if i % 2 else None)
+            for i, board in enumerate(random_boards(20, seed=2))]
+
+
+async def ask(server, messages):
+    await server.start()
+    port = server.server.sockets[0].getsockname()[1]
+    client = MoveClient()
+    await client.connect('127.0.0.1', port)
+    try:
+        return await asyncio.gather(*(client.best_move(*message) for message in messages), return_exceptions=True)
+    finally:
+        await client.close()
+        await server.stop()
+
+
+def test_moves_match_the_bot():
+    answers = asyncio.run(ask(MoveServer({'g': GENOME}, port=0), [('g',) + request for request in requests()]))
+    bot = TetrisBot(10, 6, GENOME)
+    for (rows, cpid, npid), (move, score) in zip(requests(), answers):
+        board = bot.engine.board_from_rows(rows)
+        expected, expected_score = (bot.best_move(board, cpid) if npid is None
+                                    else bot.best_move_lookahead(board, cpid, npid))
+        assert move == expected
+        assert score == (pytest.approx(expected_score) if expected is not None else None)
+
+
+def test_bad_requests_are_rejected():
+    rows = requests()[0][0]
+    answers = asyncio.run(ask(MoveServer({'g': GENOME}, port=0), [
+        ('g', rows, -1, None), ('g', rows, 7, None), ('g', rows, 0, 9), ('g', rows, '1', None), ('h', rows, 0, None),
+        ('g', rows, 0, None)]))
+    assert all(isinstance(answer, ValueError) for answer in answers[:5])
+    assert 'Unknown piece' in str(answers[0]) and 'Unknown next piece' in str(answers[2])
+    assert 'Unknown genome' in str(answers[4])
+    assert answers[5][0] is not None
+
+
+def test_bots_are_bounded():
+    server = MoveServer({'g': GENOME}, max_bots=2)
+    first = server.get_bot('g', 10, 6)
+    server.get_bot('g', 12, 6)
+    assert server.get_bot('g', 10, 6) is first
+    server.get_bot('g', 14, 6)
+    assert list(server.bots) == [('g', 10, 6), ('g', 14, 6)]
+
+
+def test_bad_boards_do_not_stop_the_server():
+    rows = requests()[0][0]
+    ragged = [list(row) for row in rows[:-1]] + [list(rows[-1]) + [0]]
+    answers = asyncio.run(ask(MoveServer({'g': GENOME}, port=0, batch_window=0.05), [
+        ('g', ragged, 0, None), ('g', rows, 0, None), ('g', [[0, 'x'] * 3] * 10, 0, None), ('g', [], 0, None),
+        ('g', [[0, -1] * 3] * 10, 0, None), ('g', rows, 1, 2)]))
+    assert [isinstance(answer, ValueError) for answer in answers] == [True, False, True, True, True, False]
+    assert 'must have 6 squares' in str(answers[0])
+
+
+def test_failed_evaluation_does_not_stop_the_batcher(monkeypatch):
+    calls = []
+
+    def failing_snapshot_features(boards, width):
+        calls.append(width)
+        if len(calls) == 1:
+            raise MemoryError('out of memory')
+        return snapshot_features(boards, width)
+
+    monkeypatch.setattr('bot.move_server.snapshot_features', failing_snapshot_features)
+    rows = requests()[0][0]
+
+    async def ask_twice(server):
+        await server.start()
+        client = MoveClient()
+        await client.connect('127.0.0.1', server.server.sockets[0].getsockname()[1])
+        try:
+            first = await asyncio.gather(client.best_move('g', rows, 0), return_exceptions=True)
+            second = await client.best_move('g', rows, 0)
+            return first[0], second
+        finally:
+            await client.close()
+            await server.stop()
+
+    first, second = asyncio.run(ask_twice(MoveServer({'g': GENOME}, port=0)))
+    assert isinstance(first, ValueError) and 'out of memory' in str(first)
+    assert second[0] is not None
+
+
+def test_malformed_messages_are_answered_with_errors():
+    async def send_raw(server):
+        await server.start()
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.server.sockets[0].getsockname()[1])
+        try:
+            answers = []
+            for message in ([1, 2], {'id': 1}, {'type': 'dance', 'id': 2}, {'type': 'move', 'id': 3}):
+                await write_message_async(writer, message)
+                answers.append(await read_message_async(reader))
+            writer.write(struct.pack('!I', 3) + b'{{{')
+            answers.append(await read_message_async(reader))
+            await write_message_async(writer, {'type': 'stats', 'id': 4})
+            answers.append(await read_message_async(reader))
+            return answers
+        finally:
+            writer.close()
+            await server.stop()
+
+    answers = asyncio.run(send_raw(MoveServer({'g': GENOME}, port=0)))
+    assert [answer['type'] for answer in answers] == ['error'] * 5 + ['stats']
+    assert [answer['id'] for answer in answers] == [None, 1, 2, 3, None, 4]
+    assert 'genome' in answers[3]['error']
@@ -0,0 +1,44 @@
+import pytest
+
+from evolution.distributed_evolution import DistributedEvolutionEnv
+from evolution.evolution import EvolutionEnv
+from evolution.parallel_evolution import ParallelEvolutionEnv
+
+ENV_KWARGS = dict(pop_size=6, generations=2, games_per_fitness=2, board_height=8, board_width=5, seed=2,
+                  with_logging=False, with_printing=False)
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'cache_size': 100}, {'racing': True, 'games_per_fitness': 4}])
+def test_parallel_run_matches_the_serial_run(kwargs):
+    serial = EvolutionEnv(**dict(ENV_KWARGS, **kwargs))
+    serial.evolve()
+    parallel = ParallelEvolutionEnv(num_cores=2, **dict(ENV_KWARGS, **kwargs))
+    parallel.evolve()
+    assert parallel.pool is None
+    assert parallel.population == serial.population
+    assert parallel.fitnesses == serial.fitnesses
+
+
+def test_every_game_is_a_task():
+    env = ParallelEvolutionEnv(num_cores=2, **ENV_KWARGS)
+    games = [(i, j, env.population[i], None, env.game_seed(i, j)) for i in range(env.pop_size) for j in range(3)]
+    try:
+        results = list(env.play_games(games))
+    finally:
+        env.close()
+    assert sorted(results) == sorted((i, j, env.play_game(g, None, seed)) for i, j, g, _, seed in games)
+
+
+def test_calc_fitness():
+    env = ParallelEvolutionEnv(num_cores=2, **ENV_KWARGS)
+    try:
+        assert env.calc_fitness(env.population[0]) > 0
+    finally:
+        env.close()
+    assert EvolutionEnv(**ENV_KWARGS).calc_fitness([-2, -1, -1, -15, -2, -1, -1]) > 0
+
+
+@pytest.mark.parametrize('env_class', [ParallelEvolutionEnv, DistributedEvolutionEnv])
+def test_vectorized_games_are_rejected(env_class):
+    with pytest.raises(ValueError, match='vectorized'):
+        env_class(vectorized=True, **ENV_KWARGS)
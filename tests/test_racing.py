@@ -0,0 +1,62 @@
+import pytest
+
+from evolution.evolution import EvolutionEnv
+from tests.test_batch_evaluation import GENOME
+
+# Genomes which clear lines, and genomes which stack pieces in the middle and lose within a few pieces
+GOOD = [[w * (1 + 0.1 * k) if n % 2 == k % 2 else w for n, w in enumerate(GENOME)] for k in range(3)]
+BAD = [[5, 5, 5, 5, 5, 5, 5 - i] for i in range(3)]
+WORSE = [[4, 5, 5, 5, 5, 5, 5 - i] for i in range(4)]
+
+
+def racing_env(population, games_per_fitness=12, **kwargs):
+    env = EvolutionEnv(pop_size=len(population), games_per_fitness=games_per_fitness, board_height=10, board_width=6,
+                       seed=4, racing=True, with_logging=False, with_printing=False, **kwargs)
+    env.population = [list(g) for g in population]
+    env.start_generation(0)
+    return env
+
+
+def test_hopeless_genomes_stop_after_the_minimal_games():
+    # Genomes below rank 2 are expected to win less than one tournament
+    env = racing_env(GOOD + BAD, games_per_fitness=6, racing_min_selections=1)
+    scores = [[] for _ in range(env.pop_size)]
+    assert env.race(scores, list(range(env.pop_size))) == set()
+    assert [len(s) for s in scores] == [6] * len(GOOD) + [env.racing_min_games] * len(BAD)
+
+
+def test_elite_games_are_limited():
+    env = racing_env([GENOME] + BAD + WORSE, max_pieces=20)
+    scores = [[] for _ in range(env.pop_size)]
+    assert env.race(scores, list(range(env.pop_size))) == {0}
+    assert [len(s) for s in scores] == [12] * env.pop_size
+    # The first games were played before the genome was known to be elite
+    assert max(scores[0][:env.racing_min_games]) > 20 and scores[0][-1] == 20
+    assert all(score <= 20 for score in scores[0][scores[0].index(20):])
+
+
+def test_elite_genomes_stay_ahead():
+    env = racing_env([GENOME] + BAD + WORSE, max_pieces=20)
+    env.calc_pop_fitness()
+    assert env.fitnesses[0] == max(env.fitnesses)
+    env.fitnesses = [10, 50, 30, 40]
+    env.pop_size = 4
+    env.rank_elite({0, 3}, {2: 1})
+    assert env.fitnesses == [50, 50, 30, 50]
+
+
+def test_intervals_are_not_empty():
+    env = racing_env(GOOD)
+    assert env.half_width([7, 7, 7]) > 0
+    assert env.half_width([7, 7, 7]) > env.half_width([7] * 10)
+    assert env.half_width([100, 300, 200]) > env.racing_z * 100 / 3 ** 0.5
+
+
+@pytest.mark.parametrize('df, t', [(2, 4.303), (3, 3.182), (5, 2.571), (10, 2.228), (30, 2.042)])
+def test_t_score(df, t):
+    assert EvolutionEnv.t_score(1.959964, df) == pytest.approx(t, rel=0.01)
+
+
+def test_racing_needs_two_games():
+    with pytest.raises(ValueError, match='racing_min_games'):
+        EvolutionEnv(racing=True, racing_min_games=1, with_logging=False)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from evolution.evolution import EvolutionEnv
+from evolution.run_log import (GENERATION, GENERATION_RECORD, HEADER, MAGIC, RunLogWriter, convert_text_log,
+                               read_run_log, read_telemetry)
+
+ENV_KWARGS = dict(pop_size=4, generations=3, games_per_fitness=2, board_height=8, board_width=5, seed=1,
+                  with_printing=False)
+
+
+def run(path, **kwargs):
+    env = EvolutionEnv(log_path=str(path), **ENV_KWARGS, **kwargs)
+    fitnesses = []
+    env.generation_callback = lambda summary: fitnesses.append(list(env.fitnesses))
+    env.evolve()
+    return env, fitnesses
+
+
+def test_binary_log_round_trip(tmp_path):
+    path = tmp_path / 'run.bin'
+    env, fitnesses = run(path, log_format='binary', telemetry=True)
+    assert env.run_log is None
+    generations = list(read_run_log(str(path)))
+    assert [generation for generation, _, _ in generations] == [0, 1, 2]
+    for (_, genomes, scores), generation_fitnesses in zip(generations, fitnesses):
+        assert genomes.shape == (4, env.g_size)
+        assert scores.mean(axis=1).tolist() == generation_fitnesses
+    assert [telemetry['generation'] for telemetry in read_telemetry(str(path))] == [0, 1, 2]
+
+
+def test_cut_off_log_keeps_its_complete_records(tmp_path):
+    path = tmp_path / 'run.bin'
+    run(path, log_format='binary')
+    data = path.read_bytes()
+    path.write_bytes(data[:-3])
+    generations = list(read_run_log(str(path)))
+    assert len(generations) == 3
+    assert len(generations[-1][1]) == 3
+
+
+def test_text_log_conversion(tmp_path):
+    env, fitnesses = run(tmp_path / 'run.log')
+    convert_text_log(str(tmp_path / 'run.log'), str(tmp_path / 'run.bin'))
+    converted = [scores.mean(axis=1).tolist() for _, _, scores in read_run_log(str(tmp_path / 'run.bin'))]
+    assert converted == fitnesses
+
+
+def test_version_1_logs_are_read_but_not_appended_to(tmp_path):
+    path = tmp_path / 'old.bin'
+    path.write_bytes(HEADER.pack(MAGIC, 1, 2) + GENERATION_RECORD + GENERATION.pack(0))
+    (generation, genomes, scores), = read_run_log(str(path))
+    assert generation == 0 and genomes.shape == (0, 2) and np.size(scores) == 0
+    with pytest.raises(ValueError):
+        RunLogWriter(str(path), 2)
@@ -0,0 +1,92 @@
+import math
+import random
+
+import pytest
+
+from analysis.run_monitor import QuantileSketch, RunMonitor
+from evolution.evolution import EvolutionEnv
+
+ENV_KWARGS = dict(pop_size=4, generations=3, games_per_fitness=2, board_height=8, board_width=5, seed=1,
+                  with_printing=False)
+
+
+def run(path, **kwargs):
+    """
+    :return: The fitnesses of every generation of a run which logs to path
+    """
+    env = EvolutionEnv(log_path=str(path), **ENV_KWARGS, **kwargs)
+    fitnesses = []
+    env.generation_callback = lambda summary: fitnesses.append(list(env.fitnesses))
+    env.evolve()
+    return fitnesses
+
+
+def stats_of(monitor):
+    return [(stats.generation, stats.individuals, stats.num_games, stats.mean, stats.max_fitness, stats.max_game)
+            for stats in monitor.generations]
+
+
+@pytest.mark.parametrize('log_format', ['text', 'binary'])
+def test_log_is_followed_while_it_grows(tmp_path, log_format):
+    source = tmp_path / 'run.log'
+    fitnesses = run(source, log_format=log_format, telemetry=True)
+    data = source.read_bytes()
+    path = tmp_path / 'growing.log'
+    path.write_bytes(b'')
+    monitor = RunMonitor(str(path))
+    assert monitor.update() == []
+    # The file grows by uneven chunks, which split the header, the lines and the records
+    cuts = [0, 3] + list(range(11, len(data), 29)) + [len(data)]
+    for start, end in zip(cuts, cuts[1:]):
+        with open(path, 'ab') as f:
+            f.write(data[start:end])
+        monitor.update()
+    assert monitor.update() == []
+    whole = RunMonitor(str(source))
+    whole.update()
+    assert stats_of(monitor) == stats_of(whole)
+    assert [stats.generation for stats in monitor.generations] == [0, 1, 2]
+    for stats, generation_fitnesses in zip(monitor.generations, fitnesses):
+        assert stats.individuals == ENV_KWARGS['pop_size']
+        assert stats.num_games == ENV_KWARGS['pop_size'] * ENV_KWARGS['games_per_fitness']
+        assert stats.mean == pytest.approx(sum(generation_fitnesses) / len(generation_fitnesses))
+        assert stats.max_fitness == max(generation_fitnesses)
+    assert monitor.best_so_far == [max(max(f) for f in fitnesses[:i + 1]) for i in range(len(fitnesses))]
+
+
+@pytest.mark.parametrize('log_format', ['text', 'binary'])
+def test_half_written_record_waits_for_the_rest(tmp_path, log_format):
+    source = tmp_path / 'run.log'
+    run(source, log_format=log_format)
+    data = source.read_bytes()
+    path = tmp_path / 'growing.log'
+    path.write_bytes(data[:-3])
+    monitor = RunMonitor(str(path))
+    changed = monitor.update()
+    assert [stats.generation for stats in changed] == [0, 1, 2]
+    # The last game line, or the last genome record with all of its games, is not complete yet
+    missing = 1 if log_format == 'text' else ENV_KWARGS['games_per_fitness']
+    total = ENV_KWARGS['pop_size'] * ENV_KWARGS['games_per_fitness']
+    assert monitor.generations[-1].num_games == total - missing
+    with open(path, 'ab') as f:
+        f.write(data[-3:])
+    # Only the last generation changed
+    assert [stats.generation for stats in monitor.update()] == [2]
+    assert monitor.generations[-1].num_games == total
+
+
+@pytest.mark.parametrize('relative_accuracy', [0.01, 0.05])
+def test_quantiles_are_within_the_relative_accuracy(relative_accuracy):
+    rng = random.Random(7)
+    values = [0] * 50 + [rng.expovariate(1 / 300) for _ in range(5000)] + [rng.randint(1, 20) for _ in range(500)]
+    sketch = QuantileSketch(relative_accuracy)
+    for value in values:
+        sketch.add(value)
+    values.sort()
+    for q in [0, 0.001, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 0.999, 1]:
+        exact = values[math.floor(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= relative_accuracy * exact + 1e-9, q
+
+
+def test_empty_sketch():
+    assert QuantileSketch().quantile(0.5) is None
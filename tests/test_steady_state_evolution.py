@@ -0,0 +1,26 @@
+import pytest
+
+from evolution.steady_state_evolution import SteadyStateEvolutionEnv
+
+ENV_KWARGS = dict(pop_size=4, generations=2, games_per_fitness=1, board_height=8, board_width=5, seed=1,
+                  with_logging=False, with_printing=False, num_cores=2)
+
+
+@pytest.mark.parametrize('option', [{'checkpoint_path': 'run.ckpt'}, {'racing': True}, {'cache_size': 10},
+                                    {'vectorized': True}, {'surrogate': 'knn'}, {'telemetry': True},
+                                    {'generation_callback': print}])
+def test_unsupported_options_are_rejected(option):
+    with pytest.raises(ValueError, match=next(iter(option))):
+        SteadyStateEvolutionEnv(**ENV_KWARGS, **option)
+
+
+def test_steady_state_run():
+    env = SteadyStateEvolutionEnv(**ENV_KWARGS)
+    env.evolve()
+    assert len(env.population) == len(env.fitnesses) == 4
+
+
+def test_tournaments_larger_than_the_population_are_rejected():
+    with pytest.raises(ValueError, match='k_tournament'):
+        SteadyStateEvolutionEnv(**dict(ENV_KWARGS, k_tournament=5))
+    SteadyStateEvolutionEnv(**dict(ENV_KWARGS, k_tournament=4)).evolve()
@@ -0,0 +1,50 @@
+import random
+
+from evolution.evolution import EvolutionEnv
+from evolution.surrogate import SurrogateModel, prediction_error
+
+
+def test_screened_genomes_rank_last_and_are_not_trained_on():
+    env = EvolutionEnv(pop_size=10, generations=1, games_per_fitness=3, board_height=8, board_width=5, seed=2,
+                       surrogate='knn', surrogate_fraction=0.4, surrogate_min_samples=5, with_logging=False,
+                       with_printing=False)
+    rng = random.Random(0)
+    for _ in range(20):
+        env.surrogate.add([rng.randint(-100, 100) for _ in range(env.g_size)], rng.randint(0, 100))
+    env.surrogate_correlation = 1.0
+    env.start_generation(0)
+    scores = []
+    env.log_genome = lambda g, genome_scores: scores.append(genome_scores)
+    env.calc_pop_fitness()
+    screened = [i for i in range(env.pop_size) if len(scores[i]) < env.games_per_fitness]
+    evaluated = [i for i in range(env.pop_size) if i not in screened]
+    assert len(screened) == 4
+    assert max(env.fitnesses[i] for i in screened) <= min(env.fitnesses[i] for i in evaluated)
+    assert len(env.surrogate) == 20 + len(evaluated)
+
+
+def test_models_learn_the_ranking():
+    rng = random.Random(1)
+    target = [3, -2, 1, 0, 4, -1, 2]
+    genomes = [[rng.uniform(-1, 1) for _ in target] for _ in range(300)]
+
+    def fitness(g):
+        return 2 ** (5 + sum(w * v for w, v in zip(target, g)) / sum(v * v for v in g) ** 0.5)
+
+    for kind in ('knn', 'ridge'):
+        model = SurrogateModel(kind)
+        for g in genomes[:250]:
+            model.add(g, fitness(g))
+        test = genomes[250:]
+        error = prediction_error(model.predict(test), [fitness(g) for g in test])
+        assert error['rank_correlation'] > 0.8
+
+
+def test_rank_correlation_averages_ties():
+    # Permuting genomes with tied fitnesses must not change the correlation
+    predicted = [1, 2, 3, 4, 5, 6]
+    actual = [10, 10, 10, 20, 20, 30]
+    reordered = [3, 2, 1, 5, 4, 6]
+    assert prediction_error(predicted, actual) == prediction_error(reordered, actual)
+    assert prediction_error(predicted, actual)['rank_correlation'] < 1
+    assert prediction_error([1, 1, 2], [5, 5, 6])['rank_correlation'] == 1
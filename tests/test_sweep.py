@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+from analysis.sweep_analysis import final_results, generation_curves, param_effect
+from evolution.steady_state_evolution import SteadyStateEvolutionEnv
+from evolution.sweep import Sweep, SweepDatabase, grid_configs, random_configs
+
+RUN_KWARGS = dict(generations=2, pop_size=4, games_per_fitness=1, board_height=8, board_width=5, seed=1,
+                  with_printing=False)
+
+
+def summary(generation, max_fitness):
+    return {'generation': generation, 'mean_fitness': max_fitness / 2, 'max_fitness': max_fitness, 'min_fitness': 0,
+            'std_fitness': 1, 'best_genome': [1, 2], 'seconds': 0.5}
+
+
+def test_grid_configs():
+    configs = grid_configs({'pop_size': [4, 6], 'p_mutation': [0.1, 0.2, 0.3]})
+    assert len(configs) == 6
+    assert {'pop_size': 6, 'p_mutation': 0.2} in configs
+
+
+def test_random_configs():
+    space = {'pop_size': (4, 8), 'p_mutation': (0.1, 0.3), 'engine': ['list', 'bitboard']}
+    configs = random_configs(space, 20, seed=3)
+    assert configs == random_configs(space, 20, seed=3)
+    for config in configs:
+        assert isinstance(config['pop_size'], int) and 4 <= config['pop_size'] <= 8
+        assert 0.1 <= config['p_mutation'] <= 0.3
+        assert config['engine'] in ('list', 'bitboard')
+
+
+def test_queries(tmp_path):
+    db = SweepDatabase(str(tmp_path / 'sweep.db'))
+    for run_id, pop_size, fitnesses in (('a', 4, [10, 20]), ('b', 4, [30, 40]), ('c', 8, [50, 60])):
+        db.start_run(run_id, 'test', 'EvolutionEnv', f'{{"pop_size": {pop_size}}}')
+        for generation, fitness in enumerate(fitnesses):
+            db.add_generation(run_id, summary(generation, fitness))
+        db.finish_run(run_id)
+    results = final_results(db)
+    assert [row['run_id'] for row in results] == ['c', 'b', 'a']
+    assert results[0]['config'] == {'pop_size': 8} and results[0]['best_genome'] == [1, 2]
+    assert param_effect(db, 'pop_size') == {4: {'runs': 2, 'mean': 30.0, 'std': 10.0},
+                                             8: {'runs': 1, 'mean': 60.0, 'std': 0.0}}
+    assert generation_curves(db, 'pop_size') == {4: [(0, 20.0), (1, 30.0)], 8: [(0, 50.0), (1, 60.0)]}
+    db.close()
+
+
+def test_restart_removes_stale_generations(tmp_path):
+    db = SweepDatabase(str(tmp_path / 'sweep.db'))
+    db.start_run('a', 'test', 'EvolutionEnv', '{}')
+    for generation in range(3):
+        db.add_generation('a', summary(generation, 10))
+    db.finish_run('a', 'crashed')
+    db.start_run('a', 'test', 'EvolutionEnv', '{}', first_generation=1)
+    assert [row['generation'] for row in db.query('SELECT generation FROM generations')] == [0]
+    db.start_run('a', 'test', 'EvolutionEnv', '{}')
+    assert db.query('SELECT generation FROM generations') == []
+    db.close()
+
+
+def test_sweep_skips_finished_runs(tmp_path, monkeypatch):
+    # The default log directory does not exist yet, and has to be created by the sweep
+    monkeypatch.chdir(tmp_path)
+    db_path = str(tmp_path / 'sweep.db')
+    configs = grid_configs({'p_mutation': [0.1, 0.3]})
+    sweep = Sweep(db_path, configs, RUN_KWARGS, max_cores=2, checkpoint_dir='checkpoints')
+    assert sweep.run() == []
+    db = SweepDatabase(db_path)
+    runs = db.query('SELECT run_id, status, started FROM runs')
+    assert [run['status'] for run in runs] == ['finished', 'finished']
+    assert len(db.query('SELECT * FROM generations')) == 4
+    assert len(os.listdir('logs')) == 2 and len(os.listdir('checkpoints')) == 2
+    assert sweep.run() == []
+    assert db.query('SELECT run_id, status, started FROM runs') == runs
+    db.close()
+
+
+def test_configs_are_validated(tmp_path):
+    db_path = str(tmp_path / 'sweep.db')
+    with pytest.raises(ValueError, match='generation_callback'):
+        Sweep(db_path, [{'p_mutation': 0.1}, {'generation_callback': print}], RUN_KWARGS)
+    with pytest.raises(ValueError, match='generation_callback'):
+        Sweep(db_path, [{'p_mutation': 0.1}], dict(RUN_KWARGS, generation_callback=print))
+    with pytest.raises(ValueError, match='SteadyStateEvolutionEnv'):
+        Sweep(db_path, [{'p_mutation': 0.1}], RUN_KWARGS, env_class=SteadyStateEvolutionEnv)
+    assert not os.path.exists(db_path)
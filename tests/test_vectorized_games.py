@@ -0,0 +1,26 @@
+import pytest
+
+from evolution.evolution import EvolutionEnv
+
+ENV_KWARGS = dict(pop_size=6, generations=1, games_per_fitness=2, board_height=10, board_width=6, seed=7,
+                  with_logging=False, with_printing=False)
+
+
+@pytest.mark.parametrize('common_random_numbers', [False, True])
+def test_vectorized_games_match_the_serial_games(common_random_numbers):
+    fitnesses = []
+    for vectorized in (False, True):
+        env = EvolutionEnv(vectorized=vectorized, common_random_numbers=common_random_numbers, **ENV_KWARGS)
+        env.start_generation(0)
+        env.calc_pop_fitness()
+        fitnesses.append(env.fitnesses)
+    assert fitnesses[0] == fitnesses[1]
+
+
+def test_vectorized_games_respect_max_pieces():
+    env = EvolutionEnv(vectorized=True, **ENV_KWARGS)
+    games = [(i, 0, env.population[i], 5, env.game_seed(i, 0)) for i in range(env.pop_size)]
+    scores = {i: game_score for i, _, game_score in env.play_games(games)}
+    serial = EvolutionEnv(**ENV_KWARGS)
+    assert scores == {i: serial.play_game(env.population[i], 5, env.game_seed(i, 0)) for i in range(env.pop_size)}
+    assert max(scores.values()) <= 5
@@ -0,0 +1,202 @@
+from tetris_env.piece_factory import Piece
+
+
+class BitBoard:
+    """
+    A game board in which every row is stored as an integer bitmask. Bit c of a row is set if column c (from the left)
+    is filled. Like the list board from tetris.py, it has 4 extra hidden rows at the top, so the lowest line is at row
+    H+3. Pieces' colors are not stored, only whether a square is filled.
+    """
+    __slots__ = ('rows', 'width', 'full_row')
+
+    def __init__(self, rows, width):
+        """
+        :param rows: A list of row bitmasks, from top to bottom
+        :param width: Width of the board
+        """
+        self.rows = rows
+        self.width = width
+        self.full_row = (1 << width) - 1
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def piece_masks(piece):
+    """
+    :param piece: The piece itself (not its PID). Any other matrix is compiled into a Piece first, same as
+    tetris.apply_piece() does
+    :return: A tuple of row bitmasks of the piece, from bottom to top
+    """
+    if not isinstance(piece, Piece):
+        piece = Piece(piece)
+    return piece.masks
+
+
+def create_board(height, width):
+    """
+    Creates an empty bitboard. Its height is larger by 4, same as tetris.create_board()
+    :param height: Height of the board
+    :param width: Width of the board
+    :return: The game board
+    """
+    return BitBoard([0] * (height + 4), width)
+
+
+def board_from_rows(rows):
+    """
+    Creates a game board with the given content, same as tetris.board_from_rows()
+    :param rows: The visible rows of the board, from top to bottom, as lists of values (0 for an empty square)
+    :return: The game board
+    """
+    return BitBoard([0] * 4 + [sum(1 << col for col, val in enumerate(row) if val > 0) for row in rows], len(rows[0]))
+
+
+def copy_board(board):
+    """
+    Copies a board
+    :param board: A game board
+    :return: A copy of the game board
+    """
+    return BitBoard(board.rows[:], board.width)
+
+
+def board_key(board):
+    """
+    A key which identifies the board's content, for finding boards that were already evaluated
+    :param board: The game board
+    :return: A hashable key
+    """
+    return tuple(board.rows)
+
+
+def print_board(board, with_hidden_lines=False):
+    """
+    Prints the game board
+    :param board: The game board
+    :param with_hidden_lines: Print hidden lines? If there is anything in the hidden lines, it is game over
+    """
+    for i in range(0 if with_hidden_lines else 4, len(board.rows)):
+        print([(board.rows[i] >> col) & 1 for col in range(board.width)])
+
+
+def pretty_print_board(board, with_color=True, with_hidden_lines=False):
+    """
+    Pretty prints the board. Since bitboards do not store the pieces' colors, all squares are printed in one color
+    :param board: The game board
+    :param with_color: Should the squares be colored
+    :param with_hidden_lines: Should the hidden lines be printed
+    """
+    filled = '\33[97m\u25A0\33[0m ' if with_color else '\u25A0 '
+    for i in range(0 if with_hidden_lines else 4, len(board.rows)):
+        for col in range(board.width):
+            print(filled if (board.rows[i] >> col) & 1 else '\u25A1 ', end='')
+        print()
+
+
+def drop_piece(piece, col_offset, board):
+    """
+    Drops the piece from the column offset.
+    :param piece: The piece itself (not its PID)
+    :param col_offset: The column offset (from the left)
+    :param board: The game board
+    :return: True if game over, False otherwise
+    """
+    return apply_piece(piece, col_offset, board) is None
+
+
+def apply_piece(piece, col_offset, board):
+    """
+    Drops the piece from the column offset, and returns what is needed to take the drop back with undo_piece()
+    :param piece: The piece itself (not its PID)
+    :param col_offset: The column offset (from the left)
+    :param board: The game board
+    :return: An undo record, or None if game over (in which case the board is not changed)
+    """
+    masks = piece_masks(piece)
+    height = len(board.rows)
+    # Same as in tetris.drop_piece, the piece starts with its lowest row at row 4 and goes down until it collides
+    row_offset = height - 1
+    for curr_row in range(4, height):
+        if collision_detection(masks, curr_row, col_offset, board):
+            if curr_row - len(masks) <= 3:  # Is a part of the piece will be frozen into the hidden lines?
+                return None
+            row_offset = curr_row - 1
+            break
+    freeze_piece(masks, row_offset, col_offset, board)
+    cleared_lines = update_lines(list(range(row_offset + 1 - len(masks), row_offset + 1)), board)
+    return masks, row_offset, col_offset, cleared_lines
+
+
+def undo_piece(undo, board):
+    """
+    Takes back a drop made by apply_piece(). Drops have to be taken back in the reverse order they were made
+    :param undo: The undo record returned by apply_piece()
+    :param board: The game board
+    """
+    masks, row_offset, col_offset, cleared_lines = undo
+    rows = board.rows
+    if cleared_lines:
+        del rows[:len(cleared_lines)]
+        for line in reversed(cleared_lines):
+            rows.insert(line, board.full_row)
+    for i in range(len(masks)):
+        rows[row_offset - i] &= ~(masks[i] << col_offset)
+
+
+def collision_detection(masks, row_offset, col_offset, board):
+    """
+    Detects collision if the piece were at the specified offset. The lowest row of the piece is placed at row_offset.
+    :param masks: The piece's row bitmasks, from bottom to top (see piece_masks())
+    :param row_offset: The row number (offset from the top)
+    :param col_offset: The column number (offset from the left)
+    :param board: The game board
+    :return: True if there is a collision, False otherwise
+    """
+    rows = board.rows
+    for i in range(len(masks)):
+        if rows[row_offset - i] & (masks[i] << col_offset):
+            return True
+    return False
+
+
+def freeze_piece(masks, row_offset, col_offset, board):
+    """
+    Freezes the piece in place
+    :param masks: The piece's row bitmasks, from bottom to top (see piece_masks())
+    :param row_offset: The row number (offset from the top)
+    :param col_offset: The column number (offset from the left)
+    :param board: The game board
+    """
+    rows = board.rows
+    for i in range(len(masks)):
+        rows[row_offset - i] |= masks[i] << col_offset
+
+
+def update_lines(lines, board):
+    """
+    Checks lines that might be filled as a result from the last piece drop
+    :param lines: Lines to be checked (They need to be in an ascending order)
+    :param board: The game board
+    :return: The numbers of the cleared lines, from the lowest one
+    """
+    rows = board.rows
+    cleared_lines = []
+    # Deleting from the last line keeps the indexes of the lines which were not checked yet, same as in tetris.py
+    for line in reversed(lines):
+        if check_line_full(line, board):
+            cleared_lines.append(line)
+            del rows[line]
+    if cleared_lines:
+        rows[0:0] = [0] * len(cleared_lines)
+    return cleared_lines
+
+
+def check_line_full(line, board):
+    """
+    Checks if line is full
+    :param line: Line number
+    :param board: The game board
+    :return: True if the line is full, False otherwise
+    """
+    return board.rows[line] == board.full_row
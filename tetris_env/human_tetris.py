@@ -1,5 +1,4 @@
-from bot.feature_extraction import extract_features
-from tetris_env import tetris
+from bot.tetris_bot import ENGINES
 from tetris_env.piece_factory import PieceFactory
 
 
@@ -7,20 +6,22 @@ class HumanTetris:
     """
     Let a human player plays the Tetris environment
     """
-    def __init__(self, height, width):
+    def __init__(self, height, width, engine='list'):
         """
         :param height: Height of the board
         :param width: Width of the board
+        :param engine: The game engine to use, one of bot.tetris_bot.ENGINES' keys
         """
         self.width = width
-        self.board = tetris.create_board(height, width)
+        self.engine, self.extract_features = ENGINES[engine]
+        self.board = self.engine.create_board(height, width)
         self.pf = PieceFactory(width)
 
     def play(self, print_features=True):
         """
         Game loop
         """
-        tetris.pretty_print_board(self.board)
+        self.engine.pretty_print_board(self.board)
         while True:
             # Insert data as "piece_number num_of_rotations offset from the left"
             pid, rid, col_offset = map(int, input().split())
@@ -29,9 +30,9 @@ class HumanTetris:
             # If you go over the maximum offset, it will set you to the maximum
             if col_offset + len(piece[-1]) > self.width:
                 col_offset = self.width - len(piece[-1])
-            if tetris.drop_piece(piece, col_offset, self.board):
+            if self.engine.drop_piece(piece, col_offset, self.board):
                 print('GAME OVER')
                 break
-            tetris.pretty_print_board(self.board)
+            self.engine.pretty_print_board(self.board)
             if print_features:
-                print(extract_features(self.board))
+                print(self.extract_features(self.board))
@@ -1,3 +1,83 @@
+import functools
+
+# The rotations of every piece, as matrices of rows from top to bottom. A square holds the piece's color (its ID + 1)
+PIECES = [
+    [[[1], [1], [1], [1]], [[1, 1, 1, 1]]],  # I
+    [[[2, 2], [2, 2]]],  # O
+    [[[3, 3, 3], [0, 3, 0]], [[0, 3], [3, 3], [0, 3]], [[0, 3, 0], [3, 3, 3]], [[3, 0], [3, 3], [3, 0]]],  # T
+    [[[0, 4, 4], [4, 4, 0]], [[4, 0], [4, 4], [0, 4]]],  # S
+    [[[5, 5, 0], [0, 5, 5]], [[0, 5], [5, 5], [5, 0]]],  # Z
+    [[[0, 6], [0, 6], [6, 6]], [[6, 0, 0], [6, 6, 6]], [[6, 6], [6, 0], [6, 0]], [[6, 6, 6], [0, 0, 6]]],  # J
+    [[[7, 0], [7, 0], [7, 7]], [[7, 7, 7], [7, 0, 0]], [[7, 7], [0, 7], [0, 7]], [[0, 0, 7], [7, 7, 7]]]  # L
+]
+
+
+class Piece(tuple):
+    """
+    A piece in a specific rotation. It is the same matrix of rows as before, but immutable, and it carries everything
+    the engines need to drop it, calculated once when it is created: its contours, its size, its filled squares and its
+    rows as bitmasks. The engines use these instead of walking the matrix for every drop.
+    """
+    def __new__(cls, rows):
+        """
+        :param rows: The rows of the piece, from top to bottom
+        """
+        piece = super().__new__(cls, (tuple(row) for row in rows))
+        height = len(piece)
+        width = len(piece[-1])
+        piece.height = height
+        piece.width = width
+        # Number of empty blocks below the lowest block of each column
+        piece.bottom_contour = tuple(next(row for row in range(height) if piece[-row - 1][col] > 0)
+                                     for col in range(width))
+        # Height of the highest block of each column, counted from the bottom of the piece
+        piece.top_contour = tuple(height - next(row for row in range(height) if piece[row][col] > 0)
+                                  for col in range(width))
+        # The filled squares as (row, column), where the row is counted from the bottom of the piece
+        piece.cells = tuple((height - 1 - row, col) for row in range(height) for col in range(width)
+                            if piece[row][col] > 0)
+        row, col = piece.cells[0]
+        piece.color = piece[height - 1 - row][col]
+        # Bitmasks of the rows, from bottom to top. Bit c is set if column c (from the left) is filled
+        piece.masks = tuple(sum(1 << col for col, val in enumerate(row) if val > 0) for row in reversed(piece))
+        return piece
+
+
+class PieceTable:
+    """
+    The pieces compiled for a board's width: every unique rotation of every piece, its offset limit, and all the
+    (rotation, column offset) moves of each piece in the order they are searched. It is built once per width and
+    process (see compile_pieces()), and shared read-only by everything that drops pieces into boards of that width
+    """
+    def __init__(self, width):
+        """
+        :param width: Width of the board
+        """
+        self.width = width
+        pieces = []
+        for rotations in PIECES:
+            unique = []
+            for rotation in map(Piece, rotations):
+                # Rotations which fill the same squares are symmetries of the piece, and lead to the same boards
+                if all(rotation.cells != other.cells for other in unique):
+                    unique.append(rotation)
+            pieces.append(tuple(unique))
+        self.pieces = tuple(pieces)
+        # The (piece, offset limit) of every rotation. The last legal offset (from the left) is the limit itself
+        self.placements = tuple(tuple((piece, width - piece.width) for piece in rotations) for rotations in self.pieces)
+        self.moves = tuple(tuple((rid, col_offset) for rid, (_, offset_limit) in enumerate(placements)
+                                 for col_offset in range(offset_limit + 1)) for placements in self.placements)
+
+
+@functools.lru_cache(maxsize=None)
+def compile_pieces(width):
+    """
+    :param width: Width of the board
+    :return: The PieceTable of the width. It is only built on the first call with the width
+    """
+    return PieceTable(width)
+
+
 class PieceFactory:
     def __init__(self, width):
         """
@@ -6,26 +86,11 @@ class PieceFactory:
         """
         self.width = width
         self.num_pieces = 7
-        self.pieces = [
-            [[[1], [1], [1], [1]], [[1, 1, 1, 1]]],  # I
-            [[[2, 2], [2, 2]]],  # O
-            [[[3, 3, 3], [0, 3, 0]], [[0, 3], [3, 3], [0, 3]], [[0, 3, 0], [3, 3, 3]], [[3, 0], [3, 3], [3, 0]]],  # T
-            [[[0, 4, 4], [4, 4, 0]], [[4, 0], [4, 4], [0, 4]]],  # S
-            [[[5, 5, 0], [0, 5, 5]], [[0, 5], [5, 5], [5, 0]]],  # Z
-            [[[0, 6], [0, 6], [6, 6]], [[6, 0, 0], [6, 6, 6]], [[6, 6], [6, 0], [6, 0]], [[6, 6, 6], [0, 0, 6]]],  # J
-            [[[7, 0], [7, 0], [7, 7]], [[7, 7, 7], [7, 0, 0]], [[7, 7], [0, 7], [0, 7]], [[0, 0, 7], [7, 7, 7]]]  # L
-        ]
+        self.table = compile_pieces(width)
+        self.pieces = self.table.pieces
 
         # Height is defined as the maximum height of any column. Width is the maximum width of any row
-        self.pieces_sizes = [
-            [(4, 1), (1, 4)],  # I
-            [(2, 2)],  # O
-            [(2, 3), (3, 2), (2, 3), (3, 2)],  # T
-            [(2, 3), (3, 2)],  # S
-            [(2, 3), (3, 2)],  # Z
-            [(3, 2), (2, 3), (3, 2), (2, 3)],  # J
-            [(3, 2), (2, 3), (3, 2), (2, 3)]  # L
-        ]
+        self.pieces_sizes = [[(piece.height, piece.width) for piece in rotations] for rotations in self.pieces]
 
         self.name_pid = {'i': 0, 'o': 1, 't': 2, 's': 3, 'z': 4, 'j': 5, 'l': 6}
 
@@ -44,11 +109,17 @@ class PieceFactory:
         """
         Calculates all possible places to drop the from.
         :param pid: Piece ID
-        :return: A list of tuples. Each tuple holds the piece with its rotation, and the limit for its offset (from the
+        :return: A tuple of tuples. Each tuple holds the piece with its rotation, and the limit for its offset (from the
         left side). The last legal position is in limit.
         """
-        return [(self.pieces[pid][rid], self.width - self.pieces_sizes[pid][rid][1]) for rid in
-                range(len(self.pieces[pid]))]
+        return self.table.placements[pid]
+
+    def get_moves(self, pid):
+        """
+        :param pid: Piece ID
+        :return: All the moves of the piece as (rotation, column offset), in the order they are searched
+        """
+        return self.table.moves[pid]
 
     def calculate_piece_size(self, piece):
         """
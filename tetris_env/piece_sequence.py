@@ -0,0 +1,35 @@
+import hashlib
+import random
+
+
+class PieceSequence:
+    """
+    Generates the pieces of a game. Each sequence has its own random generator, so the same seed always generates the
+    same pieces, regardless of the process it runs in or of anything else that uses the random module
+    """
+    def __init__(self, seed=None):
+        """
+        :param seed: The seed of the sequence. If it is None, the sequence is seeded randomly
+        """
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+    def next_piece(self):
+        """
+        :return: The ID of the next piece, in range [0,6]
+        """
+        return self.rng.randint(0, 6)
+
+
+def game_seed(run_seed, generation, game, genome=None):
+    """
+    Derives the seed of a game's piece sequence. If the genome is not given, all the genomes of the generation get the
+    same seed for the same game index (common random numbers)
+    :param run_seed: The seed of the entire run
+    :param generation: The generation number (None for games which are the same in every generation)
+    :param game: The game index
+    :param genome: The genome's index in the population, or its values
+    :return: A 64-bit seed
+    """
+    key = (run_seed, generation, game) if genome is None else (run_seed, generation, game, genome)
+    return int.from_bytes(hashlib.sha256(repr(key).encode()).digest()[:8], 'little')
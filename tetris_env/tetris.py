@@ -1,3 +1,31 @@
+from tetris_env.piece_factory import Piece
+
+
+class Board(list):
+    """
+    The game board. It is a list of rows like before, which also maintains the height of every column (its skyline),
+    so dropping a piece can find where it lands without scanning the rows from the top.
+    A feature tracker (see bot.feature_extraction.FeatureTracker) can be attached to the board, in which case it is
+    copied with the board and updated after every drop.
+    The empty rows that undo_piece() takes off the top of the board are kept as spare rows, and the next line clear puts
+    them back at the top instead of allocating new ones, so a search which applies and undoes drops does not allocate
+    rows at all.
+    """
+    __slots__ = ('heights', 'tracker', 'spare_rows')
+
+    def __init__(self, rows, heights, tracker=None):
+        """
+        :param rows: The rows of the board, from top to bottom
+        :param heights: The height of each column, counted from the lowest line (0 for an empty column)
+        :param tracker: A feature tracker attached to the board
+        """
+        super().__init__(rows)
+        self.heights = heights
+        self.tracker = tracker
+        # The list of spare rows is only created by the first undo that has rows to spare
+        self.spare_rows = None
+
+
 def create_board(height, width):
     """
     Creates the game board filled with zeros. Its height is larger by 4 to be able to draw the pieces above the board
@@ -16,7 +44,20 @@ def create_board(height, width):
     board = []
     for _ in range(height + 4):
         board.append([0] * width)
-    return board
+    return Board(board, [0] * width)
+
+
+def board_from_rows(rows):
+    """
+    Creates a game board with the given content, such as a board received from outside the game
+    :param rows: The visible rows of the board, from top to bottom, as lists of values (0 for an empty square). The 4
+    hidden rows are added above them
+    :return: The game board
+    """
+    width = len(rows[0])
+    board = [[0] * width for _ in range(4)] + [list(row) for row in rows]
+    heights = [next((len(board) - row for row in range(len(board)) if board[row][col] > 0), 0) for col in range(width)]
+    return Board(board, heights)
 
 
 def copy_board(board):
@@ -25,7 +66,17 @@ def copy_board(board):
     :param board: A game board
     :return: A deep copy of the game board
     """
-    return [line[:] for line in board]
+    tracker = board.tracker.copy() if board.tracker is not None else None
+    return Board([line[:] for line in board], board.heights[:], tracker)
+
+
+def board_key(board):
+    """
+    A key which identifies the board's content, for finding boards that were already evaluated
+    :param board: The game board
+    :return: A hashable key
+    """
+    return b''.join(map(bytes, board))
 
 
 def print_board(board, with_hidden_lines=False):
@@ -63,24 +114,71 @@ def drop_piece(piece, col_offset, board):
     :param board: The game board
     :return: True if game over, False otherwise
     """
-    height = len(board)
-    # We start at 4 because the first 4 lines are the hidden lines which are there for preventing from collision
-    # detection to crash when checking the first line
-    for curr_row in range(4, height):
-        if collision_detection(piece, curr_row, col_offset, board):
-            if curr_row - len(piece) <= 3:  # Is a part of the piece will be frozen into the hidden lines?
-                return True
-            freeze_piece(piece, curr_row - 1, col_offset, board)
-            update_lines(list(range(curr_row - 1 - len(piece), curr_row)), board)
-            return False
-    freeze_piece(piece, height - 1, col_offset, board)
-    update_lines(list(range(height - 1 - len(piece), height)), board)
-    return False
+    return apply_piece(piece, col_offset, board) is None
+
+
+def apply_piece(piece, col_offset, board):
+    """
+    Drops the piece from the column offset, and returns what is needed to take the drop back with undo_piece().
+    The piece lands where its bottom contour first touches the skyline of the board, so its lowest row is placed at the
+    highest level reached by any of its columns.
+    :param piece: The piece itself (not its PID)
+    :param col_offset: The column offset (from the left)
+    :param board: The game board
+    :return: An undo record, or None if game over (in which case the board is not changed)
+    """
+    if not isinstance(piece, Piece):
+        piece = Piece(piece)
+    heights = board.heights
+    bottom_contour = piece.bottom_contour
+    # The level (counted from the lowest line) of the lowest row of the piece
+    level = 0
+    for col in range(len(bottom_contour)):
+        col_level = heights[col_offset + col] - bottom_contour[col]
+        if col_level > level:
+            level = col_level
+    row_offset = len(board) - 1 - level
+    if row_offset - len(piece) < 3:  # Is a part of the piece will be frozen into the hidden lines?
+        return None
+    old_heights = tuple(heights)
+    tracker_state = board.tracker.save() if board.tracker is not None else None
+    freeze_piece(piece, row_offset, col_offset, board)
+    top_contour = piece.top_contour
+    for col in range(len(top_contour)):
+        heights[col_offset + col] = level + top_contour[col]
+    cleared_lines = update_lines(list(range(row_offset + 1 - len(piece), row_offset + 1)), board)
+    if board.tracker is not None:
+        board.tracker.piece_dropped(board, col_offset, len(top_contour), cleared_lines)
+    return piece, row_offset, col_offset, cleared_lines, old_heights, tracker_state
+
+
+def undo_piece(undo, board):
+    """
+    Takes back a drop made by apply_piece(). Drops have to be taken back in the reverse order they were made
+    :param undo: The undo record returned by apply_piece()
+    :param board: The game board
+    """
+    piece, row_offset, col_offset, cleared_lines, old_heights, tracker_state = undo
+    if cleared_lines:
+        # The cleared lines were deleted from the lowest one, so they are put back from the highest one, in place of
+        # the empty lines that were inserted at the top. Those are kept for the next line clear
+        if board.spare_rows is None:
+            board.spare_rows = []
+        board.spare_rows.extend(board[:len(cleared_lines)])
+        del board[:len(cleared_lines)]
+        for line, values in reversed(cleared_lines):
+            board.insert(line, values)
+    for row, col in piece.cells:
+        board[row_offset - row][col_offset + col] = 0
+    board.heights[:] = old_heights
+    if tracker_state is not None:
+        board.tracker.restore(tracker_state)
 
 
 def collision_detection(piece, row_offset, col_offset, board):
     """
-    Detects collision if the piece were at the specified offset. The piece matrix is considered to start from
+    Detects collision if the piece were at the specified offset (drop_piece() finds the landing row from the columns'
+    heights instead). The piece matrix is considered to start from
     (row_offset, col_offset) on the board and to the right and upwards. Since we hard drop, we only need to check the
     first non-zero value of each column, as the ones above it cannot collide before it collides, making the check for
     them irrelevant
@@ -102,33 +200,47 @@ def collision_detection(piece, row_offset, col_offset, board):
 def freeze_piece(piece, row_offset, col_offset, board):
     """
     Freezes the piece in place
-    :param piece: The piece itself (not its PID)
+    :param piece: The piece itself (a Piece, not its PID)
     :param row_offset: The row number (offset from the top)
     :param col_offset: The column number (offset from the left)
     :param board: The game board
     """
-    for row in range(1, len(piece) + 1):
-        for col in range(len(piece[-1])):
-            if piece[-row][col] > 0:
-                board[row_offset - row + 1][col_offset + col] = piece[-row][col]
+    color = piece.color
+    for row, col in piece.cells:
+        board[row_offset - row][col_offset + col] = color
 
 
 def update_lines(lines, board):
     """
-    Checks lines that might be filled as a result from the last piece drop
+    Checks lines that might be filled as a result from the last piece drop, and keeps the columns' heights up to date
     :param lines: Lines to be checked (They need to be in an ascending order)
     :param board: The game board
+    :return: The cleared lines as (line number, line) tuples, from the lowest one
     """
-    counter = 0  # Number of full lines
+    cleared_lines = []
     # We reverse the order to delete the last lines first. If we were to delete the first first, the deletion would
     # shift the lines downwards and change their index. By doing this, only greater lines from the current line are
     # shifted, which does not affect the lower ones
     for line in reversed(lines):
         if check_line_full(line, board):
-            counter += 1
+            cleared_lines.append((line, board[line]))
             del board[line]
-    for _ in range(counter):
-        board.insert(0, [0] * len(board[0]))  # Insert at the beginning
+    counter = len(cleared_lines)  # Number of full lines
+    if counter:
+        # The empty lines inserted at the beginning are spare rows of the board when there are any
+        spare_rows = board.spare_rows
+        for _ in range(counter):
+            board.insert(0, spare_rows.pop() if spare_rows else [0] * len(board[0]))
+        # A full line has a block in every column, so each column lost exactly this many blocks below its highest
+        # block, unless the highest block was in a cleared line. In that case we go down to the next block
+        board_height = len(board)
+        heights = board.heights
+        for col in range(len(heights)):
+            height = heights[col] - counter
+            while height > 0 and board[board_height - height][col] == 0:
+                height -= 1
+            heights[col] = height
+    return cleared_lines
 
 
 def check_line_full(line, board):